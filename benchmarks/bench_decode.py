@@ -0,0 +1,87 @@
+"""
+Benchmark decoding large ``aggregate3Value`` results, as returned by
+``multicall_erc7412`` for a sweep over many accounts or markets.
+
+The benchmark encodes a result array with one entry per call, then decodes
+the outer ``aggregate3Value`` result and each inner result two ways:
+
+- ``lookup``: look up the function ABI and output types for every result,
+  which matches the behavior before result decoders were reused
+- ``registry``: use ``decode_result``, which builds one decoder per contract
+  ABI and function and reuses it
+
+Usage::
+
+    python benchmarks/bench_decode.py --calls 2000 --runs 5
+"""
+
+import time
+import logging
+import argparse
+from types import SimpleNamespace
+from web3 import Web3
+from web3._utils.abi import get_abi_output_types
+from eth_abi import decode, encode
+from synthetix.contracts import load_contracts
+from synthetix.utils.multicall import decode_result
+
+# functions to decode, with a sample result
+FUNCTIONS = {
+    "canLiquidate": (["bool"], [True]),
+    "getOpenPosition": (["int256", "int256", "int256", "int256"], [1, -2, 3, 4]),
+}
+
+
+def decode_with_lookup(contract, function_name, result):
+    "Decode a result the way ``decode_result`` did before decoders were reused"
+    func_abi = contract.get_function_by_name(function_name).abi
+    output_types = get_abi_output_types(func_abi)
+    return decode(output_types, result)
+
+
+def run(decode_fn, multicall, contract, function_name, data):
+    start = time.perf_counter()
+    (results,) = decode_fn(multicall, "aggregate3Value", data)
+    for _, result in results:
+        decode_fn(contract, function_name, result)
+    return time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark multicall decoding")
+    parser.add_argument("--network-id", type=int, default=8453)
+    parser.add_argument("--calls", type=int, default=2000)
+    parser.add_argument("--runs", type=int, default=5)
+    args = parser.parse_args()
+
+    snx = SimpleNamespace(
+        web3=Web3(),
+        network_id=args.network_id,
+        cannon_config=None,
+        cache_dir=None,
+        logger=logging.getLogger("bench"),
+    )
+    contracts = load_contracts(snx)
+    multicall = contracts["system"]["trusted_multicall_forwarder"][
+        "TrustedMulticallForwarder"
+    ]["contract"]
+    market_proxy = contracts["perpsFactory"]["PerpsMarketProxy"]["contract"]
+
+    print(f"network {args.network_id}, {args.calls} results per multicall")
+    for function_name, (types, values) in FUNCTIONS.items():
+        result = encode(types, values)
+        data = encode(["(bool,bytes)[]"], [[(True, result)] * args.calls])
+
+        for name, decode_fn in [
+            ("lookup", decode_with_lookup),
+            ("registry", decode_result),
+        ]:
+            seconds = sorted(
+                run(decode_fn, multicall, market_proxy, function_name, data)
+                for _ in range(args.runs)
+            )[args.runs // 2]
+            print(f"{function_name:16} {name:9} {seconds * 1000:8.1f} ms")
+
+
+if __name__ == "__main__":
+    main()
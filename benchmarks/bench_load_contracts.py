@@ -0,0 +1,115 @@
+"""
+Benchmark cold ``load_contracts`` time and memory for each loading strategy.
+
+Each strategy runs in a fresh interpreter so the measurement includes a cold
+start. The strategies are:
+
+- ``eager``: load every JSON file and build every web3 contract, which matches
+  the behavior before contracts were loaded lazily
+- ``json``: walk the JSON tree and only build the contracts that are used
+- ``index``: load the prebuilt deployment index and only build the contracts
+  that are used
+
+Usage::
+
+    python benchmarks/bench_load_contracts.py --network-id 8453 --runs 5
+"""
+
+import os
+import sys
+import json
+import argparse
+import tempfile
+import subprocess
+
+# contracts a typical perps bot touches
+USED_CONTRACTS = [
+    ("perpsFactory", "PerpsMarketProxy"),
+    ("perpsFactory", "PerpsAccountProxy"),
+    ("system", "trusted_multicall_forwarder", "TrustedMulticallForwarder"),
+]
+
+RUNNER = """
+import sys, json, time, logging, resource
+from types import SimpleNamespace
+from web3 import Web3
+from synthetix.contracts import load_contracts
+from synthetix.contracts.contracts import ContractDefinition
+
+mode, network_id, cache_dir, used = sys.argv[1], int(sys.argv[2]), sys.argv[3], json.loads(sys.argv[4])
+snx = SimpleNamespace(
+    web3=Web3(),
+    network_id=network_id,
+    cannon_config=None,
+    cache_dir=cache_dir if mode == "index" else None,
+    logger=logging.getLogger("bench"),
+)
+
+def walk(tree):
+    for value in tree.values():
+        if isinstance(value, ContractDefinition):
+            yield value
+        else:
+            yield from walk(value)
+
+rss_before = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+start = time.perf_counter()
+contracts = load_contracts(snx)
+if mode == "eager":
+    for definition in walk(contracts):
+        definition["contract"]
+else:
+    for path in used:
+        level = contracts
+        for key in path:
+            level = level.get(key, {})
+        if level:
+            level["contract"]
+elapsed = time.perf_counter() - start
+rss_after = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+print(json.dumps({"seconds": elapsed, "rss_kb": rss_after, "rss_delta_kb": rss_after - rss_before}))
+"""
+
+
+def run(mode, network_id, cache_dir):
+    output = subprocess.run(
+        [
+            sys.executable,
+            "-c",
+            RUNNER,
+            mode,
+            str(network_id),
+            cache_dir,
+            json.dumps(USED_CONTRACTS),
+        ],
+        check=True,
+        capture_output=True,
+        text=True,
+    )
+    return json.loads(output.stdout.strip().splitlines()[-1])
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark load_contracts")
+    parser.add_argument("--network-id", type=int, default=8453)
+    parser.add_argument("--runs", type=int, default=5)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as cache_dir:
+        # build the index once, so the index runs measure a warm index
+        run("index", args.network_id, cache_dir)
+
+        print(f"network {args.network_id}, {args.runs} cold runs per strategy")
+        print(
+            f"{'strategy':<10}{'median ms':>12}{'max rss MB':>14}{'rss delta MB':>16}"
+        )
+        for mode in ["eager", "json", "index"]:
+            results = [run(mode, args.network_id, cache_dir) for _ in range(args.runs)]
+            seconds = sorted(r["seconds"] for r in results)[len(results) // 2]
+            rss = max(r["rss_kb"] for r in results) / 1024
+            rss_delta = max(r["rss_delta_kb"] for r in results) / 1024
+            print(f"{mode:<10}{seconds * 1000:>12.1f}{rss:>14.1f}{rss_delta:>16.1f}")
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,348 @@
+"""
+Benchmark the round trips and wall-clock time of constructing ``Synthetix``.
+
+The benchmark runs a local proxy in front of the RPC and the Pyth price
+service. In ``record`` mode the proxy forwards every request upstream and
+saves the responses to a fixture. In ``replay`` mode the proxy answers from
+the fixture with a fixed latency per round trip, so runs are repeatable and
+can be compared between versions of the library. In ``stub`` mode the proxy
+needs no fixture or upstream. It answers JSON-RPC requests as an empty
+account, and each ``eth_call`` with the zero values of the function outputs
+in the deployment ABIs, so it counts the round trips of a cold start without
+network access.
+
+Each HTTP request to the proxy is one round trip. A JSON-RPC batch counts as
+one round trip, however many requests it contains.
+
+Usage::
+
+    python benchmarks/bench_startup.py record --rpc https://... \\
+        --network-id 8453 --fixture startup_8453.json
+    python benchmarks/bench_startup.py replay --fixture startup_8453.json \\
+        --latency-ms 50 --runs 5
+    python benchmarks/bench_startup.py stub --src ../other-checkout/src
+
+To compare against another version, record once, then replay the same fixture
+with each version, installed or passed with ``--src``. Requests missing from the fixture are answered
+with an error and reported, which happens if a version makes reads the
+recorded version did not.
+"""
+
+import os
+import sys
+import glob
+import json
+import time
+import argparse
+import threading
+import subprocess
+import importlib.util
+import requests
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from eth_abi import decode, encode
+from eth_abi.grammar import TupleType, parse
+from eth_utils import (
+    decode_hex,
+    encode_hex,
+    function_abi_to_4byte_selector,
+    function_signature_to_4byte_selector,
+)
+from web3._utils.abi import get_abi_output_types
+
+DEFAULT_PRICE_SERVICE = "https://hermes.pyth.network"
+
+# results of the stub RPC, an empty account at block 16
+STUB_RESULTS = {
+    "eth_accounts": [],
+    "eth_blockNumber": "0x10",
+    "eth_gasPrice": "0x1",
+    "eth_getTransactionCount": "0x0",
+    "eth_getBalance": "0x0",
+}
+SELECTOR_AGGREGATE3_VALUE = encode_hex(
+    function_signature_to_4byte_selector(
+        "aggregate3Value((address,bool,uint256,bytes)[])"
+    )
+)
+
+RUNNER = """
+import sys, json, time
+from synthetix import Synthetix
+
+proxy_url, network_id, address = sys.argv[1], int(sys.argv[2]), sys.argv[3]
+start = time.perf_counter()
+snx = Synthetix(
+    provider_rpc=f"{proxy_url}/rpc",
+    network_id=network_id,
+    address=address,
+    price_service_endpoint=f"{proxy_url}/pyth",
+)
+print(json.dumps({"seconds": time.perf_counter() - start}))
+"""
+
+
+def load_output_types(package_dir, network_id):
+    """map function selectors to their output types, from the deployment ABIs"""
+    output_types = {}
+    contracts_dir = os.path.join(package_dir, "contracts")
+    for directory in [
+        os.path.join(contracts_dir, "deployments", str(network_id)),
+        os.path.join(contracts_dir, "common"),
+    ]:
+        for path in glob.glob(os.path.join(directory, "**", "*.json"), recursive=True):
+            with open(path, "r") as artifact_file:
+                artifact = json.load(artifact_file)
+            abi = artifact["abi"] if isinstance(artifact, dict) else artifact
+            for item in abi:
+                if item.get("type") == "function":
+                    selector = encode_hex(function_abi_to_4byte_selector(item))
+                    output_types[selector] = get_abi_output_types(item)
+    return output_types
+
+
+def zero_value(abi_type):
+    """the zero value of a parsed ABI type, with empty dynamic arrays"""
+    if abi_type.is_array:
+        dimension = abi_type.arrlist[-1]
+        if len(dimension) == 0:
+            return []
+        return [zero_value(abi_type.item_type)] * dimension[0]
+    if isinstance(abi_type, TupleType):
+        return tuple(zero_value(component) for component in abi_type.components)
+    if abi_type.base == "bool":
+        return False
+    if abi_type.base == "address":
+        return "0x" + "00" * 20
+    if abi_type.base == "string":
+        return ""
+    if abi_type.base == "bytes":
+        return b"\x00" * int(abi_type.sub) if abi_type.sub else b""
+    return 0
+
+
+def rpc_key(request):
+    """key a JSON-RPC request by its method and params"""
+    return json.dumps([request["method"], request.get("params", [])], sort_keys=True)
+
+
+class Proxy:
+    """A recording or replaying proxy for JSON-RPC and price service requests"""
+
+    def __init__(
+        self,
+        fixture,
+        upstream_rpc=None,
+        upstream_pyth=None,
+        latency=0,
+        output_types=None,
+    ):
+        self.fixture = fixture
+        self.output_types = output_types
+        self.upstream_rpc = upstream_rpc
+        self.upstream_pyth = upstream_pyth
+        self.latency = latency
+        self.session = requests.Session()
+        self.reset()
+
+    def reset(self):
+        self.counts = {"rpc": 0, "rpc_requests": 0, "pyth": 0, "misses": 0}
+
+    @property
+    def recording(self):
+        return self.upstream_rpc is not None
+
+    def handle_rpc(self, body):
+        request = json.loads(body)
+        items = request if isinstance(request, list) else [request]
+        self.counts["rpc"] += 1
+        self.counts["rpc_requests"] += len(items)
+
+        if self.recording:
+            response = self.session.post(self.upstream_rpc, json=request).json()
+            responses = response if isinstance(response, list) else [response]
+            responses_by_id = {r.get("id"): r for r in responses}
+            for item in items:
+                if item["id"] in responses_by_id:
+                    recorded = dict(responses_by_id[item["id"]])
+                    recorded.pop("id", None)
+                    self.fixture["rpc"][rpc_key(item)] = recorded
+            return response
+
+        responses = []
+        for item in items:
+            recorded = (
+                self.stub_response(item)
+                if self.output_types is not None
+                else self.fixture["rpc"].get(rpc_key(item))
+            )
+            if recorded is None:
+                self.counts["misses"] += 1
+                recorded = {
+                    "jsonrpc": "2.0",
+                    "error": {"code": -32000, "message": "Not recorded"},
+                }
+            responses.append({**recorded, "id": item["id"]})
+        return responses if isinstance(request, list) else responses[0]
+
+    def stub_response(self, request):
+        method = request["method"]
+        if method == "eth_chainId":
+            return {"jsonrpc": "2.0", "result": hex(self.fixture["network_id"])}
+        if method == "eth_call":
+            tx = request["params"][0]
+            data = decode_hex(tx.get("data", tx.get("input", "0x")))
+            return {"jsonrpc": "2.0", "result": encode_hex(self.stub_call(data))}
+        if method in STUB_RESULTS:
+            return {"jsonrpc": "2.0", "result": STUB_RESULTS[method]}
+        return None
+
+    def stub_call(self, data):
+        """return zero values, with a successful result for each multicall call"""
+        if encode_hex(data[:4]) == SELECTOR_AGGREGATE3_VALUE:
+            calls = decode(["(address,bool,uint256,bytes)[]"], data[4:])[0]
+            results = [(True, self.stub_call(call[3])) for call in calls]
+            return encode(["(bool,bytes)[]"], [results])
+
+        output_types = self.output_types.get(encode_hex(data[:4]))
+        if output_types is None:
+            return b"\x00" * 32
+        return encode(output_types, [zero_value(parse(t)) for t in output_types])
+
+    def handle_pyth(self, path):
+        self.counts["pyth"] += 1
+        if self.recording:
+            response = self.session.get(f"{self.upstream_pyth}{path}")
+            self.fixture["http"][path] = {
+                "status": response.status_code,
+                "body": response.text,
+            }
+        recorded = self.fixture["http"].get(path)
+        if recorded is None:
+            self.counts["misses"] += 1
+            return 404, "{}"
+        return recorded["status"], recorded["body"]
+
+    def serve(self):
+        proxy = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def _send(self, status, body):
+                data = body.encode()
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(data)))
+                self.end_headers()
+                self.wfile.write(data)
+
+            def do_POST(self):
+                time.sleep(proxy.latency)
+                body = self.rfile.read(int(self.headers.get("Content-Length", 0)))
+                self._send(200, json.dumps(proxy.handle_rpc(body)))
+
+            def do_GET(self):
+                time.sleep(proxy.latency)
+                status, body = proxy.handle_pyth(self.path[len("/pyth") :])
+                self._send(status, body)
+
+            def log_message(self, format, *args):
+                pass
+
+        server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        server.daemon_threads = True
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        return server
+
+
+def run(proxy_url, network_id, address, src=None):
+    env = None
+    if src is not None:
+        env = {**os.environ, "PYTHONPATH": os.path.abspath(src)}
+    output = subprocess.run(
+        [sys.executable, "-c", RUNNER, proxy_url, str(network_id), address],
+        check=True,
+        capture_output=True,
+        text=True,
+        env=env,
+    )
+    return json.loads(output.stdout.strip().splitlines()[-1])
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark Synthetix startup")
+    parser.add_argument("mode", choices=["record", "replay", "stub"])
+    parser.add_argument("--fixture", help="fixture to record or replay")
+    parser.add_argument("--src", help="source directory of the version to run")
+    parser.add_argument("--rpc", help="upstream RPC, required to record")
+    parser.add_argument("--price-service", default=DEFAULT_PRICE_SERVICE)
+    parser.add_argument("--network-id", type=int, default=8453)
+    parser.add_argument(
+        "--address", default="0x0000000000000000000000000000000000000001"
+    )
+    parser.add_argument("--latency-ms", type=float, default=50)
+    parser.add_argument("--runs", type=int, default=5)
+    args = parser.parse_args()
+
+    if args.mode != "stub" and not args.fixture:
+        parser.error("--fixture is required to record or replay")
+
+    if args.mode == "record":
+        if not args.rpc:
+            parser.error("--rpc is required to record")
+        fixture = {
+            "network_id": args.network_id,
+            "address": args.address,
+            "rpc": {},
+            "http": {},
+        }
+        proxy = Proxy(fixture, upstream_rpc=args.rpc, upstream_pyth=args.price_service)
+        server = proxy.serve()
+        proxy_url = f"http://127.0.0.1:{server.server_address[1]}"
+        run(proxy_url, args.network_id, args.address, args.src)
+        with open(args.fixture, "w") as fixture_file:
+            json.dump(fixture, fixture_file)
+        print(
+            f"Recorded {len(fixture['rpc'])} RPC and {len(fixture['http'])} "
+            f"price service responses to {args.fixture}"
+        )
+        return
+
+    if args.mode == "stub":
+        fixture = {
+            "network_id": args.network_id,
+            "address": args.address,
+            "rpc": {},
+            "http": {},
+        }
+    else:
+        with open(args.fixture, "r") as fixture_file:
+            fixture = json.load(fixture_file)
+    output_types = None
+    if args.mode == "stub":
+        package_dir = (
+            os.path.join(args.src, "synthetix")
+            if args.src
+            else os.path.dirname(importlib.util.find_spec("synthetix").origin)
+        )
+        output_types = load_output_types(package_dir, fixture["network_id"])
+    proxy = Proxy(fixture, latency=args.latency_ms / 1000, output_types=output_types)
+    server = proxy.serve()
+    proxy_url = f"http://127.0.0.1:{server.server_address[1]}"
+
+    results = []
+    for _ in range(args.runs):
+        proxy.reset()
+        result = run(proxy_url, fixture["network_id"], fixture["address"], args.src)
+        results.append({**result, **proxy.counts})
+
+    seconds = sorted(r["seconds"] for r in results)[len(results) // 2]
+    counts = results[-1]
+    print(f"network {fixture['network_id']}, {args.latency_ms:.0f}ms per round trip")
+    print(f"median startup:        {seconds * 1000:.0f} ms")
+    print(f"RPC round trips:       {counts['rpc']}")
+    print(f"RPC requests:          {counts['rpc_requests']}")
+    print(f"price service calls:   {counts['pyth']}")
+    print(f"unrecorded requests:   {counts['misses']}")
+
+
+if __name__ == "__main__":
+    sys.exit(main())
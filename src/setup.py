@@ -15,6 +15,7 @@ setup(
         "requests_toolbelt",
         "web3>=6.4.0,<7.0.0",
         "gql",
+        "ijson",
     ],
     classifiers=[
         "Intended Audience :: Developers",
@@ -1,3 +1,4 @@
+import os
 from decimal import Decimal
 
 # default
@@ -18,5 +19,19 @@ DEFAULT_GQL_ENDPOINT_RATES = {
 }
 
 DEFAULT_PRICE_SERVICE_ENDPOINT = "https://hermes.pyth.network"
+DEFAULT_PYTH_HEDGE_AFTER = 0.5
+DEFAULT_PYTH_COALESCE_WINDOW = 0.005
+
+DEFAULT_MULTICALL_MAX_CALLS = 500
+DEFAULT_MULTICALL_MAX_WORKERS = 4
+
+DEFAULT_HTTP_MAX_RETRIES = 2
+DEFAULT_HTTP_MAX_CONNECTIONS = 10
+DEFAULT_HTTP_TIMEOUT = 10
+
+DEFAULT_CANNON_CACHE_TTL = 3600
+IPFS_CHUNK_SIZE = 256 * 1024
+
+DEFAULT_CACHE_DIR = os.environ.get("SYNTHETIX_CACHE_DIR")
 
 ETH_DECIMAL = Decimal("1e18")
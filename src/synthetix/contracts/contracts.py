@@ -1,8 +1,182 @@
 import os
+import re
 import json
+import time
 import zlib
-import requests
+from collections.abc import Mapping
 from web3 import Web3
+from ..constants import DEFAULT_CANNON_CACHE_TTL, IPFS_CHUNK_SIZE
+from ..utils.cache import read_json_cache, write_json_cache
+from ..utils.http import get_http
+from .interning import (
+    abi_to_json,
+    get_contract,
+    hash_abi_json,
+    intern_abi,
+    intern_selectors,
+)
+from .index import (
+    build_deployment_index,
+    get_function_selectors,
+    get_index_path,
+    read_deployment_index,
+    write_deployment_index,
+)
+
+
+class ContractDefinition(Mapping):
+    """
+    A lazily loaded contract definition. Behaves like the dictionary
+    ``{"address": ..., "abi": ..., "contract": ...}`` stored for each contract
+    in ``snx.contracts``, but the deployment file is only read when the address
+    or ABI is first accessed, and the web3 contract is only built when
+    ``["contract"]`` is first accessed::
+
+        >>> snx.contracts["perpsFactory"]["PerpsMarketProxy"]["contract"]
+        <web3 contract object>
+
+    ABIs and selector tables are shared with every other definition of the
+    same ABI on the network, and web3 contracts are shared with every other
+    ``Synthetix`` instance using the same web3 connection.
+
+    :param Synthetix snx: Synthetix class instance
+    :param str file_path: Path to a JSON file containing the address and ABI
+    :param str address: Contract address, if already known
+    :param list abi: Contract ABI, if already known
+    :param str abi_json: Contract ABI as a JSON string, parsed on first access
+    :param dict selectors: Function selectors keyed by signature, if already known
+    :return: ContractDefinition instance
+    :rtype: ContractDefinition
+    """
+
+    _keys = ("address", "abi", "contract")
+
+    def __init__(
+        self,
+        snx,
+        file_path: str = None,
+        address: str = None,
+        abi=None,
+        abi_json: str = None,
+        selectors: dict = None,
+    ):
+        self._snx = snx
+        self._file_path = file_path
+        self._address = address
+        self._abi = abi
+        self._abi_json = abi_json
+        self._abi_hash = None
+        self._abi_interned = False
+        self._selectors = selectors
+        self._selectors_interned = False
+        self._contract = None
+
+    @property
+    def abi_hash(self) -> str:
+        """Hash of the contract ABI, used to share ABIs between instances"""
+        if self._abi_hash is None:
+            if self._abi is None and self._abi_json is None:
+                self._read_file()
+            if self._abi_json is not None:
+                self._abi_hash = hash_abi_json(self._abi_json)
+            else:
+                self._abi_hash = hash_abi_json(abi_to_json(self._abi))
+        return self._abi_hash
+
+    @property
+    def selectors(self) -> dict:
+        """Function selectors of the contract keyed by function signature"""
+        if not self._selectors_interned:
+            selectors = self._selectors
+            self._selectors = intern_selectors(
+                self._snx.network_id,
+                self.abi_hash,
+                lambda: (
+                    selectors
+                    if selectors is not None
+                    else get_function_selectors(self["abi"])
+                ),
+            )
+            self._selectors_interned = True
+        return self._selectors
+
+    def _read_file(self):
+        """Read the address and ABI from the deployment file"""
+        with open(self._file_path, "r") as json_file:
+            contract_data = json.load(json_file)
+        if self._address is None:
+            self._address = contract_data["address"]
+        if self._abi is None and self._abi_json is None:
+            self._abi = contract_data["abi"]
+
+    def _load(self):
+        """Read the address and ABI if needed, sharing the ABI between instances"""
+        if self._address is None or (self._abi is None and self._abi_json is None):
+            self._read_file()
+        if not self._abi_interned:
+            abi, abi_json = self._abi, self._abi_json
+            self._abi = intern_abi(
+                self._snx.network_id,
+                self.abi_hash,
+                lambda: abi if abi is not None else json.loads(abi_json),
+            )
+            self._abi_json = None
+            self._abi_interned = True
+
+    def at(self, address: str):
+        """
+        Get a web3 contract with the ABI of this definition at another address.
+        The contract is shared with other callers using the same web3 connection::
+
+            >>> snx.contracts["common"]["ERC20"].at(token_address)
+            <web3 contract object>
+
+        :param str address: The contract address
+        :return: The web3 contract
+        :rtype: web3.contract.Contract
+        """
+        self._load()
+        return get_contract(
+            self._snx.web3,
+            self._snx.network_id,
+            self.abi_hash,
+            self._abi,
+            self._snx.web3.to_checksum_address(address),
+        )
+
+    def __getitem__(self, key):
+        if key == "contract":
+            if self._contract is None:
+                self._load()
+                self._contract = get_contract(
+                    self._snx.web3,
+                    self._snx.network_id,
+                    self.abi_hash,
+                    self._abi,
+                    self._address,
+                )
+            return self._contract
+        elif key == "address":
+            if self._address is None:
+                self._read_file()
+            return self._address
+        elif key == "abi":
+            self._load()
+            return self._abi
+        raise KeyError(key)
+
+    def __contains__(self, key):
+        return key in self._keys
+
+    def __iter__(self):
+        return iter(self._keys)
+
+    def __len__(self):
+        return len(self._keys)
+
+    def __repr__(self):
+        source = self._address if self._address is not None else self._file_path
+        return f"ContractDefinition({source})"
 
 
 def load_contracts(snx):
@@ -38,7 +212,7 @@ def load_contracts(snx):
 def load_common_contracts(snx):
     """loads the common contracts for a synthetix instance"""
     common_dir = os.path.join(os.path.dirname(os.path.abspath(__file__)), "common")
-    common_contracts = load_json_files_from_directory(snx, common_dir)
+    common_contracts = load_deployment(snx, common_dir, "common")
     return common_contracts
 
 
@@ -47,13 +221,55 @@ def load_local_contracts(snx):
     deployment_dir = os.path.join(
         os.path.dirname(os.path.abspath(__file__)), "deployments", f"{snx.network_id}"
     )
-    contracts = load_json_files_from_directory(snx, deployment_dir)
+    contracts = load_deployment(snx, deployment_dir, f"{snx.network_id}")
     contracts["common"] = load_common_contracts(snx)
     return contracts
 
 
+def load_deployment(snx, directory, name):
+    """
+    loads a deployment directory from its prebuilt index in the cache directory.
+    If the index is missing or stale, it is rebuilt from the JSON files. If no
+    cache directory is set, the JSON files are loaded directly
+    """
+    if snx.cache_dir is None or not os.path.isdir(directory):
+        return load_json_files_from_directory(snx, directory)
+
+    index_path = get_index_path(snx.cache_dir, name)
+    index = read_deployment_index(index_path, directory)
+    if index is None:
+        snx.logger.debug(f"Building deployment index for {name}")
+        index = build_deployment_index(directory)
+        try:
+            write_deployment_index(index, index_path)
+        except OSError as e:
+            snx.logger.debug(f"Unable to write deployment index {index_path}: {e}")
+
+    return load_contracts_from_index(snx, index)
+
+
+def load_contracts_from_index(snx, index):
+    """load the contracts from a deployment index, including nested folders"""
+    contracts = {}
+
+    for folders, contract_name, address, abi_json, selectors in index["contracts"]:
+        # Create nested dictionary structure
+        current_level = contracts
+        for folder in folders:
+            current_level = current_level.setdefault(folder, {})
+
+        current_level[contract_name] = ContractDefinition(
+            snx, address=address, abi_json=abi_json, selectors=selectors
+        )
+
+    return contracts
+
+
 def load_json_files_from_directory(snx, directory):
-    """load json files from a given directory, including nested folders"""
+    """
+    load json files from a given directory, including nested folders. The files
+    are not read here, each contract is loaded on first access
+    """
     contracts = {}
 
     for root, dirs, files in os.walk(directory):
@@ -63,27 +279,42 @@ def load_json_files_from_directory(snx, directory):
                 relative_path = os.path.relpath(root, directory)
                 contract_name = os.path.splitext(file)[0]
 
-                with open(file_path, "r") as json_file:
-                    contract_data = json.load(json_file)
-
                 # Create nested dictionary structure
                 current_level = contracts
                 if relative_path != ".":
                     for folder in relative_path.split(os.sep):
                         current_level = current_level.setdefault(folder, {})
 
-                current_level[contract_name] = {
-                    "address": contract_data["address"],
-                    "abi": contract_data["abi"],
-                    "contract": snx.web3.eth.contract(
-                        address=contract_data["address"], abi=contract_data["abi"]
-                    ),
-                }
+                current_level[contract_name] = ContractDefinition(
+                    snx, file_path=file_path
+                )
 
     return contracts
 
 
 def get_deployment_hash(snx):
+    """
+    resolve the IPFS hash of the cannon package in ``snx.cannon_config`` using
+    the Cannon registry on Optimism mainnet. Resolved hashes are cached in the
+    cache directory for ``cannon_config["cache_ttl"]`` seconds
+    """
+    chain_id = snx.network_id
+    package_ref = (
+        f"{snx.cannon_config['package']}:{snx.cannon_config['version']}"
+        f"@{chain_id}-{snx.cannon_config['preset']}"
+    )
+    cache_ttl = snx.cannon_config.get("cache_ttl", DEFAULT_CANNON_CACHE_TTL)
+
+    # check the cache
+    if snx.cache_dir is not None:
+        cache_path = os.path.join(snx.cache_dir, "cannon", "package_urls.json")
+        cached_urls = read_json_cache(cache_path) or {}
+        if package_ref in cached_urls:
+            cache_data = cached_urls[package_ref]
+            if int(time.time()) - cache_data["timestamp"] < cache_ttl:
+                snx.logger.debug(f"Using cached package url for {package_ref}")
+                return cache_data["ipfs_hash"]
+
     provider_rpc = snx.op_mainnet_rpc
     w3 = (
         Web3(Web3.HTTPProvider(provider_rpc))
@@ -102,13 +333,24 @@ def get_deployment_hash(snx):
         address=cannon_contract_def["address"], abi=cannon_contract_def["abi"]
     )
 
-    chain_id = snx.network_id
     package = encode_string(snx.cannon_config["package"])
     version = encode_string(snx.cannon_config["version"])
     preset = encode_string(str(chain_id) + "-" + snx.cannon_config["preset"])
 
     ipfs_loc = contract.functions.getPackageUrl(package, version, preset).call()
     ipfs_hash = ipfs_loc.split("/")[-1]
+
+    # update the cache
+    if snx.cache_dir is not None and cache_ttl > 0:
+        cached_urls = read_json_cache(cache_path) or {}
+        cached_urls[package_ref] = {
+            "ipfs_hash": ipfs_hash,
+            "timestamp": int(time.time()),
+        }
+        try:
+            write_json_cache(cache_path, cached_urls)
+        except OSError as e:
+            snx.logger.debug(f"Unable to cache package url for {package_ref}: {e}")
     return ipfs_hash
 
 
@@ -118,16 +360,154 @@ def encode_string(string, length=66, pad_char="0"):
 
 
 def fetch_deploy_from_ipfs(snx, ipfs_hash):
+    """
+    fetch and parse a cannon deployment from IPFS. IPFS content is immutable, so
+    the parsed contracts are cached in the cache directory keyed by the hash and
+    later loads do not hit the gateway
+    """
+    cache_path = None
+    if snx.cache_dir is not None and re.fullmatch(r"[A-Za-z0-9]+", ipfs_hash):
+        cache_path = os.path.join(snx.cache_dir, "ipfs", f"{ipfs_hash}.json")
+        cached_contracts = read_json_cache(cache_path)
+        if cached_contracts is not None:
+            snx.logger.debug(f"Using cached deployment for ipfs://{ipfs_hash}")
+            return contracts_from_tree(snx, cached_contracts)
+
+    # decompress and parse the download as it arrives, reducing each contract
+    # artifact to its address and ABI as soon as it is parsed, so neither the
+    # download nor the full document is held in memory
     url = f"{snx.ipfs_gateway}/{ipfs_hash}"
-    response = requests.get(url)
-    data = zlib.decompress(response.content)
-    data = json.loads(data)
+    response = get_http(snx).get(url, stream=True)
+    data = parse_json_stream(
+        decompress_stream(response.iter_content(chunk_size=IPFS_CHUNK_SIZE)),
+        object_hook=lambda obj: prune_contract_artifact(snx, obj),
+    )
 
     deployment = parse_contracts(snx, data)
+
+    # update the cache
+    if cache_path is not None:
+        try:
+            write_json_cache(cache_path, contracts_to_tree(deployment))
+        except OSError as e:
+            snx.logger.debug(f"Unable to cache deployment ipfs://{ipfs_hash}: {e}")
     return deployment
 
 
+def decompress_stream(chunks):
+    """
+    decompress zlib chunks as they are received, yielding the decompressed data
+    in pieces of at most ``IPFS_CHUNK_SIZE`` bytes
+    """
+    decompressor = zlib.decompressobj()
+    for chunk in chunks:
+        while chunk:
+            data = decompressor.decompress(chunk, IPFS_CHUNK_SIZE)
+            if data:
+                yield data
+            chunk = decompressor.unconsumed_tail
+    yield decompressor.flush()
+
+
+class ChunkReader:
+    """file-like reader over an iterator of byte chunks, used by ``ijson``"""
+
+    def __init__(self, chunks):
+        self._chunks = iter(chunks)
+        self._buffer = b""
+
+    def read(self, size=-1):
+        while size < 0 or len(self._buffer) < size:
+            chunk = next(self._chunks, None)
+            if chunk is None:
+                break
+            self._buffer += chunk
+
+        if size < 0:
+            size = len(self._buffer)
+        data, self._buffer = self._buffer[:size], self._buffer[size:]
+        return data
+
+
+def parse_json_stream(chunks, object_hook=None):
+    """
+    parse a JSON document from an iterator of byte chunks, without holding the
+    whole document in memory. Like ``json.loads``, each object is passed to
+    ``object_hook`` once it is parsed and replaced by its return value
+    """
+    import ijson
+
+    stack = []
+    keys = []
+    root = []
+
+    def add(value):
+        if len(stack) == 0:
+            root.append(value)
+        elif isinstance(stack[-1], list):
+            stack[-1].append(value)
+        else:
+            stack[-1][keys.pop()] = value
+
+    for event, value in ijson.basic_parse(ChunkReader(chunks), use_float=True):
+        if event == "start_map":
+            stack.append({})
+        elif event == "start_array":
+            stack.append([])
+        elif event == "map_key":
+            keys.append(value)
+        elif event == "end_map":
+            obj = stack.pop()
+            add(object_hook(obj) if object_hook is not None else obj)
+        elif event == "end_array":
+            add(stack.pop())
+        else:
+            add(value)
+    return root[0]
+
+
+def prune_contract_artifact(snx, obj):
+    """
+    object hook used when decoding a cannon deployment. Contract artifacts are
+    reduced to their checksummed address and ABI, dropping the other fields
+    """
+    if "address" in obj and "abi" in obj and isinstance(obj["address"], str):
+        return {
+            "address": snx.web3.to_checksum_address(obj["address"]),
+            "abi": obj["abi"],
+        }
+    return obj
+
+
+def contracts_to_tree(contracts):
+    """reduce a nested dictionary of contracts to their addresses and ABIs"""
+    return {
+        key: (
+            {"address": value["address"], "abi": value["abi"]}
+            if "abi" in value
+            else contracts_to_tree(value)
+        )
+        for key, value in contracts.items()
+    }
+
+
+def contracts_from_tree(snx, tree):
+    """build lazy contract definitions from a nested dictionary of addresses and ABIs"""
+    return {
+        key: (
+            ContractDefinition(snx, address=value["address"], abi=value["abi"])
+            if "abi" in value
+            else contracts_from_tree(snx, value)
+        )
+        for key, value in tree.items()
+    }
+
+
 def parse_contracts(snx, deploy_data):
+    """
+    find the contracts in a decoded cannon deployment. Contracts are returned
+    as lazy definitions, keyed by the package they are imported from
+    """
     contracts = {}
     recursive_search(snx, deploy_data, contracts)
     return contracts
@@ -153,25 +533,18 @@ def recursive_search(snx, deploy_data, contracts, current_package=None):
                         and "abi" in contract_data
                     ):
                         if current_package:
-                            contracts[contract_name] = {
-                                "address": snx.web3.to_checksum_address(
-                                    contract_data["address"]
-                                ),
-                                "abi": contract_data["abi"],
-                                "contract": snx.web3.eth.contract(
-                                    address=snx.web3.to_checksum_address(
-                                        contract_data["address"]
-                                    ),
-                                    abi=contract_data["abi"],
-                                ),
-                            }
+                            contracts[contract_name] = ContractDefinition(
+                                snx,
+                                address=contract_data["address"],
+                                abi=contract_data["abi"],
+                            )
                         else:
                             snx.logger.warning(
                                 f"Contract {contract_name} found outside of a package"
                             )
                     else:
                         snx.logger.warning(f"Invalid contract data for {contract_name}")
-            elif isinstance(value, (dict, list)):
+            elif key != "abi" and isinstance(value, (dict, list)):
                 recursive_search(snx, value, contracts, current_package)
     elif isinstance(deploy_data, list):
         for item in deploy_data:
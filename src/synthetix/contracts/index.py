@@ -0,0 +1,175 @@
+"""
+Prebuilt indexes for the deployment directories shipped with the package.
+
+An index stores the address, the raw ABI and the function selectors for every
+contract in a deployment directory in a single compact file, so it can be
+loaded with one read instead of walking and parsing the JSON tree. Indexes are
+built on first use and stored in the cache directory, or ahead of time with::
+
+    python -m synthetix.contracts.index ~/.cache/synthetix
+"""
+
+import os
+import sys
+import json
+import marshal
+from eth_utils import encode_hex, function_abi_to_4byte_selector
+from web3._utils.abi import abi_to_signature
+
+INDEX_FORMAT_VERSION = 1
+
+
+def get_index_path(cache_dir: str, name: str) -> str:
+    """
+    get the path of the index file for a deployment directory, which includes
+    the Python version since the ``marshal`` format can change between versions
+    """
+    python_version = f"py{sys.version_info.major}{sys.version_info.minor}"
+    return os.path.join(
+        cache_dir,
+        "deployments",
+        f"{name}.v{INDEX_FORMAT_VERSION}.{python_version}.index",
+    )
+
+
+def get_function_selectors(abi: list) -> dict:
+    """map each function signature in an ABI to its 4 byte selector"""
+    return {
+        abi_to_signature(item): encode_hex(function_abi_to_4byte_selector(item))
+        for item in abi
+        if item.get("type") == "function"
+    }
+
+
+def get_sources(directory: str) -> list:
+    """
+    list the folders and JSON files in a deployment directory with their sizes
+    and modification times, used to check if an index is stale
+    """
+    sources = []
+    for root, dirs, files in os.walk(directory):
+        dirs.sort()
+        relative_root = os.path.relpath(root, directory)
+        sources.append((relative_root, -1, os.stat(root).st_mtime_ns))
+        for file in sorted(files):
+            if file.endswith(".json"):
+                stat = os.stat(os.path.join(root, file))
+                sources.append(
+                    (
+                        os.path.join(relative_root, file),
+                        stat.st_size,
+                        stat.st_mtime_ns,
+                    )
+                )
+    return sources
+
+
+def is_index_fresh(index: dict, directory: str) -> bool:
+    """check that none of the sources of an index have changed"""
+    try:
+        for relative_path, size, mtime_ns in index["sources"]:
+            stat = os.stat(os.path.join(directory, relative_path))
+            if stat.st_mtime_ns != mtime_ns or (size >= 0 and stat.st_size != size):
+                return False
+    except OSError:
+        return False
+    return True
+
+
+def build_deployment_index(directory: str) -> dict:
+    """
+    Build an index for a deployment directory. Every JSON file is read once and
+    reduced to its address, raw ABI and function selectors. Folders are stored
+    as a tuple of names so the nested structure can be rebuilt.
+
+    :param str directory: The deployment directory to index
+    :return: The index
+    :rtype: dict
+    """
+    contracts = []
+    for root, dirs, files in os.walk(directory):
+        relative_path = os.path.relpath(root, directory)
+        folders = () if relative_path == "." else tuple(relative_path.split(os.sep))
+        for file in files:
+            if file.endswith(".json"):
+                with open(os.path.join(root, file), "r") as json_file:
+                    contract_data = json.load(json_file)
+
+                contracts.append(
+                    (
+                        folders,
+                        os.path.splitext(file)[0],
+                        contract_data["address"],
+                        json.dumps(contract_data["abi"], separators=(",", ":")),
+                        get_function_selectors(contract_data["abi"]),
+                    )
+                )
+
+    return {
+        "format": INDEX_FORMAT_VERSION,
+        "sources": get_sources(directory),
+        "contracts": contracts,
+    }
+
+
+def read_deployment_index(path: str, directory: str) -> dict | None:
+    """
+    Read an index from disk. Returns ``None`` if the index is missing, can not
+    be read, or is stale compared to the deployment directory.
+
+    :param str path: The path of the index file
+    :param str directory: The deployment directory the index was built from
+    :return: The index
+    :rtype: dict | None
+    """
+    try:
+        with open(path, "rb") as index_file:
+            index = marshal.loads(index_file.read())
+    except (OSError, EOFError, ValueError, TypeError):
+        return None
+
+    if not isinstance(index, dict) or index.get("format") != INDEX_FORMAT_VERSION:
+        return None
+    if not is_index_fresh(index, directory):
+        return None
+    return index
+
+
+def write_deployment_index(index: dict, path: str):
+    """
+    Write an index to disk. The file is written to a temporary path and moved
+    into place so a concurrent reader never sees a partial index.
+
+    :param dict index: The index to write
+    :param str path: The path of the index file
+    """
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    temp_path = f"{path}.{os.getpid()}.tmp"
+    with open(temp_path, "wb") as index_file:
+        index_file.write(marshal.dumps(index))
+    os.replace(temp_path, path)
+
+
+def build_all_indexes(cache_dir: str):
+    """build indexes for every deployment directory shipped with the package"""
+    contracts_dir = os.path.dirname(os.path.abspath(__file__))
+    deployments_dir = os.path.join(contracts_dir, "deployments")
+
+    directories = {"common": os.path.join(contracts_dir, "common")}
+    for name in sorted(os.listdir(deployments_dir)):
+        if os.path.isdir(os.path.join(deployments_dir, name)) and name.isdigit():
+            directories[name] = os.path.join(deployments_dir, name)
+
+    for name, directory in directories.items():
+        path = get_index_path(cache_dir, name)
+        write_deployment_index(build_deployment_index(directory), path)
+        print(f"Wrote index for {name} to {path}")
+
+
+if __name__ == "__main__":
+    from ..constants import DEFAULT_CACHE_DIR
+
+    cache_dir = sys.argv[1] if len(sys.argv) > 1 else DEFAULT_CACHE_DIR
+    if cache_dir is None:
+        sys.exit("usage: python -m synthetix.contracts.index CACHE_DIR")
+    build_all_indexes(cache_dir)
@@ -0,0 +1,99 @@
+"""
+Process-wide interning of contract ABIs, selector tables and web3 contracts.
+
+Processes often run many ``Synthetix`` instances on the same networks, for
+example one per wallet. ABIs and selector tables are shared between every
+instance, keyed by network and ABI hash, so each distinct ABI is parsed and
+stored once. Web3 contract factories and contract objects are bound to a web3
+connection, so they are shared between instances using the same ``Web3``
+object, for example with ``Synthetix(..., share_web3=True)``.
+"""
+
+import json
+import hashlib
+import threading
+
+_lock = threading.Lock()
+_abis = {}
+_selectors = {}
+
+
+def abi_to_json(abi: list) -> str:
+    """serialize an ABI to the compact JSON used to hash it"""
+    return json.dumps(abi, separators=(",", ":"))
+
+
+def hash_abi_json(abi_json: str) -> str:
+    """hash the compact JSON of an ABI"""
+    return hashlib.sha256(abi_json.encode()).hexdigest()
+
+
+def _intern(table: dict, key, load):
+    """get a shared value from a table, loading and storing it if missing"""
+    with _lock:
+        value = table.get(key)
+    if value is None:
+        # load outside the lock, if two threads race the first value is kept
+        value = load()
+        with _lock:
+            value = table.setdefault(key, value)
+    return value
+
+
+def intern_abi(network_id: int, abi_hash: str, load_abi) -> list:
+    """
+    Get the shared ABI for a network and ABI hash. The ABI is only loaded with
+    ``load_abi`` if it has not been seen before.
+
+    :param int network_id: The network the contract is deployed on
+    :param str abi_hash: The hash of the ABI, see ``hash_abi_json``
+    :param callable load_abi: Function returning the parsed ABI
+    :return: The shared ABI
+    :rtype: list
+    """
+    return _intern(_abis, (network_id, abi_hash), load_abi)
+
+
+def intern_selectors(network_id: int, abi_hash: str, load_selectors) -> dict:
+    """
+    Get the shared selector table for a network and ABI hash. The table is only
+    loaded with ``load_selectors`` if it has not been seen before.
+
+    :param int network_id: The network the contract is deployed on
+    :param str abi_hash: The hash of the ABI, see ``hash_abi_json``
+    :param callable load_selectors: Function returning the function selectors
+        keyed by signature
+    :return: The shared selector table
+    :rtype: dict
+    """
+    return _intern(_selectors, (network_id, abi_hash), load_selectors)
+
+
+def get_contract(web3, network_id: int, abi_hash: str, abi: list, address: str):
+    """
+    Get the shared web3 contract for an address and ABI. One contract factory is
+    built for each ABI and one contract for each address, and both are reused by
+    every caller using the same ``web3`` object. The cache is stored on the
+    ``web3`` object, so it is released together with the connection.
+
+    :param Web3 web3: The web3 connection the contract is bound to
+    :param int network_id: The network the contract is deployed on
+    :param str abi_hash: The hash of the ABI, see ``hash_abi_json``
+    :param list abi: The ABI
+    :param str address: The contract address
+    :return: The web3 contract
+    :rtype: web3.contract.Contract
+    """
+    with _lock:
+        contracts = web3.__dict__.setdefault("_synthetix_contracts", {})
+
+        factory_key = (network_id, abi_hash, None)
+        factory = contracts.get(factory_key)
+        if factory is None:
+            factory = contracts[factory_key] = web3.eth.contract(abi=abi)
+
+        contract_key = (network_id, abi_hash, address)
+        contract = contracts.get(contract_key)
+        if contract is None:
+            contract = contracts[contract_key] = factory(address=address)
+    return contract
@@ -2,6 +2,8 @@
 
 from ..utils import ether_to_wei, wei_to_ether, format_ether
 from ..utils.multicall import call_erc7412, multicall_erc7412, write_erc7412
+from ..utils.prefetch import call_prefetched
+from ..utils.state import restore_account_ids
 
 
 class Core:
@@ -36,12 +38,14 @@ class Core:
 
     :param Synthetix snx: An instance of the Synthetix class
     :param int default_account_id: The default account ID to use
+    :param dict state: State saved by a previous run, used instead of fetching
+        the account IDs if it is still valid
 
     :return: An instance of the Core class
     :rtype: Core
     """
 
-    def __init__(self, snx, default_account_id: int = None):
+    def __init__(self, snx, default_account_id: int = None, state: dict = None):
         self.snx = snx
         self.logger = snx.logger
 
@@ -50,11 +54,22 @@ class Core:
             self.core_proxy = snx.contracts["system"]["CoreProxy"]["contract"]
             self.account_proxy = snx.contracts["system"]["AccountProxy"]["contract"]
 
-            try:
-                self.get_account_ids(default_account_id=default_account_id)
-            except Exception as e:
-                self.account_ids = []
-                self.logger.warning(f"Failed to fetch core accounts: {e}")
+            if state is not None and restore_account_ids(
+                self, state, default_account_id
+            ):
+                self.logger.debug("Restored core accounts from saved state")
+            else:
+                try:
+                    self.get_account_ids(default_account_id=default_account_id)
+                except Exception as e:
+                    self.account_ids = []
+                    self.logger.warning(f"Failed to fetch core accounts: {e}")
+
+    def _get_state(self):
+        """Get the state to save for the next run"""
+        if "system" not in self.snx.contracts:
+            return None
+        return {"account_ids": self.account_ids}
 
     # read
     def get_usd_token(self):
@@ -79,7 +94,7 @@ class Core:
         if not address:
             address = self.snx.address
 
-        balance = self.account_proxy.functions.balanceOf(address).call()
+        balance = call_prefetched(self.snx, self.account_proxy, "balanceOf", (address,))
 
         # multicall the account ids
         inputs = [(address, i) for i in range(balance)]
@@ -4,11 +4,15 @@ import time
 from eth_utils import encode_hex
 from ..utils import ether_to_wei, wei_to_ether
 from ..utils.multicall import (
+    batch_erc7412,
     call_erc7412,
     multicall_erc7412,
     write_erc7412,
     make_pyth_fulfillment_request,
+    MulticallBatch,
 )
+from ..utils.prefetch import call_prefetched
+from ..utils.state import int_keys, restore_account_ids
 from .constants import DISABLED_MARKETS
 from .perps_utils import unpack_bfp_configuration, unpack_bfp_configuration_by_id
 
@@ -60,7 +64,7 @@ class BasePerps:
         if not address:
             address = self.snx.address
 
-        balance = self.account_proxy.functions.balanceOf(address).call()
+        balance = call_prefetched(self.snx, self.account_proxy, "balanceOf", (address,))
 
         # multicall the account ids
         inputs = [(address, i) for i in range(balance)]
@@ -138,15 +142,24 @@ class PerpsV3(BasePerps):
     :param Synthetix snx: An instance of the Synthetix class.
     :param int | None default_account_id: The default ``account_id`` to use for transactions.
     :param list | None : A list of market ids to disable.
+    :param dict | None state: State saved by a previous run, used instead of fetching
+        the accounts and markets if it is still valid.
 
     :return: An instance of the Perps class.
     :rtype: Perps
     """
 
-    def __init__(self, snx, default_account_id: int = None, disabled_markets=None):
+    def __init__(
+        self,
+        snx,
+        default_account_id: int = None,
+        disabled_markets=None,
+        state: dict = None,
+    ):
         self.snx = snx
         self.logger = snx.logger
         self.erc7412_enabled = True
+        self._collateral_names = {0: "sUSD"}
 
         if disabled_markets is None and snx.network_id in DISABLED_MARKETS:
             self.disabled_markets = DISABLED_MARKETS[snx.network_id]
@@ -162,17 +175,25 @@ class PerpsV3(BasePerps):
                 "contract"
             ]
 
-            try:
-                self.get_account_ids(default_account_id=default_account_id)
-            except Exception as e:
-                self.account_ids = []
-                self.default_account_id = None
-                self.logger.warning(f"Failed to fetch perps accounts: {e}")
-
-            try:
-                self.get_markets()
-            except Exception as e:
-                self.logger.warning(f"Failed to fetch markets: {e}")
+            if state is not None and restore_account_ids(
+                self, state, default_account_id
+            ):
+                self.logger.debug("Restored perps accounts from saved state")
+            else:
+                try:
+                    self.get_account_ids(default_account_id=default_account_id)
+                except Exception as e:
+                    self.account_ids = []
+                    self.default_account_id = None
+                    self.logger.warning(f"Failed to fetch perps accounts: {e}")
+
+            if state is not None and self._restore_markets(state):
+                self.logger.debug("Restored perps markets from saved state")
+            else:
+                try:
+                    self.get_markets()
+                except Exception as e:
+                    self.logger.warning(f"Failed to fetch markets: {e}")
 
             # check if multicollateral
             debt_check = self.market_proxy.find_functions_by_name("debt")
@@ -183,6 +204,55 @@ class PerpsV3(BasePerps):
             else:
                 self.is_multicollateral = False
 
+    def _get_state(self):
+        """Get the state to save for the next run"""
+        if "perpsFactory" not in self.snx.contracts:
+            return None
+        state = {"account_ids": self.account_ids}
+        if hasattr(self, "markets_by_id"):
+            state["market_meta"] = self.market_meta
+            state["markets_by_id"] = self.markets_by_id
+        return state
+
+    def _restore_markets(self, state: dict):
+        """
+        Restore the markets saved by a previous run. The markets are only used
+        if ``getMarkets`` returns the same market ids.
+
+        :param dict state: The saved state of the module
+        :return: ``True`` if the markets were restored
+        :rtype: bool
+        """
+        if "markets_by_id" not in state:
+            return False
+        try:
+            market_ids = call_prefetched(self.snx, self.market_proxy, "getMarkets")
+        except Exception as e:
+            self.logger.debug(f"Failed to validate saved markets: {e}")
+            return False
+
+        markets_by_id = int_keys(state["markets_by_id"])
+        market_ids = [
+            market_id
+            for market_id in market_ids
+            if market_id not in self.disabled_markets
+        ]
+        if market_ids != list(markets_by_id.keys()):
+            return False
+
+        self.market_meta = int_keys(state["market_meta"])
+        self.snx.pyth.update_price_feed_ids(
+            {
+                self.market_meta[market]["symbol"]: self.market_meta[market]["feed_id"]
+                for market in self.market_meta
+            }
+        )
+        self.markets_by_id = markets_by_id
+        self.markets_by_name = {
+            summary["market_name"]: summary for summary in markets_by_id.values()
+        }
+        return True
+
     def _prepare_oracle_call(self, market_names: [str] = []):
         """
         Prepare a call to the external node with oracle updates for the specified market names.
@@ -273,7 +343,7 @@ class PerpsV3(BasePerps):
         :return: Market summaries keyed by `market_id` and `market_name`.
         :rtype: (dict, dict)
         """
-        market_ids = self.market_proxy.functions.getMarkets().call()
+        market_ids = call_prefetched(self.snx, self.market_proxy, "getMarkets")
 
         # filter disabled markets
         market_ids = [
@@ -282,19 +352,27 @@ class PerpsV3(BasePerps):
             if market_id not in self.disabled_markets
         ]
 
-        # fetch and store the metadata
-        market_metadata = multicall_erc7412(
-            self.snx, self.market_proxy, "metadata", market_ids
-        )
-
-        # fetch settlement strategies to get feed_ids
-        settlement_strategy_inputs = [(market_id, 0) for market_id in market_ids]
-        settlement_strategies = multicall_erc7412(
-            self.snx,
-            self.market_proxy,
-            "getSettlementStrategy",
-            settlement_strategy_inputs,
-        )
+        # fetch the metadata, settlement strategies to get feed_ids, funding
+        # parameters, fees and max market values in a single multicall
+        contract_calls = []
+        for market_id in market_ids:
+            contract_calls.extend(
+                [
+                    (self.market_proxy, "metadata", (market_id,)),
+                    (self.market_proxy, "getSettlementStrategy", (market_id, 0)),
+                    (self.market_proxy, "getFundingParameters", (market_id,)),
+                    (self.market_proxy, "getOrderFees", (market_id,)),
+                    (self.market_proxy, "getMaxMarketValue", (market_id,)),
+                ]
+            )
+        results = batch_erc7412(self.snx, contract_calls)
+        (
+            market_metadata,
+            settlement_strategies,
+            funding_parameters,
+            fees,
+            max_market_values,
+        ) = [results[i::5] for i in range(5)]
 
         self.market_meta = {
             market_id: {
@@ -317,21 +395,6 @@ class PerpsV3(BasePerps):
         market_summaries = self.get_market_summaries(market_ids)
         markets_by_id = {summary["market_id"]: summary for summary in market_summaries}
 
-        # fetch funding parameters
-        funding_parameters = multicall_erc7412(
-            self.snx, self.market_proxy, "getFundingParameters", market_ids
-        )
-
-        # fetch fees
-        fees = multicall_erc7412(
-            self.snx, self.market_proxy, "getOrderFees", market_ids
-        )
-
-        # fetch max market
-        max_market_values = multicall_erc7412(
-            self.snx, self.market_proxy, "getMaxMarketValue", market_ids
-        )
-
         # add them to markets by id
         for ind, market_id in enumerate(market_ids):
             markets_by_id[market_id].update(
@@ -410,15 +473,13 @@ class PerpsV3(BasePerps):
         else:
             calls = []
 
-        inputs = [(market_id,) for market_id in market_ids]
-
-        markets = multicall_erc7412(
-            self.snx, self.market_proxy, "getMarketSummary", inputs, calls=calls
-        )
+        # fetch the summaries and the interest rate in a single multicall
+        contract_calls = [
+            (self.market_proxy, "getMarketSummary", (market_id,))
+            for market_id in market_ids
+        ] + [(self.market_proxy, "interestRate", ())]
 
-        interest_rate = call_erc7412(
-            self.snx, self.market_proxy, "interestRate", (), calls=calls
-        )
+        *markets, interest_rate = batch_erc7412(self.snx, contract_calls, calls=calls)
 
         if len(market_ids) != len(markets):
             self.logger.warning("Failed to fetch some market summaries")
@@ -558,55 +619,32 @@ class PerpsV3(BasePerps):
         else:
             calls = []
 
-        # TODO: expand multicall capability to handle multiple functions
-        total_collateral_value = call_erc7412(
-            self.snx,
-            self.market_proxy,
-            "totalCollateralValue",
-            (account_id,),
-            calls=calls,
-        )
-        available_margin = call_erc7412(
-            self.snx,
-            self.market_proxy,
-            "getAvailableMargin",
-            (account_id,),
-            calls=calls,
-        )
-        withdrawable_margin = call_erc7412(
-            self.snx,
-            self.market_proxy,
-            "getWithdrawableMargin",
-            (account_id,),
-            calls=calls,
-        )
+        # read the margin values in one multicall
+        batch = MulticallBatch(self.snx, calls=calls)
+        reads = {
+            function_name: batch.add(self.market_proxy, function_name, (account_id,))
+            for function_name in [
+                "totalCollateralValue",
+                "getAvailableMargin",
+                "getWithdrawableMargin",
+                "getRequiredMargins",
+            ]
+            + (["getAccountCollateralIds", "debt"] if self.is_multicollateral else [])
+        }
+        batch.execute()
+
+        total_collateral_value = reads["totalCollateralValue"].result()
+        available_margin = reads["getAvailableMargin"].result()
+        withdrawable_margin = reads["getWithdrawableMargin"].result()
         (
             initial_margin_requirement,
             maintenance_margin_requirement,
             max_liquidation_reward,
-        ) = call_erc7412(
-            self.snx,
-            self.market_proxy,
-            "getRequiredMargins",
-            (account_id,),
-            calls=calls,
-        )
+        ) = reads["getRequiredMargins"].result()
 
         if self.is_multicollateral:
-            collateral_ids = call_erc7412(
-                self.snx,
-                self.market_proxy,
-                "getAccountCollateralIds",
-                (account_id,),
-                calls=calls,
-            )
-            debt = call_erc7412(
-                self.snx,
-                self.market_proxy,
-                "debt",
-                (account_id,),
-                calls=calls,
-            )
+            collateral_ids = reads["getAccountCollateralIds"].result()
+            debt = reads["debt"].result()
 
             if len(collateral_ids) == 0:
                 collateral_amount_dict = {}
@@ -640,9 +678,40 @@ class PerpsV3(BasePerps):
             "max_liquidation_reward": wei_to_ether(max_liquidation_reward),
         }
 
+    def _get_collateral_names(self, market_ids: [int]):
+        """
+        Get the names of collateral types by their spot market id. The names
+        are read from the synth contracts the first time each id is seen, so
+        the spot module is not needed.
+
+        :param [int] market_ids: The spot market ids of the collateral types
+        :return: The name of each collateral type, keyed by market id
+        :rtype: dict
+        """
+        new_market_ids = [m for m in market_ids if m not in self._collateral_names]
+        if len(new_market_ids) > 0:
+            spot_proxy = self.snx.contracts["spotFactory"]["SpotMarketProxy"][
+                "contract"
+            ]
+            addresses = multicall_erc7412(
+                self.snx, spot_proxy, "getSynth", new_market_ids
+            )
+            market_names = batch_erc7412(
+                self.snx,
+                [
+                    (self.snx.contracts["common"]["ERC20"].at(address), "symbol", ())
+                    for address in addresses
+                ],
+            )
+            self._collateral_names.update(zip(new_market_ids, market_names))
+        return {
+            market_id: self._collateral_names[market_id] for market_id in market_ids
+        }
+
     def get_collateral_balances(self, account_id: int = None):
         """
-        Fetch the balance of each collateral type for an account.
+        Fetch the balance of each collateral type held by an account. The
+        balance of sUSD is always included.
 
         :param int | None account_id: The id of the account to fetch the collateral balances for. If not provided, the default account is used.
         :return: A dictionary with the collateral balances.
@@ -651,19 +720,22 @@ class PerpsV3(BasePerps):
         if not account_id:
             account_id = self.default_account_id
 
-        inputs = [(account_id, market_id) for market_id in self.snx.spot.markets_by_id]
+        collateral_ids = call_erc7412(
+            self.snx, self.market_proxy, "getAccountCollateralIds", account_id
+        )
+        market_ids = [0] + [market_id for market_id in collateral_ids if market_id != 0]
 
         # call for the balances
+        inputs = [(account_id, market_id) for market_id in market_ids]
         balances = multicall_erc7412(
             self.snx, self.market_proxy, "getCollateralAmount", inputs
         )
 
         # make a clean dictionary
+        market_names = self._get_collateral_names(market_ids)
         collateral_balances = {
-            self.snx.spot.markets_by_id[inputs[ind][1]]["market_name"]: wei_to_ether(
-                balance
-            )
-            for ind, balance in enumerate(balances)
+            market_names[market_id]: wei_to_ether(balance)
+            for market_id, balance in zip(market_ids, balances)
         }
         return collateral_balances
 
@@ -1121,7 +1193,8 @@ class PerpsV3(BasePerps):
     ):
         """
         Settles an order using ERC7412 by handling ``OracleDataRequired`` errors and forming a multicall.
-        If the order is not yet ready to be settled, this function will wait until the settlement time.
+        If the order is not yet ready to be settled, this function will wait until the settlement time,
+        while the Pyth update at the commitment price time is prefetched.
         If the transaction fails, this function will retry until the max number of tries is reached with a
         configurable delay.
 
@@ -1153,7 +1226,19 @@ class PerpsV3(BasePerps):
         elif settlement_time > now_time:
             duration = settlement_time - now_time
             self.logger.info(f"Waiting {round(duration, 4)} seconds to settle order")
-            time.sleep(duration)
+            if self.snx.is_fork:
+                time.sleep(duration)
+            else:
+                # the order is settled with the price at the commitment price time,
+                # so fetch its update while waiting for the settlement time
+                feed_ids = [encode_hex(settlement_strategy["feed_id"])]
+                publish_time = (
+                    order["commitment_time"]
+                    + settlement_strategy["commitment_price_delay"]
+                )
+                self.snx.pyth.prefetch(feed_ids, publish_time)
+                time.sleep(duration)
+                self.snx.pyth.wait_for_update(feed_ids, publish_time)
         elif expiration_time < now_time:
             raise ValueError(f"Order has expired for account {account_id}")
         else:
@@ -1232,12 +1317,14 @@ class BfPerps(BasePerps):
     :param Synthetix snx: An instance of the Synthetix class.
     :param Pyth pyth: An instance of the Pyth class.
     :param int | None default_account_id: The default ``account_id`` to use for transactions.
+    :param dict | None state: State saved by a previous run, used instead of fetching
+        the accounts and markets if it is still valid.
 
     :return: An instance of the Perps class.
     :rtype: Perps
     """
 
-    def __init__(self, snx, default_account_id: int = None):
+    def __init__(self, snx, default_account_id: int = None, state: dict = None):
         self.snx = snx
         self.logger = snx.logger
 
@@ -1251,18 +1338,72 @@ class BfPerps(BasePerps):
                 "PerpAccountProxy"
             ]["contract"]
 
-            try:
-                self.get_account_ids(default_account_id=default_account_id)
-            except Exception as e:
-                self.account_ids = []
-                self.default_account_id = None
-                self.logger.warning(f"Failed to fetch perps accounts: {e}")
+            if state is not None and restore_account_ids(
+                self, state, default_account_id
+            ):
+                self.logger.debug("Restored perps accounts from saved state")
+            else:
+                try:
+                    self.get_account_ids(default_account_id=default_account_id)
+                except Exception as e:
+                    self.account_ids = []
+                    self.default_account_id = None
+                    self.logger.warning(f"Failed to fetch perps accounts: {e}")
+
+            if state is not None and self._restore_markets(state):
+                self.logger.debug("Restored perps markets from saved state")
+            else:
+                try:
+                    self.get_markets()
+                    pass
+                except Exception as e:
+                    self.logger.warning(f"Failed to fetch markets: {e}")
+
+    def _get_state(self):
+        """Get the state to save for the next run"""
+        if "bfp_market_factory" not in self.snx.contracts:
+            return None
+        state = {"account_ids": self.account_ids}
+        if hasattr(self, "markets_by_id"):
+            state["market_meta"] = self.market_meta
+            state["markets_by_id"] = self.markets_by_id
+        return state
+
+    def _restore_markets(self, state: dict):
+        """
+        Restore the markets saved by a previous run. The markets are only used
+        if ``getActiveMarketIds`` returns the same market ids.
+
+        :param dict state: The saved state of the module
+        :return: ``True`` if the markets were restored
+        :rtype: bool
+        """
+        if "markets_by_id" not in state:
+            return False
+        try:
+            market_ids = call_prefetched(
+                self.snx, self.market_proxy, "getActiveMarketIds"
+            )
+        except Exception as e:
+            self.logger.debug(f"Failed to validate saved markets: {e}")
+            return False
 
-            try:
-                self.get_markets()
-                pass
-            except Exception as e:
-                self.logger.warning(f"Failed to fetch markets: {e}")
+        markets_by_id = int_keys(state["markets_by_id"])
+        if list(market_ids) != list(markets_by_id.keys()):
+            return False
+
+        self.market_meta = int_keys(state["market_meta"])
+        self.snx.pyth.update_price_feed_ids(
+            {
+                self.market_meta[market]["symbol"]: self.market_meta[market]["feed_id"]
+                for market in self.market_meta
+            }
+        )
+        self.markets_by_id = markets_by_id
+        self.markets_by_name = {
+            summary["market_name"]: summary for summary in markets_by_id.values()
+        }
+        return True
 
     def get_markets(self):
         """
@@ -1290,21 +1431,24 @@ class BfPerps(BasePerps):
         :return: Market summaries keyed by `market_id` and `market_name`.
         :rtype: (dict, dict)
         """
-        market_ids = self.market_proxy.functions.getActiveMarketIds().call()
+        market_ids = call_prefetched(self.snx, self.market_proxy, "getActiveMarketIds")
 
-        # get market configurations
-        market_digests = multicall_erc7412(
-            self.snx, self.market_proxy, "getMarketDigest", market_ids
-        )
-        market_config = call_erc7412(
-            self.snx,
-            self.market_proxy,
-            "getMarketConfiguration",
-            (),
-        )
-        market_configs = multicall_erc7412(
-            self.snx, self.market_proxy, "getMarketConfigurationById", market_ids
+        # get market digests and configurations in a single multicall
+        contract_calls = (
+            [(self.market_proxy, "getMarketConfiguration", ())]
+            + [
+                (self.market_proxy, "getMarketDigest", (market_id,))
+                for market_id in market_ids
+            ]
+            + [
+                (self.market_proxy, "getMarketConfigurationById", (market_id,))
+                for market_id in market_ids
+            ]
         )
+        results = batch_erc7412(self.snx, contract_calls)
+        market_config = results[0]
+        market_digests = results[1 : len(market_ids) + 1]
+        market_configs = results[len(market_ids) + 1 :]
 
         self.market_meta = {
             market_id: {
@@ -1746,10 +1890,15 @@ class BfPerps(BasePerps):
         commitment_time = order["commitment_time"]
         publish_time = commitment_time + min_publish_delay
 
+        # if the publish time has passed, the update is fetched right away
         wait_amount = publish_time - time.time()
         if wait_amount > 0:
             self.logger.info(f"Waiting {wait_amount} seconds to settle order")
-            time.sleep(wait_amount)
+            if self.snx.is_fork:
+                time.sleep(wait_amount)
+            else:
+                # fetch the update for the settlement as soon as it is available
+                self.snx.pyth.wait_for_update([pyth_price_feed_id], publish_time)
 
         for attempt in range(max_attempts):
             try:
@@ -1,3 +1,5 @@
 from .pyth import Pyth
+from .prefetch import PythPrefetcher
+from .stream import PythStream
 
-__all__ = ['Pyth']
+__all__ = ['Pyth', 'PythPrefetcher', 'PythStream']
@@ -0,0 +1,108 @@
+"""Module tracking the health of Pyth price service endpoints."""
+
+import time
+import threading
+from ..constants import DEFAULT_PYTH_HEDGE_AFTER
+
+# consecutive failures before an endpoint is skipped
+CIRCUIT_FAILURE_THRESHOLD = 3
+
+# time in seconds an endpoint is skipped before it is tried again
+CIRCUIT_RESET_TIMEOUT = 30
+
+# weight of the latest request in the moving averages
+HEALTH_ALPHA = 0.2
+
+
+class PythEndpoint:
+    """
+    A Pyth price service endpoint, with a health score and a circuit breaker.
+
+    The score is a moving average of the share of successful requests, reduced
+    for an endpoint that is usually slower than ``hedge_after``. After
+    ``CIRCUIT_FAILURE_THRESHOLD`` consecutive failures the circuit opens, and
+    the endpoint is skipped for ``CIRCUIT_RESET_TIMEOUT`` seconds. After that,
+    it is tried again, and the circuit closes on the first success or opens
+    again on a failure.
+
+    :param str url: The base url of the price service
+    :param float hedge_after: The latency in seconds considered slow
+    """
+
+    def __init__(self, url: str, hedge_after: float = DEFAULT_PYTH_HEDGE_AFTER):
+        self.url = url.rstrip("/")
+        self.hedge_after = hedge_after
+
+        self.success_rate = 1.0
+        self.latency = None
+        self.failures = 0
+        self.opened_at = None
+        self._lock = threading.Lock()
+
+    @property
+    def is_open(self) -> bool:
+        """``True`` if the circuit is open and the endpoint is skipped"""
+        return (
+            self.opened_at is not None
+            and time.time() - self.opened_at < CIRCUIT_RESET_TIMEOUT
+        )
+
+    @property
+    def score(self) -> float:
+        """The health score of the endpoint, between 0 and 1"""
+        if self.latency is None or self.latency <= self.hedge_after:
+            return self.success_rate
+        return self.success_rate * self.hedge_after / self.latency
+
+    def record(self, seconds: float, success: bool):
+        """
+        Record the result of a request to the endpoint.
+
+        :param float seconds: The time the request took
+        :param bool success: If the endpoint returned a valid response
+        """
+        with self._lock:
+            self.success_rate += HEALTH_ALPHA * (int(success) - self.success_rate)
+            if not success:
+                self.failures += 1
+                if self.failures >= CIRCUIT_FAILURE_THRESHOLD or self.opened_at:
+                    self.opened_at = time.time()
+                return
+
+            self.failures = 0
+            self.opened_at = None
+            if self.latency is None:
+                self.latency = seconds
+            else:
+                self.latency += HEALTH_ALPHA * (seconds - self.latency)
+
+    def get_health(self) -> dict:
+        """
+        Get the health of the endpoint.
+
+        :return: The ``score``, ``success_rate``, average ``latency`` in
+            seconds, and whether the circuit ``is_open``
+        :rtype: dict
+        """
+        return {
+            "score": self.score,
+            "success_rate": self.success_rate,
+            "latency": self.latency,
+            "is_open": self.is_open,
+        }
+
+
+def sort_endpoints(endpoints: [PythEndpoint]) -> [PythEndpoint]:
+    """
+    Order endpoints by health, skipping endpoints with an open circuit. If
+    every circuit is open, all endpoints are returned so requests are still
+    attempted. Endpoints with the same score keep their configured order.
+
+    :param [PythEndpoint] endpoints: The configured endpoints
+    :return: The endpoints to try, in order
+    :rtype: [PythEndpoint]
+    """
+    available = [endpoint for endpoint in endpoints if not endpoint.is_open]
+    if len(available) == 0:
+        available = list(endpoints)
+    return sorted(available, key=lambda endpoint: -round(endpoint.score, 2))
@@ -0,0 +1,187 @@
+"""Module for prefetching Pyth updates at future publish times in a background thread."""
+
+import time
+import heapq
+import threading
+from concurrent.futures import Future
+
+# time in seconds after a publish time before the update is fetched
+DEFAULT_PREFETCH_DELAY = 0.5
+
+# time in seconds between fetches while the price service does not have an update
+PREFETCH_RETRY_INTERVAL = 0.25
+
+# time in seconds after a publish time before a prefetch is given up
+PREFETCH_EXPIRE_AFTER = 60
+
+
+class PythPrefetcher:
+    """
+    Fetch Pyth updates at future publish times in a background thread, as soon
+    as the price service can serve them. Targets at the same publish time are
+    fetched with one request, and the updates are kept in the cache of the
+    ``Pyth`` class, so settling an order does not wait for a request::
+
+        >>> future = snx.pyth.prefetch(['0x12345...'], publish_time)
+        >>> future.result()
+        {'price_update_data': [b'...'], 'meta': {...}}
+
+    Each target is fetched ``delay`` seconds after its publish time, and fetched
+    again every ``PREFETCH_RETRY_INTERVAL`` seconds until the update is
+    available, for up to ``PREFETCH_EXPIRE_AFTER`` seconds.
+
+    :param Pyth pyth: Pyth class instance
+    :param float delay: Time in seconds after a publish time to fetch it
+    """
+
+    def __init__(self, pyth, delay: float = DEFAULT_PREFETCH_DELAY):
+        self.pyth = pyth
+        self.logger = pyth.logger
+        self.delay = delay
+
+        self.num_fetches = 0
+        self._targets = {}
+        self._schedule = []
+        self._condition = threading.Condition()
+        self._stop = False
+        self._thread = None
+
+    def add(self, feed_ids: [str], publish_time: int) -> Future:
+        """
+        Schedule a fetch of the updates of feeds at a publish time.
+
+        :param [str] feed_ids: List of feed ids to fetch
+        :param int publish_time: The publish time
+        :return: A future resolving to the price data of the feeds
+        :rtype: Future
+        """
+        future = Future()
+        target = {
+            "publish_time": publish_time,
+            "feed_ids": list(dict.fromkeys(feed_ids)),
+            "futures": [(feed_ids, future)],
+        }
+        self._schedule_target(target, publish_time + self.delay)
+        self.start()
+        return future
+
+    def _schedule_target(self, target: dict, due_time: float):
+        "Schedule a target, merging it with a pending target at the same publish time"
+        with self._condition:
+            pending = self._targets.get(target["publish_time"])
+            if pending is not None:
+                for feed_id in target["feed_ids"]:
+                    if feed_id not in pending["feed_ids"]:
+                        pending["feed_ids"].append(feed_id)
+                pending["futures"].extend(target["futures"])
+                return
+
+            self._targets[target["publish_time"]] = target
+            heapq.heappush(self._schedule, (due_time, target["publish_time"]))
+            self._condition.notify()
+
+    @property
+    def num_pending(self) -> int:
+        """The number of publish times waiting to be fetched"""
+        with self._condition:
+            return len(self._targets)
+
+    def start(self):
+        """Start the background thread"""
+        with self._condition:
+            if self._thread is not None and self._thread.is_alive():
+                return
+
+            self._stop = False
+            self._thread = threading.Thread(
+                target=self._run, name="pyth-prefetch", daemon=True
+            )
+            self._thread.start()
+
+    def stop(self, timeout: float = 5):
+        """
+        Stop the background thread, and cancel the pending targets.
+
+        :param float timeout: Time in seconds to wait for the thread to stop
+        """
+        with self._condition:
+            self._stop = True
+            targets = list(self._targets.values())
+            self._targets = {}
+            self._schedule = []
+            self._condition.notify()
+
+        for target in targets:
+            for _, future in target["futures"]:
+                future.cancel()
+        if self._thread is not None:
+            self._thread.join(timeout)
+
+    def _run(self):
+        "Fetch each target once it is due"
+        while True:
+            with self._condition:
+                while not self._stop and (
+                    len(self._schedule) == 0 or self._schedule[0][0] > time.time()
+                ):
+                    timeout = (
+                        self._schedule[0][0] - time.time() if self._schedule else None
+                    )
+                    self._condition.wait(timeout)
+                if self._stop:
+                    return
+
+                _, publish_time = heapq.heappop(self._schedule)
+                target = self._targets.pop(publish_time)
+
+            try:
+                self._fetch(target)
+            except Exception as e:
+                self.logger.warning(f"Pyth prefetch at {publish_time} failed: {e}")
+                self._resolve(target, error=e)
+
+    def _fetch(self, target: dict):
+        """
+        Fetch the updates of a target, and resolve its futures. If the update
+        is not available yet, the target is scheduled again until it expires.
+
+        :param dict target: The target to fetch
+        """
+        publish_time = target["publish_time"]
+        self.num_fetches += 1
+        pyth_data = self.pyth.get_price_from_ids(
+            target["feed_ids"], publish_time=publish_time
+        )
+        if pyth_data is not None:
+            self.logger.debug(
+                f"Prefetched Pyth data for {len(target['feed_ids'])} feeds @ {publish_time}"
+            )
+            self._resolve(target)
+        elif time.time() < publish_time + PREFETCH_EXPIRE_AFTER:
+            self._schedule_target(target, time.time() + PREFETCH_RETRY_INTERVAL)
+        else:
+            self._resolve(
+                target,
+                error=Exception(f"Pyth data @ {publish_time} is not available"),
+            )
+
+    def _resolve(self, target: dict, error: Exception = None):
+        """
+        Resolve the futures of a target with the price data of their feeds,
+        which is built from the cache of the ``Pyth`` class.
+
+        :param dict target: The fetched target
+        :param Exception error: The error to resolve the futures with
+        """
+        for feed_ids, future in target["futures"]:
+            if future.done():
+                continue
+            if error is not None:
+                future.set_exception(error)
+                continue
+
+            future.set_result(
+                self.pyth.get_price_from_ids(
+                    feed_ids, publish_time=target["publish_time"]
+                )
+            )
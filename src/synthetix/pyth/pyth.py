@@ -1,8 +1,98 @@
 """Module initializing a connection to the Pyth price service."""
 
+import os
+import re
+import json
 import time
-import requests
-from eth_utils import decode_hex
+import asyncio
+import threading
+from collections import OrderedDict
+from concurrent.futures import FIRST_COMPLETED, Future, ThreadPoolExecutor, wait
+from eth_utils import decode_hex, encode_hex
+from ..constants import (
+    DEFAULT_PRICE_SERVICE_ENDPOINT,
+    DEFAULT_PYTH_COALESCE_WINDOW,
+    DEFAULT_PYTH_HEDGE_AFTER,
+)
+from ..utils.cache import read_json_cache, write_json_cache
+from ..utils.http import get_http
+from .endpoints import PythEndpoint, sort_endpoints
+from .prefetch import PythPrefetcher
+from .stream import DEFAULT_STREAM_STALE_AFTER, PythStream
+
+# magic bytes of a Pyth accumulator update
+ACCUMULATOR_MAGIC = b"PNAU"
+
+# accumulator updates with a Wormhole merkle proof
+UPDATE_TYPE_WORMHOLE_MERKLE = 0
+
+# time in seconds to remember feeds that the price service does not have
+MISSING_FEED_TTL = 3600
+
+# number of updates at a publish time kept in memory
+MAX_HISTORY_ENTRIES = 1000
+
+# time in seconds after a publish time to wait for a prefetched update
+PREFETCH_WAIT_TIMEOUT = 10
+
+
+def split_accumulator_update(data: bytes):
+    """
+    Split a Pyth accumulator update into the header with the Wormhole VAA,
+    and the update of each price feed with its merkle proof. The header can be
+    joined with any subset of the updates to make a smaller update.
+
+    :param bytes data: The accumulator update
+    :return: The header, and the update of each feed id, or ``None`` if the
+        data is not an accumulator update
+    :rtype: (bytes, dict) | None
+    """
+    try:
+        if data[:4] != ACCUMULATOR_MAGIC:
+            return None
+
+        # skip the version and trailing header
+        offset = 7 + data[6]
+        if data[offset] != UPDATE_TYPE_WORMHOLE_MERKLE:
+            return None
+
+        vaa_size = int.from_bytes(data[offset + 1 : offset + 3], "big")
+        offset += 3 + vaa_size
+        header = data[:offset]
+
+        updates = {}
+        num_updates = data[offset]
+        offset += 1
+        for _ in range(num_updates):
+            start = offset
+            message_size = int.from_bytes(data[offset : offset + 2], "big")
+            message = data[offset + 2 : offset + 2 + message_size]
+            offset += 2 + message_size
+
+            # each proof is a list of 20 byte hashes
+            offset += 1 + 20 * data[offset]
+            updates[encode_hex(message[1:33])] = data[start:offset]
+
+        if offset != len(data):
+            return None
+        return header, updates
+    except IndexError:
+        return None
+
+
+def join_accumulator_updates(header: bytes, updates: list):
+    """
+    Join the header of an accumulator update with a list of feed updates.
+
+    :param bytes header: The header with the Wormhole VAA
+    :param [bytes] updates: The update of each feed
+    :return: The accumulator updates, with at most 255 feeds each
+    :rtype: [bytes]
+    """
+    return [
+        header + bytes([len(updates[i : i + 255])]) + b"".join(updates[i : i + 255])
+        for i in range(0, len(updates), 255)
+    ]
 
 
 class Pyth:
@@ -19,6 +109,37 @@ class Pyth:
     If an endpoint isn't specified, the default endpoint is used. The default
     endpoint should be considered unreliable for production applications.
 
+    A list of endpoints can be specified to hedge requests. A request is sent
+    to the healthiest endpoint, and if it has not responded after
+    ``hedge_after`` seconds, or it fails, the request is also sent to the next
+    endpoint. The first valid response is used. Each endpoint has a health
+    score and a circuit breaker, so an endpoint that keeps failing is skipped
+    for a while::
+
+        snx = Synthetix(
+            ...,
+            price_service_endpoint=[
+                'https://hermes.pyth.network',
+                'https://my-hermes.example.com',
+            ],
+        )
+
+    Latest prices are cached per feed for ``cache_ttl`` seconds. A request is
+    built from the cached feeds, using only their part of each accumulator
+    update, and only the feeds that are not cached are fetched. Feeds that the
+    price service does not have are remembered and skipped. Updates for a
+    ``publish_time`` never change, so they are cached in the ``pyth``
+    directory of ``cache_dir`` and shared by every process using it.
+
+    Threads fetching the latest prices at the same time share one request.
+    Feeds that another thread is fetching are waited for, and fetches started
+    within ``coalesce_window`` seconds of each other are merged into one
+    request for all of their feeds.
+
+    Updates at a future publish time, such as the update needed to settle an
+    order, can be prefetched with ``prefetch``. A background thread fetches
+    them as soon as the price service can serve them, and keeps them in memory.
+
     The ``Pyth`` class is used to fetch the latest price update data for a list
     of tokens or feed ids::
 
@@ -26,52 +147,376 @@ class Pyth:
         price_data_id = snx.pyth.get_price_from_ids(['0x12345...', '0xabcde...'])
 
     :param Synthetix snx: Synthetix class instance
-    :param str price_service_endpoint: Pyth price service endpoint
+    :param str | [str] price_service_endpoint: Pyth price service endpoint, or
+        a list of endpoints in order of preference
     :param int cache_ttl: Cache time-to-live in seconds
+    :param float hedge_after: Time in seconds before a request is also sent
+        to the next endpoint
+    :param float coalesce_window: Time in seconds to wait for other threads
+        to join a fetch of the latest prices
     :return: Pyth class instance
     :rtype: Pyth
     """
 
-    def __init__(self, snx, cache_ttl, price_service_endpoint: str = None):
+    def __init__(
+        self,
+        snx,
+        cache_ttl,
+        price_service_endpoint: str | list = None,
+        hedge_after: float = DEFAULT_PYTH_HEDGE_AFTER,
+        coalesce_window: float = DEFAULT_PYTH_COALESCE_WINDOW,
+    ):
         self.snx = snx
         self.logger = snx.logger
 
-        self._price_service_endpoint = price_service_endpoint
+        # set up the endpoints, with the first as the primary endpoint
+        if not price_service_endpoint:
+            price_service_endpoint = DEFAULT_PRICE_SERVICE_ENDPOINT
+        if isinstance(price_service_endpoint, str):
+            price_service_endpoint = [price_service_endpoint]
+        self.hedge_after = hedge_after
+        self.endpoints = [
+            PythEndpoint(url, hedge_after=hedge_after)
+            for url in dict.fromkeys(price_service_endpoint)
+        ]
+        self._price_service_endpoint = self.endpoints[0].url
+        self._executor = None
+
         self.price_feed_ids = {}
         self.symbol_lookup = {}
 
-        # set up a cache
+        # set up a cache of each feed, and of feeds that were not found
         self.cache_ttl = cache_ttl
         self._cache = {}
+        self._missing_feed_ids = {}
+        self._history = OrderedDict()
+        self._lock = threading.RLock()
+        self.stream = None
+        self.prefetcher = None
+
+        # fetches of the latest prices shared by concurrent threads
+        self.coalesce_window = coalesce_window
+        self._inflight = {}
+        self._batch = None
 
-    def _check_cache(self, feed_ids: [str]):
+    def _get_cache_entries(self, feed_ids: [str]):
         """
-        Check the cache for the latest price data for a list of feed ids. The cache
-        is used to store the latest price data for a list of feed ids. The cache
-        is invalidated after a certain time-to-live.
+        Get the fresh cache entries for a list of feed ids. Expired entries are
+        removed. Entries that can not be split from the other feeds fetched with
+        them are only used if all of those feeds are requested.
 
-        :param [str] feed_ids: List of feed ids to fetch data for
-        :return: Cached price data
-        :rtype: dict | None
+        :param [str] feed_ids: List of feed ids to look up
+        :return: The cache entry of each cached feed id
+        :rtype: dict
         """
-        self._purge_cache()
-        cache_key = ",".join(sorted(feed_ids))
-        if cache_key in self._cache:
-            cache_data = self._cache[cache_key]
-            if int(time.time()) - cache_data["timestamp"] < self.cache_ttl:
-                return cache_data
-        return None
+        now = int(time.time())
+        requested = set(feed_ids)
+        entries = {}
+        with self._lock:
+            for feed_id in dict.fromkeys(feed_ids):
+                entry = self._cache.get(feed_id)
+                if entry is None:
+                    continue
+                if now - entry["timestamp"] >= entry.get("ttl", self.cache_ttl):
+                    self._cache.pop(feed_id, None)
+                    continue
+                if "feed_ids" in entry and not set(entry["feed_ids"]) <= requested:
+                    continue
+                entries[feed_id] = entry
+        return entries
+
+    def _update_cache(self, entries: dict):
+        """
+        Add entries to the cache of latest prices.
 
-    def _purge_cache(self):
+        :param dict entries: The cache entry of each feed id
         """
-        Purge the cache of all data that is past the time-to-live.
+        with self._lock:
+            self._cache.update(entries)
+
+    def _build_price_data(self, entries: dict):
         """
-        self._cache = {
-            k: v
-            for k, v in self._cache.items()
-            if int(time.time()) - v["timestamp"] < self.cache_ttl
+        Build the price data for a request from cache entries. The updates of
+        feeds that share an accumulator header are joined into one update.
+
+        :param dict entries: The cache entry of each feed id
+        :return: Dictionary with price update data and metadata
+        :rtype: dict | None
+        """
+        if len(entries) == 0:
+            return None
+
+        updates = {}
+        price_update_data = []
+        fetches = set()
+        for entry in entries.values():
+            if "update" in entry:
+                updates.setdefault(entry["header"], []).append(entry["update"])
+            elif id(entry["price_update_data"]) not in fetches:
+                # feeds from the same fetch share their price update data
+                fetches.add(id(entry["price_update_data"]))
+                price_update_data.extend(entry["price_update_data"])
+
+        for header, feed_updates in updates.items():
+            price_update_data.extend(join_accumulator_updates(header, feed_updates))
+
+        return {
+            "timestamp": min(entry["timestamp"] for entry in entries.values()),
+            "price_update_data": price_update_data,
+            "meta": {feed_id: entry["meta"] for feed_id, entry in entries.items()},
         }
 
+    def _get_feed_entries(self, pyth_data: dict):
+        """
+        Get a cache entry for each feed of fetched price data. Accumulator
+        updates are split by feed, otherwise each feed is cached with the full
+        update.
+
+        :param dict pyth_data: Dictionary with price update data and metadata
+        :return: The cache entry of each feed id
+        :rtype: dict
+        """
+        feed_updates = {}
+        can_split = True
+        for data in pyth_data["price_update_data"]:
+            split = split_accumulator_update(data)
+            if split is None:
+                can_split = False
+                break
+
+            header, updates = split
+            for feed_id, update in updates.items():
+                feed_updates[feed_id] = (header, update)
+        can_split = can_split and all(
+            feed_id in feed_updates for feed_id in pyth_data["meta"]
+        )
+
+        entries = {}
+        for feed_id, meta in pyth_data["meta"].items():
+            entry = {"timestamp": pyth_data["timestamp"], "meta": meta}
+            if can_split:
+                entry["header"], entry["update"] = feed_updates[feed_id]
+            else:
+                entry["price_update_data"] = pyth_data["price_update_data"]
+                entry["feed_ids"] = list(pyth_data["meta"])
+            entries[feed_id] = entry
+        return entries
+
+    def _get_history_path(self, feed_id: str, publish_time: int):
+        """
+        Get the path of the cached update of a feed at a publish time, or
+        ``None`` if there is no cache directory or the feed id is not a 32 byte
+        hex string.
+
+        :param str feed_id: The feed id
+        :param int publish_time: The publish time
+        :return: The path of the cache file
+        :rtype: str | None
+        """
+        cache_dir = getattr(self.snx, "cache_dir", None)
+        if cache_dir is None or not re.fullmatch(r"(0x)?[0-9a-fA-F]{64}", feed_id):
+            return None
+        return os.path.join(cache_dir, "pyth", feed_id, f"{publish_time}.json")
+
+    def _remember_history_entry(self, feed_id: str, publish_time: int, entry: dict):
+        """
+        Keep the update of a feed at a publish time in memory, dropping the
+        oldest updates once there are more than ``MAX_HISTORY_ENTRIES``.
+
+        :param str feed_id: The feed id
+        :param int publish_time: The publish time
+        :param dict entry: The cache entry of the feed
+        """
+        with self._lock:
+            self._history[(feed_id, publish_time)] = entry
+            while len(self._history) > MAX_HISTORY_ENTRIES:
+                self._history.popitem(last=False)
+
+    def _get_history_entries(self, feed_ids: [str], publish_time: int):
+        """
+        Read the cached updates of feeds at a publish time, from memory or the
+        cache directory. Updates read from the cache directory are kept in
+        memory for the next read. An update for a publish time never changes,
+        so the entries do not expire.
+
+        :param [str] feed_ids: List of feed ids to look up
+        :param int publish_time: The publish time
+        :return: The cache entry of each cached feed id
+        :rtype: dict
+        """
+        entries = {}
+        for feed_id in dict.fromkeys(feed_ids):
+            with self._lock:
+                entry = self._history.get((feed_id, publish_time))
+            if entry is not None:
+                entries[feed_id] = entry
+                continue
+
+            path = self._get_history_path(feed_id, publish_time)
+            entry = read_json_cache(path) if path is not None else None
+            if entry is None:
+                continue
+            entry["header"] = decode_hex(entry["header"])
+            entry["update"] = decode_hex(entry["update"])
+            self._remember_history_entry(feed_id, publish_time, entry)
+            entries[feed_id] = entry
+        return entries
+
+    def _add_history_entries(self, entries: dict, pyth_data: dict, publish_time: int):
+        """
+        Add fetched price data at a publish time to the memory and directory
+        caches, and to a dictionary of entries. Updates that can not be split by
+        feed are only added to the dictionary.
+
+        :param dict entries: The cache entry of each feed id
+        :param dict pyth_data: Dictionary with price update data and metadata
+        :param int publish_time: The publish time
+        """
+        for feed_id, entry in self._get_feed_entries(pyth_data).items():
+            entries[feed_id] = entry
+            if "update" not in entry:
+                continue
+
+            self._remember_history_entry(feed_id, publish_time, entry)
+
+            path = self._get_history_path(feed_id, publish_time)
+            if path is None:
+                continue
+
+            try:
+                write_json_cache(
+                    path,
+                    {
+                        **entry,
+                        "header": encode_hex(entry["header"]),
+                        "update": encode_hex(entry["update"]),
+                    },
+                )
+            except OSError as e:
+                self.logger.debug(f"Failed to cache Pyth data: {e}")
+
+    def _normalize_feed_ids(self, feed_ids: [str]):
+        """
+        Normalize feed ids to lowercase hex strings with a ``0x`` prefix, as
+        the price service returns them. The caches are keyed by these ids.
+
+        :param [str] feed_ids: List of feed ids
+        :return: The normalized feed ids
+        :rtype: [str]
+        """
+        return [f"0x{feed_id.lower().removeprefix('0x')}" for feed_id in feed_ids]
+
+    def _remove_missing_feed_ids(self, feed_ids: [str]):
+        """
+        Remove the feed ids that the price service recently did not have.
+
+        :param [str] feed_ids: List of feed ids
+        :return: The feed ids that are not known to be missing
+        :rtype: [str]
+        """
+        now = int(time.time())
+        found_feed_ids = [
+            feed_id
+            for feed_id in feed_ids
+            if now - self._missing_feed_ids.get(feed_id, 0) >= MISSING_FEED_TTL
+        ]
+        if len(found_feed_ids) != len(feed_ids):
+            self.logger.debug(
+                f"Skipping missing price feeds: {set(feed_ids) - set(found_feed_ids)}"
+            )
+        return found_feed_ids
+
+    def start_stream(
+        self,
+        feed_ids: [str] = None,
+        stale_after: int = DEFAULT_STREAM_STALE_AFTER,
+    ):
+        """
+        Start streaming the latest prices from the price service in a background
+        thread. Streamed prices are kept in memory, so ``get_price_from_ids``
+        does not need a request for them. If the stream stops, requests fall
+        back to fetching prices until it reconnects::
+
+            >>> snx.pyth.start_stream()
+            >>> snx.pyth.get_price_from_symbols(["ETH", "BTC"])
+
+        :param [str] feed_ids: List of feed ids to stream. Defaults to every
+            feed in ``price_feed_ids``
+        :param int stale_after: Time in seconds a streamed price is used for
+        :return: The stream
+        :rtype: PythStream
+        """
+        if feed_ids is None:
+            feed_ids = list(self.price_feed_ids.values())
+        if len(feed_ids) == 0:
+            raise ValueError("No price feeds to stream")
+
+        self.stop_stream()
+        self.stream = PythStream(self, feed_ids, stale_after=stale_after)
+        self.stream.start()
+        return self.stream
+
+    def stop_stream(self):
+        """Stop streaming prices, if a stream was started"""
+        if self.stream is not None:
+            self.stream.stop()
+            self.stream = None
+
+    def prefetch(self, feed_ids: [str], publish_time: int):
+        """
+        Fetch the updates of feeds at a future publish time in a background
+        thread, as soon as the price service can serve them. Once fetched,
+        ``get_price_from_ids`` with the same publish time answers from memory::
+
+            >>> future = snx.pyth.prefetch(['0x12345...'], publish_time)
+            >>> pyth_data = future.result()
+
+        :param [str] feed_ids: List of feed ids to fetch
+        :param int publish_time: The publish time
+        :return: A future resolving to the price data of the feeds
+        :rtype: concurrent.futures.Future
+        """
+        with self._lock:
+            if self.prefetcher is None:
+                self.prefetcher = PythPrefetcher(self)
+        return self.prefetcher.add(self._normalize_feed_ids(feed_ids), publish_time)
+
+    def wait_for_update(
+        self,
+        feed_ids: [str],
+        publish_time: int,
+        timeout: float = PREFETCH_WAIT_TIMEOUT,
+    ):
+        """
+        Prefetch the updates of feeds at a publish time, and wait until they
+        are fetched. Returns ``None`` if the updates are not fetched within
+        ``timeout`` seconds after the publish time, so the caller can fetch
+        them again. Does not return before the publish time.
+
+        :param [str] feed_ids: List of feed ids to fetch
+        :param int publish_time: The publish time
+        :param float timeout: Time in seconds after the publish time to wait
+        :return: Dictionary with price update data and metadata
+        :rtype: dict | None
+        """
+        future = self.prefetch(feed_ids, publish_time)
+        try:
+            return future.result(max(publish_time - time.time(), 0) + timeout)
+        except BaseException as e:
+            self.logger.warning(f"Pyth data @ {publish_time} was not prefetched: {e}")
+
+            # do not return early if the prefetch was cancelled
+            wait_amount = publish_time - time.time()
+            if wait_amount > 0:
+                time.sleep(wait_amount)
+            return None
+
+    def stop_prefetch(self):
+        """Stop prefetching updates, if a prefetch was started"""
+        if self.prefetcher is not None:
+            self.prefetcher.stop()
+            self.prefetcher = None
+
     def update_price_feed_ids(self, feed_ids: dict):
         """
         Update the price feed IDs for the Pyth price service.
@@ -84,17 +529,16 @@ class Pyth:
         # reverse it and set a lookup from feed_id to symbol
         self.symbol_lookup = {v: k for k, v in self.price_feed_ids.items()}
 
-    def _fetch_prices(self, feed_ids: [str], publish_time: int | None = None):
+    def _get_price_request(self, feed_ids: [str], publish_time: int | None = None):
         """
-        An internal method for fetching price data from the Pyth price service. This
-        method is used by the public methods ``get_price_from_ids`` and
-        ``get_price_from_symbols``. The method fetches the latest price data for a list
-        of feed ids, deciding which endpoint to use based on the presence of a publish time.
+        Log a price fetch and get the path and query parameters of the request
+        to the Pyth price service, deciding which route to use based on the
+        presence of a publish time.
 
         :param [str] feed_ids: List of feed ids to fetch data for
         :param int publish_time: Publish time for benchmark data
-        :return: List of price update data
-        :rtype: [bytes] | None
+        :return: The path and a list of query parameters
+        :rtype: (str, list)
         """
         market_names = ",".join(
             [
@@ -109,64 +553,386 @@ class Pyth:
 
         self.logger.debug(f"Fetching data for feed ids: {feed_ids}")
 
-        params = {"ids[]": feed_ids, "encoding": "hex"}
+        params = [("ids[]", feed_id) for feed_id in feed_ids] + [("encoding", "hex")]
         if publish_time is None:
             # fetch latest data
-            url = f"{self._price_service_endpoint}/v2/updates/price/latest"
+            path = "/v2/updates/price/latest"
         else:
             # fetch benchmark data
-            url = f"{self._price_service_endpoint}/v2/updates/price/{publish_time}"
+            path = f"/v2/updates/price/{publish_time}"
+        return path, params
 
+    def get_endpoint_health(self) -> dict:
+        """
+        Get the health of each price service endpoint::
+
+            >>> snx.pyth.get_endpoint_health()
+            {'https://hermes.pyth.network': {'score': 1.0, 'success_rate': 1.0, 'latency': 0.12, 'is_open': False}}
+
+        :return: A dictionary of endpoint url to its health
+        :rtype: dict
+        """
+        return {endpoint.url: endpoint.get_health() for endpoint in self.endpoints}
+
+    def _is_valid_response(self, status: int, response_text: str) -> bool:
+        """
+        Check if a response is an answer from the price service. A response for
+        missing feeds is valid, since it is handled by fetching the other feeds.
+
+        :param int status: The status of the response
+        :param str response_text: The body of the response
+        :return: ``True`` if the response is valid
+        :rtype: bool
+        """
+        return status == 200 or "Price ids not found" in response_text
+
+    def _request_endpoint(self, endpoint: PythEndpoint, path: str, params: list):
+        """
+        Send a request to one endpoint, and record the result in its health.
+
+        :param PythEndpoint endpoint: The endpoint
+        :param str path: The path of the request
+        :param list params: The query parameters
+        :return: The status and body of a valid response
+        :rtype: (int, str)
+        """
+        start = time.perf_counter()
         try:
-            response = requests.get(url, params, timeout=10)
-            if response.status_code != 200:
-                if response.text and "Price ids not found" in response.text:
-                    self.logger.info(f"Removing missing price feeds: {response.text}")
-                    feed_ids = [
-                        feed_id for feed_id in feed_ids if feed_id not in response.text
-                    ]
-                    return self._fetch_prices(feed_ids, publish_time=publish_time)
-
-                self.logger.error(f"Error fetching latest price data: {response.text}")
-                return None
+            response = get_http(self.snx).get(f"{endpoint.url}{path}", params)
+            status, response_text = response.status_code, response.text
+        except Exception:
+            endpoint.record(time.perf_counter() - start, False)
+            raise
 
-            response_data = response.json()
+        is_valid = self._is_valid_response(status, response_text)
+        endpoint.record(time.perf_counter() - start, is_valid)
+        if not is_valid:
+            raise Exception(f"Status {status} from {endpoint.url}: {response_text}")
+        return status, response_text
 
-            # decode the price data
-            price_update_data = [
-                decode_hex(f"0x{raw_pud}")
-                for raw_pud in response_data["binary"]["data"]
-            ]
+    def _request_prices(self, path: str, params: list):
+        """
+        Send a request to the price service endpoints, in order of health. The
+        request is sent to the next endpoint if the previous ones fail, or have
+        not responded after ``hedge_after`` seconds, and the first valid
+        response is returned.
 
-            # enrich some metadata
-            meta = {
-                f"0x{feed_data['id']}": {
-                    "symbol": (
-                        self.symbol_lookup[f"0x{feed_data['id']}"]
-                        if f"0x{feed_data['id']}" in self.symbol_lookup
-                        else "N/A"
-                    ),
-                    "price": int(feed_data["price"]["price"])
-                    * 10 ** feed_data["price"]["expo"],
-                    "publish_time": feed_data["price"]["publish_time"],
-                }
-                for feed_data in response_data["parsed"]
-            }
+        :param str path: The path of the request
+        :param list params: The query parameters
+        :return: The status and body of a valid response
+        :rtype: (int, str)
+        """
+        endpoints = sort_endpoints(self.endpoints)
+        if len(endpoints) == 1:
+            return self._request_endpoint(endpoints[0], path, params)
+
+        if self._executor is None:
+            self._executor = ThreadPoolExecutor(
+                max_workers=4 * len(self.endpoints), thread_name_prefix="pyth"
+            )
+
+        # each round sends to the next endpoint, until a valid response arrives
+        pending = set()
+        num_sent = 0
+        last_error = None
+        while num_sent < len(endpoints) or len(pending) > 0:
+            if num_sent < len(endpoints):
+                if num_sent > 0:
+                    self.logger.debug(
+                        f"Hedging Pyth request to {endpoints[num_sent].url}"
+                    )
+                pending.add(
+                    self._executor.submit(
+                        self._request_endpoint, endpoints[num_sent], path, params
+                    )
+                )
+                num_sent += 1
+
+            # wait for a response, a failure, or the time to hedge
+            timeout = self.hedge_after if num_sent < len(endpoints) else None
+            done, pending = wait(pending, timeout, return_when=FIRST_COMPLETED)
+            for future in done:
+                try:
+                    return future.result()
+                except Exception as err:
+                    self.logger.warning(f"Pyth price service request failed: {err}")
+                    last_error = err
+        raise Exception(f"All Pyth price service endpoints failed: {last_error}")
+
+    async def _request_endpoint_async(
+        self, session, endpoint: PythEndpoint, path: str, params: list
+    ):
+        """
+        Async version of ``_request_endpoint``.
+
+        :param aiohttp.ClientSession session: The session to send the request with
+        :param PythEndpoint endpoint: The endpoint
+        :param str path: The path of the request
+        :param list params: The query parameters
+        :return: The status and body of a valid response
+        :rtype: (int, str)
+        """
+        url = f"{endpoint.url}{path}"
+        start = time.perf_counter()
+        try:
+            async with session.get(url, params=params) as response:
+                status = response.status
+                response_text = await response.text()
+        except Exception:
+            get_http(self.snx).record(url, time.perf_counter() - start, True)
+            endpoint.record(time.perf_counter() - start, False)
+            raise
+
+        is_valid = self._is_valid_response(status, response_text)
+        get_http(self.snx).record(url, time.perf_counter() - start, status >= 400)
+        endpoint.record(time.perf_counter() - start, is_valid)
+        if not is_valid:
+            raise Exception(f"Status {status} from {endpoint.url}: {response_text}")
+        return status, response_text
+
+    async def _request_prices_async(self, path: str, params: list):
+        """
+        Async version of ``_request_prices``. Requests to slower endpoints are
+        cancelled once a valid response arrives.
 
-            pyth_data = {
-                "timestamp": int(time.time()),
-                "price_update_data": price_update_data,
-                "meta": meta,
+        :param str path: The path of the request
+        :param list params: The query parameters
+        :return: The status and body of a valid response
+        :rtype: (int, str)
+        """
+        endpoints = sort_endpoints(self.endpoints)
+        session = get_http(self.snx).get_async_session()
+
+        def send(endpoint):
+            return asyncio.ensure_future(
+                self._request_endpoint_async(session, endpoint, path, params)
+            )
+
+        # each round sends to the next endpoint, until a valid response arrives
+        pending = set()
+        num_sent = 0
+        last_error = None
+        try:
+            while num_sent < len(endpoints) or len(pending) > 0:
+                if num_sent < len(endpoints):
+                    if num_sent > 0:
+                        self.logger.debug(
+                            f"Hedging Pyth request to {endpoints[num_sent].url}"
+                        )
+                    pending.add(send(endpoints[num_sent]))
+                    num_sent += 1
+
+                # wait for a response, a failure, or the time to hedge
+                timeout = self.hedge_after if num_sent < len(endpoints) else None
+                done, pending = await asyncio.wait(
+                    pending, timeout=timeout, return_when=asyncio.FIRST_COMPLETED
+                )
+                for task in done:
+                    try:
+                        return task.result()
+                    except Exception as err:
+                        self.logger.warning(f"Pyth price service request failed: {err}")
+                        last_error = err
+        finally:
+            for task in pending:
+                task.cancel()
+        raise Exception(f"All Pyth price service endpoints failed: {last_error}")
+
+    def _get_found_feed_ids(self, feed_ids: [str], response_text: str):
+        """
+        Check an error response for missing price feeds, and return the feed ids
+        that were found. Returns ``None`` if the error is not about missing feeds.
+
+        :param [str] feed_ids: List of feed ids that were fetched
+        :param str response_text: The body of the error response
+        :return: The feed ids to fetch again
+        :rtype: [str] | None
+        """
+        if response_text and "Price ids not found" in response_text:
+            self.logger.info(f"Removing missing price feeds: {response_text}")
+            now = int(time.time())
+            found_feed_ids = []
+            with self._lock:
+                for feed_id in feed_ids:
+                    if feed_id[2:] in response_text:
+                        self._missing_feed_ids[feed_id] = now
+                    else:
+                        found_feed_ids.append(feed_id)
+
+            if len(found_feed_ids) < len(feed_ids):
+                return found_feed_ids
+
+        self.logger.error(f"Error fetching latest price data: {response_text}")
+        return None
+
+    def _parse_prices(self, response_data: dict, publish_time: int | None = None):
+        """
+        Decode a response from the Pyth price service and update the cache of
+        latest prices.
+
+        :param dict response_data: The decoded JSON response
+        :param int publish_time: Publish time for benchmark data
+        :return: Dictionary with price update data and metadata
+        :rtype: dict
+        """
+        pyth_data = self._decode_prices(response_data)
+
+        # update the cache
+        # only update if ttl > 0
+        if self.cache_ttl > 0 and publish_time is None:
+            self._update_cache(self._get_feed_entries(pyth_data))
+        return pyth_data
+
+    def _decode_prices(self, response_data: dict):
+        """
+        Decode a response or stream event from the Pyth price service.
+
+        :param dict response_data: The decoded JSON response
+        :return: Dictionary with price update data and metadata
+        :rtype: dict
+        """
+        # decode the price data
+        price_update_data = [
+            decode_hex(f"0x{raw_pud}") for raw_pud in response_data["binary"]["data"]
+        ]
+
+        # enrich some metadata
+        meta = {
+            f"0x{feed_data['id']}": {
+                "symbol": (
+                    self.symbol_lookup[f"0x{feed_data['id']}"]
+                    if f"0x{feed_data['id']}" in self.symbol_lookup
+                    else "N/A"
+                ),
+                "price": int(feed_data["price"]["price"])
+                * 10 ** feed_data["price"]["expo"],
+                "publish_time": feed_data["price"]["publish_time"],
             }
+            for feed_data in response_data["parsed"]
+        }
 
-            # update the cache
-            # only update if ttl > 0
-            if self.cache_ttl > 0:
-                self._cache[",".join(sorted(feed_ids))] = pyth_data
-            return pyth_data
-        except Exception as err:
-            self.logger.error(f"Error fetching latest price data: {err}")
-            return None
+        return {
+            "timestamp": int(time.time()),
+            "price_update_data": price_update_data,
+            "meta": meta,
+        }
+
+    def _fetch_prices(self, feed_ids: [str], publish_time: int | None = None):
+        """
+        An internal method for fetching price data from the Pyth price service. This
+        method is used by the public methods ``get_price_from_ids`` and
+        ``get_price_from_symbols``. The method fetches the latest price data for a list
+        of feed ids, deciding which endpoint to use based on the presence of a publish time.
+
+        :param [str] feed_ids: List of feed ids to fetch data for
+        :param int publish_time: Publish time for benchmark data
+        :return: List of price update data
+        :rtype: [bytes] | None
+        """
+        while len(feed_ids) > 0:
+            path, params = self._get_price_request(feed_ids, publish_time)
+            try:
+                status, response_text = self._request_prices(path, params)
+                if status != 200:
+                    # fetch again without the missing feeds
+                    feed_ids = self._get_found_feed_ids(feed_ids, response_text)
+                    if feed_ids is None:
+                        return None
+                    continue
+
+                return self._parse_prices(json.loads(response_text), publish_time)
+            except Exception as err:
+                self.logger.error(f"Error fetching latest price data: {err}")
+                return None
+        return None
+
+    async def _fetch_prices_async(
+        self, feed_ids: [str], publish_time: int | None = None
+    ):
+        """
+        Async version of ``_fetch_prices``, which fetches the price data with
+        ``aiohttp`` so several fetches can run on one event loop. The requests
+        are recorded in the metrics of the HTTP transport.
+
+        :param [str] feed_ids: List of feed ids to fetch data for
+        :param int publish_time: Publish time for benchmark data
+        :return: Dictionary with price update data and metadata
+        :rtype: dict | None
+        """
+        while len(feed_ids) > 0:
+            path, params = self._get_price_request(feed_ids, publish_time)
+            try:
+                status, response_text = await self._request_prices_async(path, params)
+                if status != 200:
+                    # fetch again without the missing feeds
+                    feed_ids = self._get_found_feed_ids(feed_ids, response_text)
+                    if feed_ids is None:
+                        return None
+                    continue
+
+                return self._parse_prices(json.loads(response_text), publish_time)
+            except Exception as err:
+                self.logger.error(f"Error fetching latest price data: {err}")
+                return None
+        return None
+
+    def _fetch_coalesced(self, feed_ids: [str]):
+        """
+        Fetch the latest prices of feeds, sharing the fetch with concurrent
+        threads. Feeds that another thread is already fetching are waited for.
+        The other feeds join a batch, which is fetched with one request for all
+        of its feeds after ``coalesce_window`` seconds, by the thread that
+        started it.
+
+        :param [str] feed_ids: List of feed ids to fetch data for
+        :return: The cache entry of each fetched feed id, or ``None`` if a
+            fetch failed
+        :rtype: dict | None
+        """
+        feed_ids = list(dict.fromkeys(self._normalize_feed_ids(feed_ids)))
+        with self._lock:
+            futures = {f: self._inflight[f] for f in feed_ids if f in self._inflight}
+            new_feed_ids = [f for f in feed_ids if f not in futures]
+
+            batch = None
+            if len(new_feed_ids) > 0:
+                if self._batch is None:
+                    batch = self._batch = {"feed_ids": [], "future": Future()}
+                for feed_id in new_feed_ids:
+                    self._batch["feed_ids"].append(feed_id)
+                    self._inflight[feed_id] = futures[feed_id] = self._batch["future"]
+
+        if batch is not None:
+            # let other threads join the batch, then close it and fetch it
+            if self.coalesce_window > 0:
+                time.sleep(self.coalesce_window)
+            with self._lock:
+                self._batch = None
+
+            if len(batch["feed_ids"]) > len(new_feed_ids):
+                self.logger.debug(
+                    f"Coalesced Pyth fetch of {len(batch['feed_ids'])} feeds"
+                )
+            try:
+                pyth_data = self._fetch_prices(batch["feed_ids"])
+                batch["future"].set_result(
+                    None if pyth_data is None else self._get_feed_entries(pyth_data)
+                )
+            except BaseException as err:
+                batch["future"].set_exception(err)
+            finally:
+                with self._lock:
+                    for feed_id in batch["feed_ids"]:
+                        if self._inflight.get(feed_id) is batch["future"]:
+                            del self._inflight[feed_id]
+
+        entries = {}
+        for future in {id(future): future for future in futures.values()}.values():
+            fetched = future.result()
+            if fetched is None:
+                return None
+            entries.update(fetched)
+        return {f: entries[f] for f in feed_ids if f in entries}
 
     def get_price_from_ids(self, feed_ids: [str], publish_time: int | None = None):
         """
@@ -194,18 +960,78 @@ class Pyth:
         :return: Dictionary with price update data and metadata
         :rtype: dict | None
         """
-        # check the cache
-        cached_data = (
-            self._check_cache(feed_ids)
-            if self.cache_ttl > 0 and publish_time is None
-            else None
-        )
-        if cached_data:
+        feed_ids = self._remove_missing_feed_ids(self._normalize_feed_ids(feed_ids))
+        if publish_time is not None:
+            # check the cache directory, and only fetch the feeds that are not cached
+            entries = self._get_history_entries(feed_ids, publish_time)
+            uncached_feed_ids = [f for f in feed_ids if f not in entries]
+            if len(uncached_feed_ids) > 0:
+                pyth_data = self._fetch_prices(uncached_feed_ids, publish_time)
+                if pyth_data is None:
+                    return None
+                self._add_history_entries(entries, pyth_data, publish_time)
+            return self._build_price_data(
+                {f: entries[f] for f in feed_ids if f in entries}
+            )
+        if self.cache_ttl <= 0 and self.stream is None:
+            entries = self._fetch_coalesced(feed_ids)
+            return None if entries is None else self._build_price_data(entries)
+
+        # check the cache, and only fetch the feeds that are not cached
+        entries = self._get_cache_entries(feed_ids)
+        uncached_feed_ids = [feed_id for feed_id in feed_ids if feed_id not in entries]
+        if len(uncached_feed_ids) == 0:
+            self.logger.info("Using cached Pyth data")
+        else:
+            fetched = self._fetch_coalesced(uncached_feed_ids)
+            if fetched is None:
+                return None
+            entries.update(fetched)
+        return self._build_price_data({f: entries[f] for f in feed_ids if f in entries})
+
+    async def get_price_from_ids_async(
+        self, feed_ids: [str], publish_time: int | None = None
+    ):
+        """
+        Async version of ``get_price_from_ids``. Uses the same cache, and fetches
+        the price data without blocking the event loop::
+
+            >>> await snx.pyth.get_price_from_ids_async(['0x12345...', '0xabcde...'])
+
+        :param [str] feed_ids: List of feed ids to fetch data for
+        :param int publish_time: Publish time for benchmark data
+        :return: Dictionary with price update data and metadata
+        :rtype: dict | None
+        """
+        feed_ids = self._remove_missing_feed_ids(self._normalize_feed_ids(feed_ids))
+        if publish_time is not None:
+            # check the cache directory, and only fetch the feeds that are not cached
+            entries = self._get_history_entries(feed_ids, publish_time)
+            uncached_feed_ids = [f for f in feed_ids if f not in entries]
+            if len(uncached_feed_ids) > 0:
+                pyth_data = await self._fetch_prices_async(
+                    uncached_feed_ids, publish_time
+                )
+                if pyth_data is None:
+                    return None
+                self._add_history_entries(entries, pyth_data, publish_time)
+            return self._build_price_data(
+                {f: entries[f] for f in feed_ids if f in entries}
+            )
+        if self.cache_ttl <= 0 and self.stream is None:
+            return await self._fetch_prices_async(feed_ids)
+
+        # check the cache, and only fetch the feeds that are not cached
+        entries = self._get_cache_entries(feed_ids)
+        uncached_feed_ids = [feed_id for feed_id in feed_ids if feed_id not in entries]
+        if len(uncached_feed_ids) == 0:
             self.logger.info("Using cached Pyth data")
-            return cached_data
         else:
-            pyth_data = self._fetch_prices(feed_ids, publish_time=publish_time)
-            return pyth_data
+            pyth_data = await self._fetch_prices_async(uncached_feed_ids)
+            if pyth_data is None:
+                return None
+            entries.update(self._get_feed_entries(pyth_data))
+        return self._build_price_data({f: entries[f] for f in feed_ids if f in entries})
 
     def get_price_from_symbols(self, symbols: [str], publish_time: int | None = None):
         """
@@ -243,15 +1069,4 @@ class Pyth:
             self.logger.error(f"Feed ids not found for symbols: {missing_symbols}")
             return None
 
-        # check the cache
-        cached_data = (
-            self._check_cache(feed_ids)
-            if self.cache_ttl > 0 and publish_time is None
-            else None
-        )
-        if cached_data:
-            self.logger.info("Using cached Pyth data")
-            return cached_data
-        else:
-            pyth_data = self._fetch_prices(feed_ids, publish_time=publish_time)
-            return pyth_data
+        return self.get_price_from_ids(feed_ids, publish_time=publish_time)
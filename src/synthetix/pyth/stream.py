@@ -0,0 +1,144 @@
+"""Module for streaming Pyth price updates in a background thread."""
+
+import json
+import time
+import threading
+from ..utils.http import get_http
+from .endpoints import sort_endpoints
+
+# default time in seconds before a streamed price is stale
+DEFAULT_STREAM_STALE_AFTER = 10
+
+# maximum time in seconds to wait before reconnecting
+MAX_RECONNECT_DELAY = 30
+
+
+class PythStream:
+    """
+    Subscribe to the ``/v2/updates/price/stream`` server-sent events of the
+    Pyth price service in a background thread. Each update is split by feed
+    and stored in the cache of the ``Pyth`` class, so ``get_price_from_ids``
+    answers from memory without a request::
+
+        >>> snx.pyth.start_stream()
+        >>> snx.pyth.get_price_from_symbols(["ETH"])
+
+    A streamed price is used for ``stale_after`` seconds after it is received.
+    If the stream stops sending updates, the prices go stale, and requests fall
+    back to polling the price service until the stream reconnects.
+
+    :param Pyth pyth: Pyth class instance
+    :param [str] feed_ids: List of feed ids to subscribe to
+    :param int stale_after: Time in seconds a streamed price is used for
+    """
+
+    def __init__(
+        self, pyth, feed_ids: [str], stale_after: int = DEFAULT_STREAM_STALE_AFTER
+    ):
+        self.pyth = pyth
+        self.logger = pyth.logger
+        self.feed_ids = list(dict.fromkeys(feed_ids))
+        self.stale_after = stale_after
+
+        self.last_update = None
+        self.num_updates = 0
+        self.num_connections = 0
+        self._stop = threading.Event()
+        self._response = None
+        self._thread = None
+
+    @property
+    def is_stale(self) -> bool:
+        """``True`` if no update was received in the last ``stale_after`` seconds"""
+        return (
+            self.last_update is None
+            or time.time() - self.last_update >= self.stale_after
+        )
+
+    def start(self):
+        """Start the background thread"""
+        if self._thread is not None and self._thread.is_alive():
+            return
+
+        self._stop.clear()
+        self._thread = threading.Thread(
+            target=self._run, name="pyth-stream", daemon=True
+        )
+        self._thread.start()
+
+    def stop(self, timeout: float = 5):
+        """
+        Stop the background thread and close the connection.
+
+        :param float timeout: Time in seconds to wait for the thread to stop
+        """
+        self._stop.set()
+        response = self._response
+        if response is not None:
+            response.close()
+        if self._thread is not None:
+            self._thread.join(timeout)
+
+    def _run(self):
+        """
+        Connect to the stream of the healthiest endpoint, and reconnect with a
+        backoff if it fails or ends
+        """
+        delay = 1
+        while not self._stop.is_set():
+            try:
+                self._connect()
+                delay = 1
+            except Exception as e:
+                if self._stop.is_set():
+                    break
+                self.logger.warning(f"Pyth price stream failed: {e}")
+
+            # wait before reconnecting
+            if self._stop.wait(delay):
+                break
+            delay = min(delay * 2, MAX_RECONNECT_DELAY)
+
+    def _connect(self):
+        "Read events from the stream until it ends or stops sending updates"
+        endpoint = sort_endpoints(self.pyth.endpoints)[0]
+        url = f"{endpoint.url}/v2/updates/price/stream"
+        params = [("ids[]", feed_id) for feed_id in self.feed_ids] + [
+            ("encoding", "hex"),
+            ("parsed", "true"),
+        ]
+
+        # the read timeout ends a connection that stops sending updates
+        response = get_http(self.pyth.snx).get(
+            url, params, stream=True, timeout=(10, self.stale_after)
+        )
+        self._response = response
+        self.num_connections += 1
+        try:
+            if response.status_code != 200:
+                raise Exception(f"Status {response.status_code}: {response.text}")
+
+            self.logger.info(f"Streaming Pyth data for {len(self.feed_ids)} feeds")
+            for line in response.iter_lines(decode_unicode=True):
+                if self._stop.is_set():
+                    return
+                if line and line.startswith("data:"):
+                    self._handle_event(json.loads(line[5:]))
+        finally:
+            self._response = None
+            response.close()
+
+    def _handle_event(self, event_data: dict):
+        """
+        Store the prices of a stream event in the cache.
+
+        :param dict event_data: The decoded event data
+        """
+        pyth_data = self.pyth._decode_prices(event_data)
+        entries = self.pyth._get_feed_entries(pyth_data)
+        for entry in entries.values():
+            entry["ttl"] = self.stale_after
+        self.pyth._update_cache(entries)
+
+        self.last_update = time.time()
+        self.num_updates += 1
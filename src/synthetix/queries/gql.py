@@ -1,7 +1,13 @@
-from gql import gql
+"""
+GraphQL documents for the subgraph queries. The documents are kept as strings
+and parsed with ``gql`` the first time each one is used, since parsing them all
+takes a noticeable part of the import time.
+"""
 
-candles = gql(
-    """
+from collections.abc import Mapping
+from functools import lru_cache
+
+candles = """
     query(
         $last_id: ID!
         $asset: String!
@@ -32,10 +38,8 @@ candles = gql(
         }
     }
 """
-)
 
-transfers = gql(
-    """
+transfers = """
     query(
         $last_id: ID!
         $min_timestamp: BigInt = 0
@@ -59,10 +63,8 @@ transfers = gql(
         }
     }
 """
-)
 
-transfers_market = gql(
-    """
+transfers_market = """
     query(
         $last_id: ID!
         $market_keys: [Bytes!]
@@ -88,10 +90,8 @@ transfers_market = gql(
         }
     }
 """
-)
 
-transfers_account = gql(
-    """
+transfers_account = """
     query(
         $last_id: ID!
         $account: Bytes!
@@ -117,10 +117,8 @@ transfers_account = gql(
         }
     }
 """
-)
 
-trades_account = gql(
-    """
+trades_account = """
     query(
         $last_id: ID!
         $account: Bytes!
@@ -158,10 +156,8 @@ trades_account = gql(
         }
     }
 """
-)
 
-trades_market = gql(
-    """
+trades_market = """
     query(
         $last_id: ID!
         $market_keys: [Bytes!]
@@ -199,10 +195,8 @@ trades_market = gql(
         }
     }
 """
-)
 
-positions_market = gql(
-    """
+positions_market = """
     query(
         $last_id: ID!
         $market_keys: [Bytes!]
@@ -248,10 +242,8 @@ positions_market = gql(
         }
     }
 """
-)
 
-positions_account = gql(
-    """
+positions_account = """
     query(
         $last_id: ID!
         $account: Bytes!
@@ -297,10 +289,8 @@ positions_account = gql(
         }
     }
 """
-)
 
-funding_rates = gql(
-    """
+funding_rates = """
     query(
         $last_id: ID!
         $market_keys: [Bytes!]
@@ -327,9 +317,8 @@ funding_rates = gql(
         }
     }
 """
-)
 
-queries = {
+QUERIES = {
     "candles": candles,
     "transfers": transfers,
     "transfers_account": transfers_account,
@@ -340,3 +329,39 @@ queries = {
     "positions_market": positions_market,
     "funding_rates": funding_rates,
 }
+
+
+@lru_cache(maxsize=None)
+def get_query(name: str):
+    """
+    Get the parsed GraphQL document for a query.
+
+    :param str name: The name of the query, a key of ``QUERIES``
+    :return: The parsed document
+    :rtype: graphql.DocumentNode
+    """
+    from gql import gql
+
+    return gql(QUERIES[name])
+
+
+class ParsedQueries(Mapping):
+    """
+    Read-only mapping of query names to parsed GraphQL documents. Each document
+    is parsed with ``get_query`` the first time it is accessed.
+    """
+
+    def __getitem__(self, name):
+        if name not in QUERIES:
+            raise KeyError(name)
+        return get_query(name)
+
+    def __iter__(self):
+        return iter(QUERIES)
+
+    def __len__(self):
+        return len(QUERIES)
+
+
+# kept for code that imports the previous name, which holds parsed documents
+queries = ParsedQueries()
@@ -1,5 +1,4 @@
 import time
-import requests
 import logging
 import pandas as pd
 from decimal import Decimal
@@ -7,7 +6,8 @@ from web3.constants import ADDRESS_ZERO
 from gql import Client
 from gql.transport.aiohttp import AIOHTTPTransport
 from gql.transport.requests import RequestsHTTPTransport
-from .gql import queries
+from ..utils.http import get_http
+from .gql import get_query
 from .config import config
 
 
@@ -95,7 +95,9 @@ class Queries:
     def _make_request(self, url: str, payload: dict):
         """Make a request to the subgraph and return the results"""
         try:
-            response = requests.post(url, headers=self._get_headers(), json=payload)
+            response = get_http(self.synthetix).post(
+                url, headers=self._get_headers(), json=payload
+            )
             return response.json()["data"]
         except Exception as e:
             print(e)
@@ -174,7 +176,7 @@ class Queries:
             "max_timestamp": current_timestamp,
             "period": period,
         }
-        result = await self._run_query(queries["candles"], params, "candles", url)
+        result = await self._run_query(get_query("candles"), params, "candles", url)
         return clean_df(result, config["candles"])
 
     async def trades_for_market(
@@ -213,7 +215,7 @@ class Queries:
             "max_timestamp": max_timestamp,
         }
         result = await self._run_query(
-            queries["trades_market"], params, "futuresTrades", url
+            get_query("trades_market"), params, "futuresTrades", url
         )
         return clean_df(result, config["trades"])
 
@@ -250,7 +252,7 @@ class Queries:
             "max_timestamp": max_timestamp,
         }
         result = await self._run_query(
-            queries["trades_account"], params, "futuresTrades", url
+            get_query("trades_account"), params, "futuresTrades", url
         )
         return clean_df(result, config["trades"])
 
@@ -286,7 +288,7 @@ class Queries:
             "is_open": [True] if open_only else [True, False],
         }
         result = await self._run_query(
-            queries["positions_market"], params, "futuresPositions", url
+            get_query("positions_market"), params, "futuresPositions", url
         )
         return clean_df(result, config["positions"])
 
@@ -319,7 +321,7 @@ class Queries:
             "is_open": [True] if open_only else [True, False],
         }
         result = await self._run_query(
-            queries["positions_account"], params, "futuresPositions", url
+            get_query("positions_account"), params, "futuresPositions", url
         )
         return clean_df(result, config["positions"])
 
@@ -363,7 +365,7 @@ class Queries:
             "max_timestamp": max_timestamp,
         }
         result = await self._run_query(
-            queries["transfers_market"], params, "futuresMarginTransfers", url
+            get_query("transfers_market"), params, "futuresMarginTransfers", url
         )
         return clean_df(result, config["transfers"])
 
@@ -404,7 +406,7 @@ class Queries:
             "max_timestamp": max_timestamp,
         }
         result = await self._run_query(
-            queries["transfers_account"], params, "futuresMarginTransfers", url
+            get_query("transfers_account"), params, "futuresMarginTransfers", url
         )
         return clean_df(result, config["transfers"])
 
@@ -448,6 +450,6 @@ class Queries:
             "max_timestamp": max_timestamp,
         }
         result = await self._run_query(
-            queries["funding_rates"], params, "fundingRateUpdates", url
+            get_query("funding_rates"), params, "fundingRateUpdates", url
         )
         return clean_df(result, config["funding_rates"])
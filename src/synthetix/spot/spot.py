@@ -2,7 +2,8 @@
 
 from eth_utils import encode_hex
 from ..utils import ether_to_wei, wei_to_ether, format_ether
-from ..utils.multicall import multicall_erc7412, write_erc7412
+from ..utils.multicall import batch_erc7412, multicall_erc7412, write_erc7412
+from ..utils.state import int_keys
 from .constants import DISABLED_MARKETS
 from web3.constants import ADDRESS_ZERO
 from typing import Literal
@@ -35,12 +36,14 @@ class Spot:
 
     :param Synthetix snx: An instance of the Synthetix class.
     :param Pyth pyth: An instance of the Pyth class.
+    :param dict | None state: State saved by a previous run, used instead of fetching
+        the markets if it is still valid.
 
     :return: An instance of the Spot class.
     :rtype: Spot
     """
 
-    def __init__(self, snx):
+    def __init__(self, snx, state: dict = None):
         self.snx = snx
         self.logger = snx.logger
 
@@ -60,7 +63,80 @@ class Spot:
             self.market_proxy = snx.contracts["spotFactory"]["SpotMarketProxy"][
                 "contract"
             ]
-            self.markets_by_id, self.markets_by_name = self.get_markets()
+            if state is not None and self._restore_markets(state):
+                self.logger.debug("Restored spot markets from saved state")
+            else:
+                try:
+                    self.markets_by_id, self.markets_by_name = self.get_markets()
+                except Exception as e:
+                    self.markets_by_id, self.markets_by_name = {}, {}
+                    self.logger.warning(f"Failed to fetch spot markets: {e}")
+
+    def _get_state(self):
+        """Get the state to save for the next run"""
+        if "spotFactory" not in self.snx.contracts:
+            return None
+        return {
+            "markets_by_id": {
+                market_id: {
+                    **{
+                        key: value for key, value in market.items() if key != "contract"
+                    },
+                    "address": market["contract"].address,
+                }
+                for market_id, market in self.markets_by_id.items()
+            }
+        }
+
+    def _restore_markets(self, state: dict):
+        """
+        Restore the markets saved by a previous run. The markets are only used
+        if ``getSynth`` returns the same synth addresses, and no new synths were
+        added after the last saved market.
+
+        :param dict state: The saved state of the module
+        :return: ``True`` if the markets were restored
+        :rtype: bool
+        """
+        if not state.get("markets_by_id"):
+            return False
+        saved_markets = int_keys(state["markets_by_id"])
+        saved_ids = [market_id for market_id in saved_markets if market_id != 0]
+        next_ids = range(max(saved_markets) + 1, max(saved_markets) + 21)
+        try:
+            addresses = multicall_erc7412(
+                self.snx, self.market_proxy, "getSynth", saved_ids + list(next_ids)
+            )
+        except Exception as e:
+            self.logger.debug(f"Failed to validate saved markets: {e}")
+            return False
+
+        saved_addresses = [
+            saved_markets[market_id]["address"].lower() for market_id in saved_ids
+        ]
+        new_synths = [
+            market_id
+            for market_id, address in zip(next_ids, addresses[len(saved_ids) :])
+            if address != ADDRESS_ZERO and market_id not in self.disabled_markets
+        ]
+        addresses = [address.lower() for address in addresses[: len(saved_ids)]]
+        if addresses != saved_addresses or len(new_synths) > 0:
+            return False
+
+        markets_by_id = {}
+        for market_id, market in saved_markets.items():
+            market = dict(market)
+            address = market.pop("address")
+            if market_id == 0:
+                market["contract"] = self.snx.contracts["system"]["USDProxy"][
+                    "contract"
+                ]
+            else:
+                market["contract"] = self.snx.contracts["common"]["ERC20"].at(address)
+            markets_by_id[market_id] = market
+
+        self.markets_by_id, self.markets_by_name = self._set_markets(markets_by_id)
+        return True
 
     # internals
     def _resolve_market(self, market_id: int, market_name: str):
@@ -130,10 +206,7 @@ class Spot:
         collateral_type, _ = self.market_proxy.functions.getWrapper(market_id).call()
 
         # make the contract
-        wrapper_contract = self.snx.web3.eth.contract(
-            address=self.snx.web3.to_checksum_address(collateral_type),
-            abi=self.snx.contracts["common"]["ERC20"]["abi"],
-        )
+        wrapper_contract = self.snx.contracts["common"]["ERC20"].at(collateral_type)
         decimals = wrapper_contract.functions.decimals().call()
 
         # format the size
@@ -167,8 +240,8 @@ class Spot:
         :rtype: (dict, dict)
         """
         # set some reasonable defaults to avoid infinite loops
-        MAX_ITER = 20
-        ITEMS_PER_ITER = 5
+        MAX_ITER = 5
+        ITEMS_PER_ITER = 20
 
         global_market_id = 0
         num_iter = 0
@@ -214,12 +287,17 @@ class Spot:
             )
             settlement_strategies = {}
 
-        for market_id, address in synths:
-            synth_contract = self.snx.web3.eth.contract(
-                address=self.snx.web3.to_checksum_address(address),
-                abi=self.snx.contracts["common"]["ERC20"]["abi"],
-            )
-            market_name = synth_contract.functions.symbol().call()
+        # fetch the symbols of all synths in a single multicall
+        synth_contracts = [
+            self.snx.contracts["common"]["ERC20"].at(address) for _, address in synths
+        ]
+        market_names = batch_erc7412(
+            self.snx, [(contract, "symbol", ()) for contract in synth_contracts]
+        )
+
+        for (market_id, _), synth_contract, market_name in zip(
+            synths, synth_contracts, market_names
+        ):
             symbol = market_name[1:]
 
             if market_id in self.disabled_markets:
@@ -236,6 +314,17 @@ class Spot:
                     market_id
                 ]
 
+        return self._set_markets(markets_by_id)
+
+    def _set_markets(self, markets_by_id: dict):
+        """
+        Update the Pyth price feed ids for a set of markets, and key the markets
+        by name.
+
+        :param dict markets_by_id: Markets keyed by ``market_id``
+        :return: Market info keyed by ``market_id`` and ``market_name``.
+        :rtype: (dict, dict)
+        """
         # update pyth price feed ids
         update_feeds = {
             markets_by_id[market]["symbol"]: markets_by_id[market][
@@ -746,7 +835,9 @@ class Spot:
         """
         Settle an async Pyth order after price data is available.
 
-        Fetches the price for the order from Pyth and settles the order.
+        Fetches the price for the order from Pyth and settles the order. If the order is
+        not yet ready to be settled, the Pyth update for the settlement time is prefetched
+        while waiting.
         Retries up to ``max_tx_tries`` times on failure with a delay of ``tx_delay`` seconds.
 
         Requires either a ``market_id`` or ``market_name`` to be provided to resolve the market.
@@ -784,7 +875,13 @@ class Spot:
         elif settlement_time > now_time:
             duration = settlement_time - now_time
             self.logger.info(f"Waiting {round(duration, 4)} seconds")
-            time.sleep(duration)
+            if self.snx.is_fork:
+                time.sleep(duration)
+            else:
+                # fetch the update for the settlement as soon as it is available
+                self.snx.pyth.wait_for_update(
+                    [settlement_strategy["feed_id"]], settlement_time
+                )
             self.logger.info(
                 f"Order {async_order_id} on market {market_id} is ready to be settled"
             )
@@ -1,7 +1,6 @@
 import argparse
 import logging
 import warnings
-from web3 import Web3
 from web3.constants import ADDRESS_ZERO
 from web3.types import TxParams
 from .constants import (
@@ -11,19 +10,34 @@ from .constants import (
     DEFAULT_GQL_ENDPOINT_PERPS,
     DEFAULT_GQL_ENDPOINT_RATES,
     DEFAULT_PRICE_SERVICE_ENDPOINT,
+    DEFAULT_PYTH_HEDGE_AFTER,
     DEFAULT_REFERRER,
+    DEFAULT_CACHE_DIR,
+    DEFAULT_MULTICALL_MAX_CALLS,
+    DEFAULT_MULTICALL_MAX_WORKERS,
+    DEFAULT_HTTP_MAX_RETRIES,
+    DEFAULT_HTTP_MAX_CONNECTIONS,
 )
 from .utils import wei_to_ether, ether_to_wei
+from .utils.provider import create_async_web3, create_web3, get_shared_web3
+from .utils.prefetch import call_prefetched, prefetch_startup
+from .utils.rpc import batch_request
+from .utils.multicall import snapshot
+from .utils.gas_model import GasModel
+from .utils.http import HttpTransport
+from .utils.state import read_state, write_state
 from .contracts import load_contracts
 from .pyth import Pyth
 from .core import Core
 from .perps import PerpsV3, BfPerps
 from .spot import Spot
 
-from .queries import Queries
 
 warnings.filterwarnings("ignore")
 
+# modules that can be loaded at startup
+MODULES = ("core", "spot", "perps")
+
 
 def setup_logging(debug: bool, verbose: int):
     if debug:
@@ -110,16 +124,60 @@ class Synthetix:
         perps markets.
     :param bool use_estimate_gas: Use estimate gas for transactions. If false,
         it is assumed you will add a gas limit to all transactions.
+    :param dict cannon_config: Load contracts from a Cannon deployment, specified
+        as ``package``, ``version`` and ``preset``, or as an ``ipfs_hash``. The
+        resolved package url is cached for ``cache_ttl`` seconds (default 3600)
+        and the deployment is cached by its IPFS hash in ``cache_dir``.
     :param str gql_endpoint_perps: GraphQL endpoint for perps data.
     :param str satsuma_api_key: API key for Satsuma. If the endpoint is from
         Satsuma, the API key will be automatically added to the request.
-    :param str price_service_endpoint: Endpoint for a Pyth price service. If
-        not specified, a default endpoint is used.
+    :param str | [str] price_service_endpoint: Endpoint for a Pyth price
+        service. If not specified, a default endpoint is used. If a list of
+        endpoints is specified, requests are hedged across them in order of
+        their health.
     :param int pyth_cache_ttl: Time to live for Pyth cache in seconds.
+    :param float pyth_hedge_after: Time in seconds to wait for a Pyth endpoint
+        before also sending the request to the next endpoint.
     :param float gas_multiplier: Multiplier for gas estimates. This is used
         to increase the gas limit for transactions.
     :param bool is_fork: Set to true if the chain is a fork. This will improve
         the way price data is handled by requesting at the block timestamp.
+    :param str cache_dir: Directory used to cache data between runs, such as
+        the prebuilt contract deployment indexes. Defaults to the
+        ``SYNTHETIX_CACHE_DIR`` environment variable if set, otherwise nothing
+        is cached.
+    :param bool share_web3: Share one web3 connection between all instances
+        in the process with the same ``provider_rpc`` and ``request_kwargs``.
+        Instances sharing a connection also share their contract objects, so
+        memory grows with the number of distinct contracts rather than the
+        number of instances. Useful when running one instance per wallet.
+    :param bool warm_start: Save the markets, settlement strategies, price feed
+        ids and account ids discovered at startup to ``cache_dir``, and load
+        them on the next start. Saved state is re-validated against the markets
+        and account balances read at startup, and discarded if the network,
+        address or deployed proxies change.
+    :param list modules: The modules to load at startup, from ``core``,
+        ``spot`` and ``perps``. Defaults to all modules. Other modules are
+        loaded on first access, so a perps-only bot can set
+        ``modules=["perps"]`` to skip spot market and core account discovery.
+    :param int multicall_max_calls: The maximum number of calls in one
+        multicall. Larger batches are split into chunks, which are sent in
+        parallel. Set to ``None`` to never split batches.
+    :param int multicall_max_gas: The maximum estimated gas of one multicall.
+        Set this below the gas cap of the RPC to split batches of expensive
+        calls. The gas of each call is estimated the first time a batch is
+        split.
+    :param int multicall_max_workers: The number of chunks of a batch sent at
+        the same time.
+    :param bool use_gas_model: Learn the gas used by transactions from their
+        receipts, and use it as the gas limit of transactions prepared with
+        ``write_erc7412`` instead of estimating gas. Receipts are recorded by
+        ``wait``. Transactions with no recorded samples are still estimated.
+    :param int http_max_retries: The number of times Pyth, IPFS and subgraph
+        requests are retried after a connection error or a ``429`` or ``5xx``
+        response, with an exponential backoff.
+    :param int http_max_connections: The maximum number of connections, and
+        concurrent requests, to each Pyth, IPFS or subgraph host.
 
     :return: Synthetix class instance
     :rtype: Synthetix
@@ -144,11 +202,22 @@ class Synthetix:
         gql_endpoint_perps: str = None,
         gql_endpoint_rates: str = None,
         satsuma_api_key: str = None,
-        price_service_endpoint: str = None,
+        price_service_endpoint: str | list = None,
         pyth_cache_ttl: int = 60,
+        pyth_hedge_after: float = DEFAULT_PYTH_HEDGE_AFTER,
         gas_multiplier: float = DEFAULT_GAS_MULTIPLIER,
         is_fork: bool = False,
         request_kwargs: dict = {},
+        cache_dir: str = DEFAULT_CACHE_DIR,
+        share_web3: bool = False,
+        warm_start: bool = False,
+        modules: list = None,
+        multicall_max_calls: int = DEFAULT_MULTICALL_MAX_CALLS,
+        multicall_max_gas: int = None,
+        multicall_max_workers: int = DEFAULT_MULTICALL_MAX_WORKERS,
+        use_gas_model: bool = False,
+        http_max_retries: int = DEFAULT_HTTP_MAX_RETRIES,
+        http_max_connections: int = DEFAULT_HTTP_MAX_CONNECTIONS,
     ):
         args = parse_args()
         self.logger = setup_logging(args.debug, args.verbose)
@@ -156,6 +225,7 @@ class Synthetix:
         # init account variables
         self.private_key = private_key
         self.use_estimate_gas = use_estimate_gas
+        self.gas_model = GasModel() if use_gas_model else None
         self.cannon_config = cannon_config
         self.provider_rpc = provider_rpc
         self.op_mainnet_rpc = op_mainnet_rpc
@@ -165,25 +235,37 @@ class Synthetix:
         self.tracking_code = tracking_code
         self.referrer = referrer
         self.is_fork = is_fork
+        self.cache_dir = cache_dir
+        self.multicall_max_calls = multicall_max_calls
+        self.multicall_max_gas = multicall_max_gas
+        self.multicall_max_workers = multicall_max_workers
+
+        # init the HTTP transport shared by Pyth, IPFS and subgraph requests
+        self.http = HttpTransport(
+            max_retries=http_max_retries, max_connections=http_max_connections
+        )
 
-        # init chain provider
-        if provider_rpc.startswith("http"):
-            web3 = Web3(
-                Web3.HTTPProvider(self.provider_rpc, request_kwargs=request_kwargs)
-            )
-        elif provider_rpc.startswith("wss"):
-            web3 = Web3(Web3.WebsocketProvider(self.provider_rpc))
-        elif provider_rpc.endswith("ipc"):
-            web3 = Web3(Web3.IPCProvider(self.provider_rpc))
+        # init chain provider, the async provider is created on first use
+        self.request_kwargs = request_kwargs
+        self._async_web3 = None
+        if share_web3:
+            web3 = get_shared_web3(self.provider_rpc, request_kwargs)
         else:
-            raise Exception("Provider RPC endpoint is invalid")
+            web3 = create_web3(self.provider_rpc, request_kwargs)
+
+        # fetch the RPC signers and chain id in one batch
+        rpc_signers, chain_id = batch_request(
+            web3, [("eth_accounts", []), ("eth_chainId", [])]
+        )
 
         # check for RPC signers
-        try:
-            self.rpc_signers = web3.eth.accounts
-        except Exception as e:
-            self.logger.error(f"Error getting RPC signers: {e}")
+        if isinstance(rpc_signers, Exception):
+            self.logger.error(f"Error getting RPC signers: {rpc_signers}")
             self.rpc_signers = []
+        else:
+            self.rpc_signers = [
+                web3.to_checksum_address(signer) for signer in rpc_signers
+            ]
 
         if address == ADDRESS_ZERO and len(self.rpc_signers) > 0:
             self.address = self.rpc_signers[0]
@@ -208,23 +290,31 @@ class Synthetix:
             )
 
         # check network id
+        if isinstance(chain_id, Exception):
+            raise chain_id
+        chain_id = int(chain_id, 16)
         if network_id is None:
-            self.logger.info(
-                f"Setting network_id from RPC chain_id: {web3.eth.chain_id}"
-            )
-            network_id = web3.eth.chain_id
-        elif web3.eth.chain_id != network_id:
+            self.logger.info(f"Setting network_id from RPC chain_id: {chain_id}")
+            network_id = chain_id
+        elif chain_id != network_id:
             raise Exception("The RPC `chain_id` must match the stored `network_id`")
         else:
             network_id = int(network_id)
 
-        # set nonce
-        self.nonce = web3.eth.get_transaction_count(self.address)
         self.web3 = web3
         self.network_id = network_id
 
         # init contracts
         self.contracts = load_contracts(self)
+
+        # set nonce, and prefetch the reads made by the modules
+        if modules is None:
+            modules = list(MODULES)
+        for module in modules:
+            if module not in MODULES:
+                raise ValueError(f"Invalid module {module}, expected one of {MODULES}")
+        self.startup_modules = modules
+        self.nonce = prefetch_startup(self, modules)
         (
             self.v2_markets,
             self.susd_legacy_token,
@@ -239,12 +329,13 @@ class Synthetix:
         if not gql_endpoint_rates and self.network_id in DEFAULT_GQL_ENDPOINT_RATES:
             gql_endpoint_rates = DEFAULT_GQL_ENDPOINT_RATES[self.network_id]
 
-        self.queries = Queries(
-            synthetix=self,
-            gql_endpoint_perps=gql_endpoint_perps,
-            gql_endpoint_rates=gql_endpoint_rates,
-            api_key=satsuma_api_key,
-        )
+        # the queries module imports pandas and gql, so it is built on first use
+        self._queries = None
+        self._queries_kwargs = {
+            "gql_endpoint_perps": gql_endpoint_perps,
+            "gql_endpoint_rates": gql_endpoint_rates,
+            "api_key": satsuma_api_key,
+        }
 
         # init pyth
         if not price_service_endpoint:
@@ -253,15 +344,100 @@ class Synthetix:
         self.pyth = Pyth(
             self,
             cache_ttl=pyth_cache_ttl,
+            hedge_after=pyth_hedge_after,
             price_service_endpoint=price_service_endpoint,
         )
-        self.core = Core(self, core_account_id)
-        self.spot = Spot(self)
 
-        if "bfp_market_factory" in self.contracts:
-            self.perps = BfPerps(self, perps_account_id)
-        else:
-            self.perps = PerpsV3(self, perps_account_id)
+        # load the state discovered on a previous run
+        self.warm_start = warm_start
+        if warm_start and cache_dir is None:
+            self.logger.warning("Set a cache_dir to save the state for warm starts")
+        self._module_state = (read_state(self) if warm_start else None) or {}
+
+        # init modules, the modules not listed are built on first access
+        self._core_account_id = core_account_id
+        self._perps_account_id = perps_account_id
+        self._modules = {}
+        for module in self.startup_modules:
+            getattr(self, module)
+
+        if warm_start:
+            self.save_state()
+
+    @property
+    def async_web3(self):
+        """
+        An ``AsyncWeb3`` connection to ``provider_rpc``, created on first access.
+        Used by the async functions in ``synthetix.utils.multicall_async``.
+        The ``request_kwargs`` of the instance are used for its requests.
+        """
+        if self._async_web3 is None:
+            self._async_web3 = create_async_web3(self.provider_rpc, self.request_kwargs)
+        return self._async_web3
+
+    @property
+    def queries(self):
+        """The ``Queries`` module, imported and built on first access"""
+        if self._queries is None:
+            from .queries import Queries
+
+            self._queries = Queries(synthetix=self, **self._queries_kwargs)
+        return self._queries
+
+    @property
+    def core(self) -> Core:
+        """The ``Core`` module, built on first access if not loaded at startup"""
+        if "core" not in self._modules:
+            self._modules["core"] = Core(
+                self, self._core_account_id, state=self._module_state.get("core")
+            )
+            self._save_lazy_module_state("core")
+        return self._modules["core"]
+
+    @property
+    def spot(self) -> Spot:
+        """The ``Spot`` module, built on first access if not loaded at startup"""
+        if "spot" not in self._modules:
+            self._modules["spot"] = Spot(self, state=self._module_state.get("spot"))
+            self._save_lazy_module_state("spot")
+        return self._modules["spot"]
+
+    @property
+    def perps(self) -> PerpsV3 | BfPerps:
+        """
+        The ``PerpsV3`` or ``BfPerps`` module, built on first access if not
+        loaded at startup
+        """
+        if "perps" not in self._modules:
+            if "bfp_market_factory" in self.contracts:
+                perps_class = BfPerps
+            else:
+                perps_class = PerpsV3
+            self._modules["perps"] = perps_class(
+                self, self._perps_account_id, state=self._module_state.get("perps")
+            )
+            self._save_lazy_module_state("perps")
+        return self._modules["perps"]
+
+    def _save_lazy_module_state(self, module: str):
+        """save the state of a module built after startup"""
+        if self.warm_start and module not in self.startup_modules:
+            self.save_state()
+
+    def save_state(self):
+        """
+        Save the markets, settlement strategies, price feed ids and account ids
+        discovered by the modules to the cache directory. When the class is
+        initialized with ``warm_start=True``, the state is saved after startup
+        and loaded on the next start. Call this method to save the state again,
+        for example after creating an account. The file is not written if the
+        state is unchanged.
+        """
+        # keep the saved state of modules that have not been built
+        modules = dict(self._module_state)
+        for name, module in self._modules.items():
+            modules[name] = module._get_state()
+        self._module_state = write_state(self, modules, self._module_state)
 
     def _load_contracts(self):
         """
@@ -285,13 +461,12 @@ class Synthetix:
         if "PerpsV2MarketData" in self.contracts:
             data_definition = self.contracts["PerpsV2MarketData"]
             data_address = w3.to_checksum_address(data_definition["address"])
-            data_abi = data_definition["abi"]
 
-            marketdata_contract = w3.eth.contract(data_address, abi=data_abi)
+            marketdata_contract = data_definition.at(data_address)
 
             try:
-                allmarketsdata = (
-                    marketdata_contract.functions.allProxiedMarketSummaries().call()
+                allmarketsdata = call_prefetched(
+                    self, marketdata_contract, "allProxiedMarketSummaries"
                 )
             except Exception as e:
                 self.logger.error(f"Error loading markets: {e}")
@@ -328,9 +503,7 @@ class Synthetix:
                 susd_legacy_definition["address"]
             )
 
-            susd_legacy_token = w3.eth.contract(
-                susd_legacy_address, abi=susd_legacy_definition["abi"]
-            )
+            susd_legacy_token = susd_legacy_definition.at(susd_legacy_address)
         else:
             susd_legacy_token = None
 
@@ -339,7 +512,7 @@ class Synthetix:
             susd_definition = self.contracts["system"]["USDProxy"]
             susd_address = w3.to_checksum_address(susd_definition["address"])
 
-            susd_token = w3.eth.contract(susd_address, abi=susd_definition["abi"])
+            susd_token = susd_definition.at(susd_address)
         else:
             susd_token = None
 
@@ -354,7 +527,7 @@ class Synthetix:
                 "trusted_multicall_forwarder"
             ]["TrustedMulticallForwarder"]
             mc_address = w3.to_checksum_address(mc_definition["address"])
-            multicall = w3.eth.contract(mc_address, abi=mc_definition["abi"])
+            multicall = mc_definition.at(mc_address)
         elif (
             "system" in self.contracts
             and "trusted_multicall_forwarder" in self.contracts["system"]
@@ -363,12 +536,33 @@ class Synthetix:
                 "TrustedMulticallForwarder"
             ]
             mc_address = w3.to_checksum_address(mc_definition["address"])
-            multicall = w3.eth.contract(mc_address, abi=mc_definition["abi"])
+            multicall = mc_definition.at(mc_address)
         else:
             multicall = None
 
         return markets, susd_legacy_token, susd_token, multicall
 
+    def snapshot(self, block="latest"):
+        """
+        Pin every module read inside a ``with`` block to one block. Reads at
+        ``"latest"`` made with ``call_erc7412``, ``multicall_erc7412`` or
+        ``batch_erc7412`` use the snapshot block, and identical reads are
+        answered from an in-memory cache. The cache is kept until a snapshot is
+        taken at another block::
+
+            >>> with snx.snapshot() as block_number:
+            ...     markets = snx.perps.get_market_summaries()
+            ...     positions = snx.perps.get_open_positions()
+
+        :param str | int block: The block to pin, as a number or a tag such as
+            ``"latest"``
+        :return: A context manager that yields the block number
+        """
+        block_number = (
+            block if isinstance(block, int) else self.web3.eth.get_block(block).number
+        )
+        return snapshot(self, block_number)
+
     def _get_tx_params(self, value=0, to=None) -> TxParams:
         """
         A helper function to prepare transaction parameters. This function
@@ -403,6 +597,8 @@ class Synthetix:
         :rtype: dict
         """
         receipt = self.web3.eth.wait_for_transaction_receipt(tx_hash, timeout=timeout)
+        if self.gas_model is not None:
+            self.gas_model.confirmed(tx_hash, receipt)
         return receipt
 
     def _send_transaction(self, tx_data: dict):
@@ -460,6 +656,8 @@ class Synthetix:
         try:
             self.logger.debug(f"Tx data: {tx_data}")
             tx_hash = self._send_transaction(tx_data)
+            if self.gas_model is not None:
+                self.gas_model.sent(tx_data, tx_hash)
             return tx_hash
         except ValueError as e:
             if "nonce too low" in str(e):
@@ -499,9 +697,7 @@ class Synthetix:
         if not address:
             address = self.address
 
-        weth_contract = self.web3.eth.contract(
-            address=self.contracts["WETH"]["address"], abi=self.contracts["WETH"]["abi"]
-        )
+        weth_contract = self.contracts["WETH"]["contract"]
 
         eth_balance = self.web3.eth.get_balance(address)
         weth_balance = weth_contract.functions.balanceOf(address).call()
@@ -537,9 +733,7 @@ class Synthetix:
         """
         # fix the amount
         amount = 2**256 - 1 if amount is None else ether_to_wei(amount)
-        token_contract = self.web3.eth.contract(
-            address=token_address, abi=self.contracts["common"]["ERC20"]["abi"]
-        )
+        token_contract = self.contracts["common"]["ERC20"].at(token_address)
 
         tx_params = self._get_tx_params()
 
@@ -585,9 +779,7 @@ class Synthetix:
         if not owner_address:
             owner_address = self.address
 
-        token_contract = self.web3.eth.contract(
-            address=token_address, abi=self.contracts["common"]["ERC20"]["abi"]
-        )
+        token_contract = self.contracts["common"]["ERC20"].at(token_address)
 
         allowance = token_contract.functions.allowance(
             owner_address, spender_address
@@ -0,0 +1,32 @@
+import os
+import json
+
+
+def read_json_cache(path: str):
+    """
+    Read a JSON file from the cache directory.
+
+    :param str path: Path of the cache file
+    :return: The cached data, or ``None`` if the file is missing or invalid
+    :rtype: dict | list | None
+    """
+    try:
+        with open(path, "r") as cache_file:
+            return json.load(cache_file)
+    except (OSError, ValueError):
+        return None
+
+
+def write_json_cache(path: str, data):
+    """
+    Write a JSON file to the cache directory. The file is written to a temporary
+    path and moved into place, so concurrent readers never see a partial file.
+
+    :param str path: Path of the cache file
+    :param dict | list data: The data to cache
+    """
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    temp_path = f"{path}.{os.getpid()}.tmp"
+    with open(temp_path, "w") as cache_file:
+        json.dump(data, cache_file, separators=(",", ":"))
+    os.replace(temp_path, path)
@@ -0,0 +1,122 @@
+import math
+import threading
+from collections import OrderedDict, deque
+
+# default settings for the gas model
+DEFAULT_GAS_MODEL_PERCENTILE = 95
+DEFAULT_GAS_MODEL_MIN_SAMPLES = 3
+DEFAULT_GAS_MODEL_MAX_SAMPLES = 100
+DEFAULT_GAS_MODEL_BUFFER = 1.2
+
+# number of prepared or sent transactions remembered until they are confirmed
+MAX_PENDING_TRANSACTIONS = 1000
+
+
+class GasModel:
+    """
+    Learn the gas limit of transactions from the ``gasUsed`` of their receipts.
+    Samples are recorded per ``(contract address, function name, number of
+    prepended calls)``, and once a key has ``min_samples`` receipts, a high
+    percentile of its samples is used as the gas limit instead of estimating
+    the gas with the RPC. The transaction is still simulated, so missing
+    oracle data is found before it is sent. A reverted receipt clears the
+    samples of its key, so the next transaction is estimated again::
+
+        >>> snx = Synthetix(..., use_gas_model=True)
+        >>> tx_hash = snx.execute_transaction(tx_data)
+        >>> snx.wait(tx_hash)
+
+    :param int percentile: The percentile of the samples to use
+    :param int min_samples: The number of samples required before estimating
+    :param int max_samples: The number of recent samples kept for each key
+    :param float buffer: Multiplier applied to the percentile
+    """
+
+    def __init__(
+        self,
+        percentile: int = DEFAULT_GAS_MODEL_PERCENTILE,
+        min_samples: int = DEFAULT_GAS_MODEL_MIN_SAMPLES,
+        max_samples: int = DEFAULT_GAS_MODEL_MAX_SAMPLES,
+        buffer: float = DEFAULT_GAS_MODEL_BUFFER,
+    ):
+        self.percentile = percentile
+        self.min_samples = min_samples
+        self.max_samples = max_samples
+        self.buffer = buffer
+
+        self.samples = {}
+        self._pending_data = OrderedDict()
+        self._pending_hashes = OrderedDict()
+        self._lock = threading.Lock()
+
+    def estimate(self, key: tuple) -> int | None:
+        """
+        Get the gas limit for a key from its recorded samples.
+
+        :param tuple key: The ``(address, function_name, num_calls)`` key
+        :return: The gas limit, or ``None`` if there are not enough samples
+        :rtype: int | None
+        """
+        with self._lock:
+            samples = sorted(self.samples.get(key, []))
+        if len(samples) < self.min_samples:
+            return None
+
+        index = max(0, math.ceil(self.percentile / 100 * len(samples)) - 1)
+        return int(samples[index] * self.buffer)
+
+    def record(self, key: tuple, gas_used: int):
+        """
+        Record the gas used by a transaction.
+
+        :param tuple key: The ``(address, function_name, num_calls)`` key
+        :param int gas_used: The ``gasUsed`` of the receipt
+        """
+        with self._lock:
+            if key not in self.samples:
+                self.samples[key] = deque(maxlen=self.max_samples)
+            self.samples[key].append(gas_used)
+
+    def track(self, tx_data: dict, key: tuple):
+        """
+        Remember the key of a prepared transaction, so its receipt can be
+        recorded once it is sent and confirmed.
+
+        :param dict tx_data: The prepared transaction
+        :param tuple key: The ``(address, function_name, num_calls)`` key
+        """
+        with self._lock:
+            self._pending_data[tx_data["data"]] = key
+            self._pending_data.move_to_end(tx_data["data"])
+            while len(self._pending_data) > MAX_PENDING_TRANSACTIONS:
+                self._pending_data.popitem(last=False)
+
+    def sent(self, tx_data: dict, tx_hash: str):
+        """
+        Link a sent transaction to the key it was prepared with.
+
+        :param dict tx_data: The sent transaction
+        :param str tx_hash: The transaction hash
+        """
+        with self._lock:
+            key = self._pending_data.pop(tx_data.get("data"), None)
+            if key is not None:
+                self._pending_hashes[tx_hash] = key
+                while len(self._pending_hashes) > MAX_PENDING_TRANSACTIONS:
+                    self._pending_hashes.popitem(last=False)
+
+    def confirmed(self, tx_hash: str, receipt: dict):
+        """
+        Record the gas used by a confirmed transaction, if it was tracked. If
+        the transaction reverted, the samples of its key are removed, so the
+        next transaction with the key is estimated.
+
+        :param str tx_hash: The transaction hash
+        :param dict receipt: The transaction receipt
+        """
+        with self._lock:
+            key = self._pending_hashes.pop(tx_hash, None)
+            if key is not None and receipt["status"] != 1:
+                self.samples.pop(key, None)
+        if key is not None and receipt["status"] == 1:
+            self.record(key, receipt["gasUsed"])
@@ -0,0 +1,211 @@
+import time
+import asyncio
+import weakref
+import threading
+from urllib.parse import urlparse
+import aiohttp
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+from ..constants import (
+    DEFAULT_HTTP_MAX_CONNECTIONS,
+    DEFAULT_HTTP_MAX_RETRIES,
+    DEFAULT_HTTP_TIMEOUT,
+)
+
+# responses that are retried, if retries are enabled
+RETRY_STATUS_CODES = (429, 500, 502, 503, 504)
+
+
+class HttpTransport:
+    """
+    An HTTP transport shared by the Pyth, IPFS and subgraph requests of a
+    ``Synthetix`` instance. Requests are sent through one ``requests.Session``,
+    so connections to each host are kept alive and reused::
+
+        >>> response = snx.http.get(url, params=params)
+        >>> snx.http.get_metrics()
+        {'hermes.pyth.network': {'requests': 12, 'errors': 0, 'average_time': 0.08, ...}}
+
+    Each host has a pool of at most ``max_connections`` connections, and at
+    most that many requests to a host are sent at once. Failed connections and
+    ``429`` or ``5xx`` responses are retried with an exponential backoff.
+    Responses are requested with gzip compression.
+
+    Async requests use one ``aiohttp.ClientSession`` for each event loop, from
+    ``get_async_session``, with the same limit of connections to each host.
+    Close it with ``await snx.http.aclose()`` before the event loop ends.
+
+    :param int max_retries: The number of times a request is retried
+    :param float backoff_factor: The backoff between retries in seconds, which
+        doubles after each retry
+    :param int max_connections: The maximum number of connections to each host
+    :param float timeout: The default timeout of a request in seconds
+    """
+
+    def __init__(
+        self,
+        max_retries: int = DEFAULT_HTTP_MAX_RETRIES,
+        backoff_factor: float = 0.5,
+        max_connections: int = DEFAULT_HTTP_MAX_CONNECTIONS,
+        timeout: float = DEFAULT_HTTP_TIMEOUT,
+    ):
+        self.max_connections = max_connections
+        self.timeout = timeout
+
+        retry = Retry(
+            total=max_retries,
+            backoff_factor=backoff_factor,
+            status_forcelist=RETRY_STATUS_CODES,
+            allowed_methods=None,
+            raise_on_status=False,
+        )
+        adapter = HTTPAdapter(
+            pool_maxsize=max_connections,
+            max_retries=retry,
+        )
+        self.session = requests.Session()
+        self.session.headers["Accept-Encoding"] = "gzip, deflate"
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+
+        self.metrics = {}
+        self._semaphores = {}
+        self._async_sessions = weakref.WeakKeyDictionary()
+        self._lock = threading.Lock()
+
+    def _get_semaphore(self, host: str):
+        "Get the semaphore limiting the concurrent requests to a host"
+        with self._lock:
+            if host not in self._semaphores:
+                self._semaphores[host] = threading.BoundedSemaphore(
+                    self.max_connections
+                )
+            return self._semaphores[host]
+
+    def record(self, url: str, seconds: float, error: bool = False):
+        """
+        Record the latency of a request to the metrics of its host. Requests
+        made with ``request`` are recorded automatically.
+
+        :param str url: The url of the request
+        :param float seconds: The time the request took
+        :param bool error: If the request failed
+        """
+        host = urlparse(url).netloc
+        with self._lock:
+            metrics = self.metrics.setdefault(
+                host, {"requests": 0, "errors": 0, "total_time": 0, "max_time": 0}
+            )
+            metrics["requests"] += 1
+            metrics["errors"] += 1 if error else 0
+            metrics["total_time"] += seconds
+            metrics["max_time"] = max(metrics["max_time"], seconds)
+
+    def get_metrics(self) -> dict:
+        """
+        Get the request metrics of each host. For streamed responses, the time
+        is measured until the response headers are received.
+
+        :return: A dictionary of host to the number of ``requests`` and
+            ``errors``, and the ``average_time`` and ``max_time`` in seconds
+        :rtype: dict
+        """
+        with self._lock:
+            return {
+                host: {
+                    "requests": metrics["requests"],
+                    "errors": metrics["errors"],
+                    "average_time": metrics["total_time"] / metrics["requests"],
+                    "max_time": metrics["max_time"],
+                }
+                for host, metrics in self.metrics.items()
+            }
+
+    def request(self, method: str, url: str, **kwargs) -> requests.Response:
+        """
+        Send a request, with the same arguments as ``requests.request``.
+
+        :param str method: The HTTP method
+        :param str url: The url
+        :return: The response
+        :rtype: requests.Response
+        """
+        kwargs.setdefault("timeout", self.timeout)
+        with self._get_semaphore(urlparse(url).netloc):
+            start = time.perf_counter()
+            try:
+                response = self.session.request(method, url, **kwargs)
+            except Exception:
+                self.record(url, time.perf_counter() - start, error=True)
+                raise
+
+        self.record(url, time.perf_counter() - start, response.status_code >= 400)
+        return response
+
+    def get(self, url: str, params=None, **kwargs) -> requests.Response:
+        """Send a GET request"""
+        return self.request("GET", url, params=params, **kwargs)
+
+    def post(self, url: str, **kwargs) -> requests.Response:
+        """Send a POST request"""
+        return self.request("POST", url, **kwargs)
+
+    def get_async_session(self) -> aiohttp.ClientSession:
+        """
+        Get the ``aiohttp`` session of the running event loop, which is created
+        on first use and reused by every async request on the loop.
+
+        :return: The session
+        :rtype: aiohttp.ClientSession
+        """
+        loop = asyncio.get_running_loop()
+        with self._lock:
+            session = self._async_sessions.get(loop)
+            if session is None or session.closed:
+                session = aiohttp.ClientSession(
+                    timeout=aiohttp.ClientTimeout(total=self.timeout),
+                    connector=aiohttp.TCPConnector(limit_per_host=self.max_connections),
+                    headers={"Accept-Encoding": "gzip, deflate"},
+                )
+                self._async_sessions[loop] = session
+            return session
+
+    async def aclose(self):
+        """Close the async connections of the running event loop"""
+        with self._lock:
+            session = self._async_sessions.pop(asyncio.get_running_loop(), None)
+        if session is not None:
+            await session.close()
+
+    def close(self):
+        """
+        Close the connections. Async connections are closed by ``aclose``, on
+        their event loop.
+        """
+        self.session.close()
+
+
+# transport for objects without their own, such as a partial Synthetix object
+_default_transport = None
+_default_transport_lock = threading.Lock()
+
+
+def get_http(snx) -> HttpTransport:
+    """
+    Get the HTTP transport of a Synthetix instance, or a shared default
+    transport if it does not have one.
+
+    :param Synthetix snx: Synthetix class instance
+    :return: The HTTP transport
+    :rtype: HttpTransport
+    """
+    global _default_transport
+    http = getattr(snx, "http", None)
+    if http is not None:
+        return http
+
+    with _default_transport_lock:
+        if _default_transport is None:
+            _default_transport = HttpTransport()
+        return _default_transport
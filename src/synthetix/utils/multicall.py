@@ -1,23 +1,216 @@
+import copy
+import weakref
+from contextlib import contextmanager
+from contextvars import ContextVar
+from concurrent.futures import Future, ThreadPoolExecutor
 from eth_typing import HexStr
 from web3.exceptions import ContractCustomError
-from web3._utils.abi import get_abi_output_types
+from web3._utils.abi import get_abi_input_types, get_abi_output_types
 from eth_abi import decode, encode
-from eth_utils import encode_hex, decode_hex
+from eth_abi.decoding import ContextFramesBytesIO
+from eth_abi.registry import registry
+from eth_utils import encode_hex, decode_hex, function_abi_to_4byte_selector
+from .rpc import batch_request
+from ..constants import DEFAULT_MULTICALL_MAX_CALLS, DEFAULT_MULTICALL_MAX_WORKERS
 
 
 # constants
 SELECTOR_ORACLE_DATA_REQUIRED = "0xcf2cabdf"
 SELECTOR_ORACLE_DATA_REQUIRED_WITH_FEE = "0x0e7186fb"
 SELECTOR_ERRORS = "0x0b42fd17"
+SELECTOR_ERROR_STRING = "0x08c379a0"
+SELECTOR_PANIC = "0x4e487b71"
+
+# errors of the Pyth contract and its ERC-7412 wrapper, raised by oracle
+# updates with a stale or invalid price
+SELECTORS_ORACLE_UPDATE_ERRORS = [
+    "0xea958df6",  # FeeRequired(uint256)
+    "0xb76f77f0",  # NotSupported(uint8)
+    "0x025dbdd4",  # InsufficientFee()
+    "0xe69ffece",  # InvalidUpdateData()
+    "0xe60dce71",  # InvalidUpdateDataSource()
+    "0x2acbe915",  # InvalidWormholeVaa()
+    "0xde2c57fa",  # NoFreshUpdate()
+    "0x14aebe68",  # PriceFeedNotFound()
+    "0x45805f5d",  # PriceFeedNotFoundWithinRange()
+    "0x19abf40e",  # StalePrice()
+]
+
+# attempts to fulfill the oracle data required by a call before giving up
+ERC7412_MAX_ATTEMPTS = 5
+
+# calls in the first chunk of a batch, used to estimate the gas of each call
+GAS_PROBE_CALLS = 10
+
+# active snapshots of the calling context, keyed by the id of the Synthetix instance
+_snapshots = ContextVar("synthetix_snapshots", default={})
+
+
+# result decoders of each contract class, keyed by function name. contracts
+# with the same ABI on a web3 connection share a class, and the decoders are
+# released together with it
+_result_decoders = weakref.WeakKeyDictionary()
+
+
+def get_contract_class(contract):
+    "Get the class of a contract, or the contract if it is a contract factory"
+    return contract if isinstance(contract, type) else type(contract)
+
+
+def get_result_decoder(contract, function_name):
+    """
+    Get a decoder for the result of a contract function. The decoder is built on
+    first use and shared by every contract of the same contract class, which
+    avoids looking up the function ABI and output types for every result.
+
+    :param Contract contract: The contract
+    :param str function_name: The function name
+    :return: A decoder that takes a stream of the result bytes
+    :rtype: eth_abi.decoding.TupleDecoder
+    """
+    contract_class = get_contract_class(contract)
+    decoders = _result_decoders.get(contract_class)
+    if decoders is None:
+        decoders = _result_decoders.setdefault(contract_class, {})
+
+    decoder = decoders.get(function_name)
+    if decoder is None:
+        func_abi = contract.get_function_by_name(function_name).abi
+        output_types = get_abi_output_types(func_abi)
+        decoder = decoders[function_name] = registry.get_tuple_decoder(*output_types)
+    return decoder
 
 
 def decode_result(contract, function_name, result):
-    # get the function abi
-    func_abi = contract.get_function_by_name(function_name).abi
-    output_types = get_abi_output_types(func_abi)
+    # decode the result with the decoder for this function
+    decoder = get_result_decoder(contract, function_name)
+    return decoder(ContextFramesBytesIO(result))
+
+
+# error decoders of each contract class
+_error_decoders = weakref.WeakKeyDictionary()
+
+
+def get_error_decoders(contract):
+    """
+    Get decoders for the custom errors in a contract ABI, keyed by selector.
+    The decoders are built on first use and shared by every contract of the
+    same contract class.
+
+    :param Contract contract: The contract
+    :return: A dictionary of selector to ``(name, decoder)``
+    :rtype: dict
+    """
+    contract_class = get_contract_class(contract)
+    decoders = _error_decoders.get(contract_class)
+    if decoders is None:
+        decoders = {}
+        for item in contract.abi:
+            if item.get("type") != "error":
+                continue
+            selector = encode_hex(function_abi_to_4byte_selector(item))
+            types = get_abi_input_types(item)
+            decoders[selector] = (item["name"], registry.get_tuple_decoder(*types))
+        _error_decoders[contract_class] = decoders
+    return decoders
+
+
+def decode_revert_reason(contract, data):
+    """
+    Decode the revert data of a failed call into a readable reason. Handles
+    ``Error(string)``, ``Panic(uint256)`` and the custom errors of the contract.
+
+    :param Contract contract: The contract that was called
+    :param bytes data: The revert data
+    :return: The revert reason
+    :rtype: str
+    """
+    if len(data) < 4:
+        return "execution reverted"
+
+    selector = encode_hex(data[:4])
+    try:
+        if selector == SELECTOR_ERROR_STRING:
+            return decode(["string"], data[4:])[0]
+        if selector == SELECTOR_PANIC:
+            return f"Panic(0x{decode(['uint256'], data[4:])[0]:02x})"
+
+        error_decoder = get_error_decoders(contract).get(selector)
+        if error_decoder is not None:
+            name, decoder = error_decoder
+            args = decoder(ContextFramesBytesIO(data[4:]))
+            return f"{name}({', '.join(str(arg) for arg in args)})"
+    except Exception:
+        pass
+    return f"Unknown error {encode_hex(data)}"
+
+
+def is_erc7412_error(data):
+    "Checks if revert data is an ERC-7412 error that oracle updates can fulfill"
+    return encode_hex(data[:4]) in [
+        SELECTOR_ORACLE_DATA_REQUIRED,
+        SELECTOR_ORACLE_DATA_REQUIRED_WITH_FEE,
+        SELECTOR_ERRORS,
+    ]
 
-    # decode the result
-    return decode(output_types, result)
+
+def is_oracle_update_error(error):
+    "Checks if an error was raised by an oracle update, such as a stale or invalid price"
+    data = getattr(error, "data", None)
+    if isinstance(data, bytes):
+        data = encode_hex(data)
+    return isinstance(data, str) and data[:10] in SELECTORS_ORACLE_UPDATE_ERRORS
+
+
+def decode_call_results(
+    contract_calls, results, allow_failure=False, raise_erc7412_errors=True
+):
+    """
+    Decode the ``aggregate3Value`` results of a list of contract calls. Calls
+    that failed with ERC-7412 errors are raised together as an ``Errors``
+    error, so the oracle updates for all of them are fetched at once.
+
+    :param list contract_calls: A list of ``(contract, function_name, args)``
+    :param list results: The ``(success, return_data)`` result of each call
+    :param bool allow_failure: If ``True``, each result is a dictionary with
+        ``success``, ``value`` and ``error``, and other failed calls, or
+        results that can not be decoded, do not raise an error
+    :param bool raise_erc7412_errors: If ``False``, calls that failed with
+        ERC-7412 errors are failed results like other reverts
+    :return: The decoded result of each call, in order
+    :rtype: list
+    """
+    oracle_errors = [
+        data for success, data in results if not success and is_erc7412_error(data)
+    ]
+    if len(oracle_errors) > 0 and raise_erc7412_errors:
+        error = encode(["bytes[]"], [oracle_errors])
+        raise ContractCustomError(data=SELECTOR_ERRORS + error.hex())
+
+    decoded_results = []
+    for (contract, function_name, _), (success, data) in zip(contract_calls, results):
+        if not success:
+            error = decode_revert_reason(contract, data)
+            if not allow_failure:
+                raise Exception(f"Call to {function_name} reverted: {error}")
+            decoded_results.append({"success": False, "value": None, "error": error})
+            continue
+
+        try:
+            decoded_result = decode_result(contract, function_name, data)
+        except Exception as e:
+            # a call can succeed with data that does not match the ABI
+            if not allow_failure:
+                raise
+            error = f"Failed to decode {function_name}: {e}"
+            decoded_results.append({"success": False, "value": None, "error": error})
+            continue
+
+        value = decoded_result if len(decoded_result) > 1 else decoded_result[0]
+        decoded_results.append(
+            {"success": True, "value": value, "error": None} if allow_failure else value
+        )
+    return decoded_results
 
 
 # ERC-7412 support
@@ -87,9 +280,8 @@ def make_pyth_fulfillment_request(
     fee,
 ):
     # log all of the inputs
-    erc_contract = snx.web3.eth.contract(
-        address=address,
-        abi=snx.contracts["pyth_erc7412_wrapper"]["PythERC7412Wrapper"]["abi"],
+    erc_contract = snx.contracts["pyth_erc7412_wrapper"]["PythERC7412Wrapper"].at(
+        address
     )
 
     # update_type, publish_time_or_staleness, feed_ids = args
@@ -102,23 +294,72 @@ def make_pyth_fulfillment_request(
     # assume 1 wei per price update
     value = fee if fee > 0 else len(feed_ids) * 1
 
-    update_tx = erc_contract.functions.fulfillOracleQuery(
-        encoded_args
-    ).build_transaction({"value": value, "gas": None})
-    return update_tx["to"], update_tx["data"], update_tx["value"]
+    # encode the call directly, building a transaction fetches the gas price
+    data = erc_contract.encodeABI(fn_name="fulfillOracleQuery", args=[encoded_args])
+    return erc_contract.address, data, value
 
 
 class PythVaaRequest:
-    feed_ids: list[HexStr] = []
-    publish_time = 0
-    fee = 0
+    def __init__(self, feed_ids=None, publish_time=0, fee=0):
+        self.feed_ids: list[HexStr] = [] if feed_ids is None else feed_ids
+        self.publish_time = publish_time
+        self.fee = fee
 
 
 class ERC7412Requests:
-    pyth_address = ""
-    pyth_latest: list[HexStr] = []
-    pyth_latest_fee = 0
-    pyth_vaa: list[PythVaaRequest] = []
+    def __init__(self):
+        self.pyth_address = ""
+        self.pyth_latest: list[HexStr] = []
+        self.pyth_latest_fee = 0
+        self.pyth_vaa: list[PythVaaRequest] = []
+
+    def add_pyth_latest(self, feed_ids, fee=0):
+        "Add latest price feeds, skipping feeds that are already requested"
+        new_feed_ids = [
+            feed_id
+            for feed_id in dict.fromkeys(feed_ids)
+            if feed_id not in self.pyth_latest
+        ]
+        if len(new_feed_ids) > 0:
+            self.pyth_latest = self.pyth_latest + new_feed_ids
+            self.pyth_latest_fee = self.pyth_latest_fee + fee
+        return len(new_feed_ids)
+
+    def add_pyth_vaa(self, feed_ids, publish_time, fee=0):
+        "Add price feeds at a publish time, merged with requests for the same time"
+        vaa_request = next(
+            (r for r in self.pyth_vaa if r.publish_time == publish_time), None
+        )
+        if vaa_request is None:
+            vaa_request = PythVaaRequest(publish_time=publish_time)
+            self.pyth_vaa = self.pyth_vaa + [vaa_request]
+
+        new_feed_ids = [
+            feed_id
+            for feed_id in dict.fromkeys(feed_ids)
+            if feed_id not in vaa_request.feed_ids
+        ]
+        if len(new_feed_ids) > 0:
+            vaa_request.feed_ids = vaa_request.feed_ids + new_feed_ids
+            vaa_request.fee = vaa_request.fee + fee
+        return len(new_feed_ids)
+
+    def merge(self, other):
+        """
+        Merge the requests from another ``ERC7412Requests``, so each update type
+        and publish time is fulfilled by one call with deduplicated feeds.
+
+        :param ERC7412Requests other: The requests to merge
+        :return: The number of feeds that were not already requested
+        :rtype: int
+        """
+        if other.pyth_address:
+            self.pyth_address = other.pyth_address
+
+        num_new = self.add_pyth_latest(other.pyth_latest, other.pyth_latest_fee)
+        for r in other.pyth_vaa:
+            num_new += self.add_pyth_vaa(r.feed_ids, r.publish_time, r.fee)
+        return num_new
 
 
 def aggregate_erc7412_price_requests(snx, error, requests=None):
@@ -155,15 +396,10 @@ def aggregate_erc7412_price_requests(snx, error, requests=None):
             requests.pyth_address = address
             if update_type == 1:
                 # fetch the data from pyth for those feed ids
-                requests.pyth_latest = requests.pyth_latest + feed_ids
-                requests.pyth_latest_fee = requests.pyth_latest_fee + fee
+                requests.add_pyth_latest(feed_ids, fee)
             elif update_type == 2:
                 # fetch the data from pyth for those feed ids
-                vaa_request = PythVaaRequest()
-                vaa_request.feed_ids = feed_ids
-                vaa_request.publish_time = args[1]
-                vaa_request.fee = fee
-                requests.pyth_vaa = requests.pyth_vaa + [vaa_request]
+                requests.add_pyth_vaa(feed_ids, args[1], fee)
             else:
                 snx.logger.error(f"Unknown update type: {update_type}")
                 raise error
@@ -188,69 +424,379 @@ def aggregate_erc7412_price_requests(snx, error, requests=None):
     return requests
 
 
-def handle_erc7412_error(snx, error):
-    "When receiving a ERC7412 error, will return an updated list of calls with the required price updates"
-    requests = aggregate_erc7412_price_requests(snx, error)
-    calls = []
-
+def get_pyth_fetches(requests, fork_publish_time=None):
+    """
+    List the Pyth price fetches needed to fulfill aggregated ERC7412 requests.
+    Each fetch is a dictionary with the ``feed_ids`` and ``publish_time`` to
+    fetch, and the ``update_type``, ``publish_time_or_staleness`` and ``fee``
+    of the fulfillment call.
+
+    :param ERC7412Requests requests: The aggregated requests
+    :param int | None fork_publish_time: The publish time to fetch latest
+        prices at, used on forks
+    :return: A list of fetches
+    :rtype: list
+    """
+    fetches = []
     if len(requests.pyth_latest) > 0:
-        # fetch the data from pyth for those feed ids
-        if not snx.is_fork:
-            pyth_data = snx.pyth.get_price_from_ids(requests.pyth_latest)
-            price_update_data = pyth_data["price_update_data"]
-        else:
-            # if it's a fork, get the price for the latest block
-            # this avoids providing "future" prices to the contract on a fork
-            block = snx.web3.eth.get_block("latest")
-
-            # set a manual 60 second staleness
-            publish_time = block.timestamp - 60
-            pyth_data = snx.pyth.get_price_from_ids(
-                requests.pyth_latest, publish_time=publish_time
-            )
-            price_update_data = pyth_data["price_update_data"]
-
-        # create a new request
         # TODO: the actual number should go here for staleness
-        to, data, value = make_pyth_fulfillment_request(
-            snx,
-            requests.pyth_address,
-            1,
-            requests.pyth_latest,
-            price_update_data,
-            3600,
-            requests.pyth_latest_fee,
+        fetches.append(
+            {
+                "feed_ids": requests.pyth_latest,
+                "publish_time": fork_publish_time,
+                "update_type": 1,
+                "publish_time_or_staleness": 3600,
+                "fee": requests.pyth_latest_fee,
+            }
         )
 
-        calls.append((to, True, value, data))
+    for r in requests.pyth_vaa:
+        fetches.append(
+            {
+                "feed_ids": r.feed_ids,
+                "publish_time": r.publish_time,
+                "update_type": 2,
+                "publish_time_or_staleness": r.publish_time,
+                "fee": r.fee,
+            }
+        )
+    return fetches
+
+
+def make_fulfillment_call(snx, requests, fetch, pyth_data):
+    "Creates the call that fulfills one Pyth fetch with the fetched price data"
+    to, data, value = make_pyth_fulfillment_request(
+        snx,
+        requests.pyth_address,
+        fetch["update_type"],
+        fetch["feed_ids"],
+        pyth_data["price_update_data"],
+        fetch["publish_time_or_staleness"],
+        fetch["fee"],
+    )
+    return (to, True, value, data)
 
-    if len(requests.pyth_vaa) > 0:
-        for r in requests.pyth_vaa:
-            # fetch the data from pyth for those feed ids
-            pyth_data = snx.pyth.get_price_from_ids(
-                r.feed_ids, publish_time=r.publish_time
-            )
-            price_update_data = pyth_data["price_update_data"]
-
-            # create a new request
-            to, data, value = make_pyth_fulfillment_request(
-                snx,
-                requests.pyth_address,
-                2,
-                r.feed_ids,
-                price_update_data,
-                r.publish_time,
-                r.fee,
-            )
 
-            calls.append((to, True, value, data))
+def make_fulfillment_calls(snx, requests):
+    "Fetches the price data for aggregated ERC7412 requests and returns the calls that fulfill them"
+    fork_publish_time = None
+    if snx.is_fork and len(requests.pyth_latest) > 0:
+        # if it's a fork, get the price for the latest block
+        # this avoids providing "future" prices to the contract on a fork
+        block = snx.web3.eth.get_block("latest")
+
+        # set a manual 60 second staleness
+        fork_publish_time = block.timestamp - 60
+
+    calls = []
+    for fetch in get_pyth_fetches(requests, fork_publish_time):
+        # fetch the data from pyth for those feed ids
+        pyth_data = snx.pyth.get_price_from_ids(
+            fetch["feed_ids"], publish_time=fetch["publish_time"]
+        )
+        if pyth_data is None:
+            snx.logger.warning(f"No Pyth price data for feeds {fetch['feed_ids']}")
+            continue
+        calls.append(make_fulfillment_call(snx, requests, fetch, pyth_data))
 
     # note: more calls (ex. new oracle providers) can be added here in the future
 
     return calls
 
 
-def write_erc7412(snx, contract, function_name, args, tx_params={}, calls=[]):
+def handle_erc7412_error(snx, error, requests=None):
+    "When receiving a ERC7412 error, will return an updated list of calls with the required price updates"
+    requests = aggregate_erc7412_price_requests(snx, error, requests)
+    return make_fulfillment_calls(snx, requests)
+
+
+# learned oracle requirements
+def get_args_shape(args):
+    "Describes the arguments of a call by type, and by length for lists"
+    return tuple(
+        (
+            ("list", len(arg))
+            if isinstance(arg, (list, tuple))
+            else (type(arg).__name__, None)
+        )
+        for arg in args
+    )
+
+
+def get_erc7412_requirement_key(contract_calls):
+    "Keys the oracle requirements of a set of calls by contract, function and args shape"
+    return frozenset(
+        (contract.address, function_name, get_args_shape(args))
+        for contract, function_name, args in contract_calls
+    )
+
+
+def get_erc7412_requirements(snx):
+    "Gets the oracle requirements learned by a Synthetix instance"
+    return snx.__dict__.setdefault("_erc7412_requirements", {})
+
+
+def learn_erc7412_requests(snx, key, requests):
+    """
+    Remember the latest price feeds required by a set of calls, so the next
+    calls with the same key can fulfill them up front. Updates for a specific
+    publish time are only valid for one call, so they are not remembered.
+
+    :param Synthetix snx: Synthetix class instance
+    :param frozenset key: The key from ``get_erc7412_requirement_key``
+    :param ERC7412Requests requests: The requests decoded from an error
+    """
+    if len(requests.pyth_latest) == 0:
+        return
+
+    requirements = get_erc7412_requirements(snx)
+    requirement = requirements.get(key, {"address": "", "feed_ids": [], "fee": 0})
+    new_feed_ids = [
+        feed_id
+        for feed_id in dict.fromkeys(requests.pyth_latest)
+        if feed_id not in requirement["feed_ids"]
+    ]
+    if len(new_feed_ids) == 0:
+        return
+
+    requirements[key] = {
+        "address": requests.pyth_address,
+        "feed_ids": requirement["feed_ids"] + new_feed_ids,
+        "fee": requirement["fee"] + requests.pyth_latest_fee,
+    }
+
+
+def forget_erc7412_requests(snx, key, requests):
+    """
+    Forget the latest price feeds of requests that could not be fulfilled, so
+    the next calls with the same key do not prepend updates for them.
+
+    :param Synthetix snx: Synthetix class instance
+    :param frozenset key: The key from ``get_erc7412_requirement_key``
+    :param ERC7412Requests requests: The requests that were not fulfilled
+    """
+    requirements = get_erc7412_requirements(snx)
+    requirement = requirements.get(key)
+    if requirement is None:
+        return
+
+    feed_ids = [f for f in requirement["feed_ids"] if f not in requests.pyth_latest]
+    if len(feed_ids) == 0:
+        requirements.pop(key, None)
+    else:
+        requirements[key] = {**requirement, "feed_ids": feed_ids}
+
+
+def get_learned_erc7412_requests(snx, key):
+    """
+    Get the oracle requirements learned for a key, as requests that can be
+    fulfilled with ``make_fulfillment_calls``.
+
+    :param Synthetix snx: Synthetix class instance
+    :param frozenset key: The key from ``get_erc7412_requirement_key``
+    :return: The learned requests, or ``None`` if nothing was learned
+    :rtype: ERC7412Requests | None
+    """
+    requirement = get_erc7412_requirements(snx).get(key)
+    if requirement is None:
+        return None
+
+    requests = ERC7412Requests()
+    requests.pyth_address = requirement["address"]
+    requests.pyth_latest = requirement["feed_ids"]
+    requests.pyth_latest_fee = requirement["fee"]
+    return requests
+
+
+def get_learned_erc7412_calls(snx, key):
+    """
+    Get the oracle updates that were required the last time calls with the same
+    key were made. Returns an empty list if nothing was learned, or if the price
+    data can not be fetched.
+
+    :param Synthetix snx: Synthetix class instance
+    :param frozenset key: The key from ``get_erc7412_requirement_key``
+    :return: Calls to prepend to the multicall
+    :rtype: list
+    """
+    requests = get_learned_erc7412_requests(snx, key)
+    if requests is None:
+        return []
+
+    try:
+        return make_fulfillment_calls(snx, requests)
+    except Exception as e:
+        snx.logger.debug(f"Failed to prepare learned oracle updates: {e}")
+        return []
+
+
+def execute_erc7412(
+    snx, key, calls, execute, learned_calls=None, on_unfulfilled=None
+):
+    """
+    Run a multicall, handling ERC-7412 errors by prepending oracle updates. The
+    updates required the last time calls with the same key were made are
+    prepended up front, which usually avoids a reverted call. If the learned
+    updates fail with a stale or invalid price, the call is retried without
+    them, and other reverts are raised. If the call still reverts with a new
+    requirement, the updates are fetched, remembered and the call is retried. The requirements of every attempt are merged, so
+    each retry has one fulfillment call per update type with deduplicated
+    feeds, and the call fails after ``ERC7412_MAX_ATTEMPTS`` attempts.
+
+    If ``on_unfulfilled`` is set, a requirement that is still raised after its
+    updates were sent, or after the last attempt, is forgotten and
+    ``on_unfulfilled`` is called with the calls instead of raising an error.
+
+    :param Synthetix snx: Synthetix class instance
+    :param frozenset key: The key from ``get_erc7412_requirement_key``
+    :param list calls: The ``aggregate3Value`` calls to make
+    :param function execute: Function that makes the multicall, called with the
+        full list of calls
+    :param list | None learned_calls: The learned updates to prepend, if they
+        were already fetched by ``get_learned_erc7412_calls``
+    :param function | None on_unfulfilled: Function that makes the multicall
+        when the oracle requirements can not be met
+    :return: The result of ``execute``
+    """
+    if learned_calls is None:
+        learned_calls = get_learned_erc7412_calls(snx, key)
+
+    # start from the learned requests, so each attempt has one merged update
+    requests = ERC7412Requests()
+    learned_requests = get_learned_erc7412_requests(snx, key)
+    if learned_requests is not None and len(learned_calls) > 0:
+        requests.merge(learned_requests)
+    fulfillment_calls = learned_calls
+    last_error = None
+    unfulfilled = None
+    for _ in range(ERC7412_MAX_ATTEMPTS):
+        try:
+            return execute(fulfillment_calls + calls)
+        except Exception as e:
+            # check if the error is related to oracle data
+            snx.logger.debug(f"Simulation failed, decoding the error {e}")
+            try:
+                error_requests = aggregate_erc7412_price_requests(snx, e)
+            except Exception:
+                if len(learned_calls) == 0 or not is_oracle_update_error(e):
+                    raise
+
+                # the learned updates are no longer valid, retry without them
+                snx.logger.debug("Retrying without the learned oracle updates")
+                get_erc7412_requirements(snx).pop(key, None)
+                learned_calls = []
+                requests = ERC7412Requests()
+                fulfillment_calls = []
+                continue
+
+            # handle the error by merging the requests and rebuilding the calls
+            num_new = requests.merge(error_requests)
+            if len(error_requests.pyth_latest) + len(error_requests.pyth_vaa) > 0:
+                unfulfilled = error_requests
+                if num_new == 0 and on_unfulfilled is not None:
+                    # the updates were already sent and did not fulfill it
+                    break
+            learn_erc7412_requests(snx, key, error_requests)
+            fulfillment_calls = make_fulfillment_calls(snx, requests)
+            last_error = e
+
+    if on_unfulfilled is not None and unfulfilled is not None:
+        snx.logger.warning("Oracle data can not be fulfilled, marking calls failed")
+        forget_erc7412_requests(snx, key, unfulfilled)
+        return on_unfulfilled(fulfillment_calls + calls)
+
+    raise Exception(
+        f"Oracle data still required after {ERC7412_MAX_ATTEMPTS} attempts"
+    ) from last_error
+
+
+# block-pinned snapshots
+@contextmanager
+def snapshot(snx, block_number):
+    """
+    Pin the ``"latest"`` reads of ``call_erc7412``, ``multicall_erc7412`` and
+    ``batch_erc7412`` to a block, and cache their results. The results are kept
+    until a snapshot is taken at another block, and each read returns a copy,
+    so changing a result does not change the cache. The snapshot only applies to
+    the calling context, so other threads using the same instance keep reading
+    the latest block.
+
+    :param Synthetix snx: Synthetix class instance
+    :param int block_number: The block number to read at
+    :return: A context manager that yields the block number
+    """
+    results = snx.__dict__.get("_snapshot_results")
+    if results is None or results["block"] != block_number:
+        results = {"block": block_number, "results": {}}
+        snx._snapshot_results = results
+
+    token = _snapshots.set({**_snapshots.get(), id(snx): results})
+    try:
+        yield block_number
+    finally:
+        _snapshots.reset(token)
+
+
+def get_snapshot_block(snx, block):
+    """
+    Get the block to read at and the result cache for a read. Reads at
+    ``"latest"`` inside a snapshot use the snapshot block and its cache.
+
+    :param Synthetix snx: Synthetix class instance
+    :param str | int block: The block requested by the caller
+    :return: The block, and the result cache or ``None``
+    :rtype: tuple
+    """
+    snapshot = _snapshots.get().get(id(snx))
+    if snapshot is None or block != "latest":
+        return block, None
+    return snapshot["block"], snapshot["results"]
+
+
+def get_call_cache_key(contract, function_name, args):
+    "Keys a read by contract, function and args, or returns None if the args are not hashable"
+
+    def freeze(value):
+        if isinstance(value, (list, tuple)):
+            return tuple(freeze(v) for v in value)
+        hash(value)
+        return value
+
+    try:
+        return (contract.address, function_name, freeze(args))
+    except TypeError:
+        return None
+
+
+def get_uncached_calls(cache, contract_calls, allow_failure=False):
+    """
+    Get the cache keys of the reads in a batch, and the unique reads that are
+    not cached yet. Returns ``None`` if any read can not be cached.
+
+    :param dict cache: The snapshot result cache
+    :param list contract_calls: A list of ``(contract, function_name, args)``
+    :param bool allow_failure: If the results are result dictionaries, which
+        are cached separately from plain values
+    :return: The cache key of each read, and the uncached reads by key
+    :rtype: tuple | None
+    """
+    keys = [get_call_cache_key(*contract_call) for contract_call in contract_calls]
+    if None in keys:
+        return None
+    if allow_failure:
+        keys = [key + ("allow_failure",) for key in keys]
+
+    uncached = {
+        key: contract_call
+        for key, contract_call in zip(keys, contract_calls)
+        if key not in cache
+    }
+    return keys, uncached
+
+
+def write_erc7412(
+    snx, contract, function_name, args, tx_params={}, calls=[], simulate=False
+):
     # prepare the initial call
     this_call = [
         (
@@ -262,35 +808,52 @@ def write_erc7412(snx, contract, function_name, args, tx_params={}, calls=[]):
     ]
     calls = calls + this_call
 
-    while True:
-        try:
-            # unpack calls into the multicallThrough inputs
-            total_value = sum([i[2] for i in calls])
-
-            # create the transaction and do a static call
-            tx_params = snx._get_tx_params(value=total_value)
-            tx_params = snx.multicall.functions.aggregate3Value(
-                calls
-            ).build_transaction(tx_params)
+    def execute(calls):
+        # unpack calls into the multicallThrough inputs
+        total_value = sum([i[2] for i in calls])
+
+        # use the learned gas limit for this call and number of oracle updates
+        gas_model = getattr(snx, "gas_model", None)
+        gas_key = (contract.address, function_name, len(calls) - 1)
+        gas = gas_model.estimate(gas_key) if gas_model is not None else None
+
+        # create the transaction, estimating the gas unless it is known. a
+        # reverted transaction evicts the learned limit, so the next one is
+        # estimated again
+        tx_params = snx._get_tx_params(value=total_value)
+        if gas is not None:
+            if simulate:
+                snx.multicall.functions.aggregate3Value(calls).call(tx_params)
+            tx_params["gas"] = gas
+        tx_params = snx.multicall.functions.aggregate3Value(calls).build_transaction(
+            tx_params
+        )
 
-            # buffer the gas limit
+        # buffer the gas limit
+        if gas is None:
             tx_params["gas"] = int(tx_params["gas"] * 1.15)
+        if gas_model is not None:
+            gas_model.track(tx_params, gas_key)
 
-            # if simulation passes, return the transaction
-            snx.logger.debug(f"Simulated tx successfully: {tx_params}")
-            return tx_params
-        except Exception as e:
-            # check if the error is related to oracle data
-            snx.logger.debug(f"Simulation failed, decoding the error {e}")
+        snx.logger.debug(f"Prepared tx successfully: {tx_params}")
+        return tx_params
 
-            # handle the error by appending calls
-            calls = handle_erc7412_error(snx, e) + calls
+    key = get_erc7412_requirement_key([(contract, function_name, args)])
+    return execute_erc7412(snx, key, calls, execute)
 
 
 def call_erc7412(snx, contract, function_name, args, calls=[], block="latest"):
     # fix args
     args = args if isinstance(args, (list, tuple)) else (args,)
 
+    # reads at "latest" in a snapshot use its block and result cache
+    block, cache = get_snapshot_block(snx, block)
+    cache_key = None
+    if cache is not None and len(calls) == 0:
+        cache_key = get_call_cache_key(contract, function_name, args)
+        if cache_key in cache:
+            return copy.deepcopy(cache[cache_key])
+
     # prepare the initial calls
     this_call = (
         contract.address,
@@ -300,37 +863,252 @@ def call_erc7412(snx, contract, function_name, args, calls=[], block="latest"):
     )
     calls = calls + [this_call]
 
-    while True:
-        try:
-            total_value = sum(i[2] for i in calls)
-
-            # call it
-            tx_params = snx._get_tx_params(value=total_value)
-            call = snx.multicall.functions.aggregate3Value(calls).call(
-                tx_params, block_identifier=block
-            )
+    def execute(calls):
+        total_value = sum(i[2] for i in calls)
 
-            # call was successful, decode the result
-            decoded_result = decode_result(contract, function_name, call[-1][1])
-            return decoded_result if len(decoded_result) > 1 else decoded_result[0]
+        # call it
+        tx_params = snx._get_tx_params(value=total_value)
+        call = snx.multicall.functions.aggregate3Value(calls).call(
+            tx_params, block_identifier=block
+        )
 
-        except Exception as e:
-            # check if the error is related to oracle data
-            snx.logger.debug(f"Simulation failed, decoding the error {e}")
+        # call was successful, decode the result
+        return decode_call_results([(contract, function_name, args)], call[-1:])[0]
 
-            # handle the error by appending calls
-            calls = handle_erc7412_error(snx, e) + calls
+    key = get_erc7412_requirement_key([(contract, function_name, args)])
+    result = execute_erc7412(snx, key, calls, execute)
+    if cache_key is not None:
+        cache[cache_key] = copy.deepcopy(result)
+    return result
 
 
 def multicall_erc7412(
-    snx, contract, function_name, args_list, calls=[], block="latest"
+    snx,
+    contract,
+    function_name,
+    args_list,
+    calls=[],
+    block="latest",
+    allow_failure=False,
 ):
+    return batch_erc7412(
+        snx,
+        [(contract, function_name, args) for args in args_list],
+        calls=calls,
+        block=block,
+        allow_failure=allow_failure,
+    )
+
+
+def batch_erc7412(snx, contract_calls, calls=[], block="latest", allow_failure=False):
+    """
+    Read from several contract functions in a single ``aggregate3Value`` call,
+    handling ERC-7412 errors by prepending oracle updates. Unlike
+    ``multicall_erc7412``, each call can target a different contract and
+    function::
+
+        >>> batch_erc7412(snx, [
+        ...     (market_proxy, "getMarkets", ()),
+        ...     (market_proxy, "metadata", (100,)),
+        ...     (erc20_contract, "symbol", ()),
+        ... ])
+
+    Large batches are split into chunks of at most ``snx.multicall_max_calls``
+    calls, and of at most ``snx.multicall_max_gas`` estimated gas if it is set.
+    The first chunk of a new batch is sent alone to learn its oracle
+    requirements and gas, then the other chunks are sent in parallel with the
+    oracle updates prepended to each. Inside ``snx.snapshot()``, reads at
+    ``"latest"`` are made at the snapshot block and cached.
+
+    By default a failed call raises an error with its revert reason. With
+    ``allow_failure=True``, the other calls are still returned, and each result
+    is a dictionary with ``success``, the decoded ``value`` and the decoded
+    revert reason in ``error``::
+
+        >>> batch_erc7412(snx, contract_calls, allow_failure=True)
+        [{"success": True, "value": 100, "error": None},
+         {"success": False, "value": None, "error": "MarketNotFound(200)"}]
+
+    :param Synthetix snx: Synthetix class instance
+    :param list contract_calls: A list of ``(contract, function_name, args)``
+    :param list calls: Calls to prepend, such as oracle updates
+    :param str | int block: The block to read at
+    :param bool allow_failure: If ``True``, return a result dictionary for
+        each call instead of raising an error for failed calls
+    :return: The decoded result of each call, in order
+    :rtype: list
+    """
+    if len(contract_calls) == 0:
+        return []
+
     # check if args is a list of lists or tuples
     # correct the format if it is not
-    args_list = [
-        args if isinstance(args, (list, tuple)) else (args,) for args in args_list
+    contract_calls = [
+        (contract, function_name, args if isinstance(args, (list, tuple)) else (args,))
+        for contract, function_name, args in contract_calls
+    ]
+
+    # reads at "latest" in a snapshot use its block, and only uncached reads
+    # are made
+    block, cache = get_snapshot_block(snx, block)
+    if cache is not None and len(calls) == 0:
+        cached = get_uncached_calls(cache, contract_calls, allow_failure)
+        if cached is not None:
+            keys, uncached = cached
+            results = batch_erc7412(
+                snx, list(uncached.values()), block=block, allow_failure=allow_failure
+            )
+            cache.update(zip(uncached.keys(), results))
+            return [copy.deepcopy(cache[key]) for key in keys]
+
+    key = get_erc7412_requirement_key(contract_calls)
+
+    # the estimated gas of each call, for batches that were chunked before
+    call_gas = snx.__dict__.setdefault("_multicall_call_gas", {})
+    max_gas = getattr(snx, "multicall_max_gas", None)
+    probe_gas = (
+        max_gas and key not in call_gas and len(contract_calls) > GAS_PROBE_CALLS
+    )
+    chunks = get_multicall_chunks(snx, contract_calls, call_gas.get(key))
+    if len(chunks) == 1 and not probe_gas:
+        return execute_batch_erc7412(
+            snx, key, contract_calls, calls, block, allow_failure=allow_failure
+        )
+
+    results = []
+    if key not in call_gas:
+        # send the first chunk alone to learn the oracle updates and gas per call
+        first_chunk = contract_calls[:GAS_PROBE_CALLS] if probe_gas else chunks[0]
+        results = execute_batch_erc7412(
+            snx, key, first_chunk, calls, block, allow_failure=allow_failure
+        )
+        call_gas[key] = (
+            estimate_call_gas(snx, key, first_chunk, calls, block)
+            if probe_gas
+            else None
+        )
+        chunks = get_multicall_chunks(
+            snx, contract_calls[len(first_chunk) :], call_gas[key]
+        )
+
+    # send the chunks in parallel, each with the same oracle updates
+    learned_calls = get_learned_erc7412_calls(snx, key)
+    max_workers = getattr(snx, "multicall_max_workers", DEFAULT_MULTICALL_MAX_WORKERS)
+    with ThreadPoolExecutor(max_workers=min(max_workers, len(chunks))) as executor:
+        chunk_results = executor.map(
+            lambda chunk: execute_batch_erc7412(
+                snx, key, chunk, calls, block, learned_calls, allow_failure
+            ),
+            chunks,
+        )
+        for chunk_result in chunk_results:
+            results.extend(chunk_result)
+    return results
+
+
+def get_multicall_chunks(snx, contract_calls, call_gas=None):
+    """
+    Split calls into chunks of at most ``snx.multicall_max_calls`` calls. If
+    ``snx.multicall_max_gas`` is set and the gas of each call is known, the
+    chunks are also limited to that much gas.
+
+    :param Synthetix snx: Synthetix class instance
+    :param list contract_calls: A list of ``(contract, function_name, args)``
+    :param int | None call_gas: The estimated gas of each call
+    :return: A list of chunks, in order
+    :rtype: list
+    """
+    max_calls = getattr(snx, "multicall_max_calls", DEFAULT_MULTICALL_MAX_CALLS)
+    max_calls = max_calls or len(contract_calls)
+    max_gas = getattr(snx, "multicall_max_gas", None)
+    if max_gas and call_gas:
+        max_calls = max(1, min(max_calls, max_gas // call_gas))
+
+    return [
+        contract_calls[i : i + max_calls]
+        for i in range(0, len(contract_calls), max_calls)
+    ]
+
+
+def estimate_call_gas(snx, key, contract_calls, calls=[], block="latest"):
+    """
+    Estimate the gas of each call in a batch, from the difference between the
+    gas of a multicall with and without the calls. Both estimates are sent in
+    one JSON-RPC batch. Returns ``None`` if the gas can not be estimated.
+
+    :param Synthetix snx: Synthetix class instance
+    :param frozenset key: The key from ``get_erc7412_requirement_key``
+    :param list contract_calls: A list of ``(contract, function_name, args)``
+    :param list calls: Calls to prepend, such as oracle updates
+    :param str | int block: The block to estimate at
+    :return: The average gas of each call
+    :rtype: int | None
+    """
+    these_calls = [
+        (
+            contract.address,
+            True,
+            0,
+            contract.encodeABI(fn_name=function_name, args=args),
+        )
+        for contract, function_name, args in contract_calls
     ]
-    num_prepended_calls = len(calls)
+    calls = get_learned_erc7412_calls(snx, key) + calls
+    block = hex(block) if isinstance(block, int) else block
+
+    estimates = batch_request(
+        snx.web3,
+        [
+            (
+                "eth_estimateGas",
+                [
+                    {
+                        "to": snx.multicall.address,
+                        "value": hex(sum(i[2] for i in multicall_calls)),
+                        "data": snx.multicall.encodeABI(
+                            fn_name="aggregate3Value", args=[multicall_calls]
+                        ),
+                    },
+                    block,
+                ],
+            )
+            for multicall_calls in [calls, calls + these_calls]
+        ],
+    )
+    for estimate in estimates:
+        if isinstance(estimate, Exception):
+            snx.logger.debug(f"Failed to estimate multicall gas: {estimate}")
+            return None
+
+    gas_without_calls, gas_with_calls = [int(estimate, 16) for estimate in estimates]
+    return max(1, (gas_with_calls - gas_without_calls) // len(contract_calls))
+
+
+def execute_batch_erc7412(
+    snx,
+    key,
+    contract_calls,
+    calls=[],
+    block="latest",
+    learned_calls=None,
+    allow_failure=False,
+):
+    """
+    Make one ``aggregate3Value`` call for a list of contract calls and decode
+    the results. Used by ``batch_erc7412`` for each chunk.
+
+    :param Synthetix snx: Synthetix class instance
+    :param frozenset key: The key from ``get_erc7412_requirement_key``
+    :param list contract_calls: A list of ``(contract, function_name, args)``
+    :param list calls: Calls to prepend, such as oracle updates
+    :param str | int block: The block to read at
+    :param list | None learned_calls: The learned oracle updates, if fetched
+    :param bool allow_failure: If ``True``, return a result dictionary for
+        each call instead of raising an error for failed calls
+    :return: The decoded result of each call, in order
+    :rtype: list
+    """
+    num_calls = len(contract_calls)
 
     # prepare the initial calls
     these_calls = [
@@ -340,36 +1118,91 @@ def multicall_erc7412(
             0,
             contract.encodeABI(fn_name=function_name, args=args),
         )
-        for args in args_list
+        for contract, function_name, args in contract_calls
     ]
     calls = calls + these_calls
-    num_calls = len(calls) - num_prepended_calls
-
-    while True:
-        try:
-            total_value = sum(i[2] for i in calls)
 
-            # call it
-            call = snx.multicall.functions.aggregate3Value(calls).call(
-                {"value": total_value}, block_identifier=block
-            )
+    def execute(calls, raise_erc7412_errors=True):
+        total_value = sum(i[2] for i in calls)
 
-            # call was successful, decode the result
-            calls_to_decode = call[-num_calls:]
+        # call it
+        call = snx.multicall.functions.aggregate3Value(calls).call(
+            {"value": total_value}, block_identifier=block
+        )
 
-            decoded_results = [
-                decode_result(contract, function_name, result[1])
-                for result in calls_to_decode
-            ]
-            decoded_results = [
-                decoded_result if len(decoded_result) > 1 else decoded_result[0]
-                for decoded_result in decoded_results
-            ]
-            return decoded_results
+        # call was successful, decode the result
+        return decode_call_results(
+            contract_calls, call[-num_calls:], allow_failure, raise_erc7412_errors
+        )
 
+    # with allow_failure, calls whose oracle data can not be fetched fail alone
+    on_unfulfilled = (lambda calls: execute(calls, False)) if allow_failure else None
+    return execute_erc7412(snx, key, calls, execute, learned_calls, on_unfulfilled)
+
+
+class MulticallBatch:
+    """
+    Collect reads from any mix of contracts and functions, and make them in one
+    ``aggregate3Value`` call. ERC-7412 oracle updates are handled once for the
+    whole batch, and each result is decoded with the ABI of its own function::
+
+        >>> batch = MulticallBatch(snx)
+        >>> markets = batch.add(market_proxy, "getMarkets")
+        >>> balance = batch.add(account_proxy, "balanceOf", (snx.address,))
+        >>> batch.execute()
+        >>> markets.result(), balance.result()
+
+    :param Synthetix snx: Synthetix class instance
+    :param list calls: Calls to prepend, such as oracle updates
+    :param str | int block: The block to read at
+    """
+
+    def __init__(self, snx, calls: list = None, block="latest"):
+        self.snx = snx
+        self.calls = calls if calls is not None else []
+        self.block = block
+        self._pending = []
+
+    def __len__(self):
+        return len(self._pending)
+
+    def add(self, contract, function_name: str, args=()) -> Future:
+        """
+        Add a read to the batch.
+
+        :param Contract contract: The contract to call
+        :param str function_name: The function to call
+        :param tuple args: The function arguments
+        :return: A future, resolved with the decoded result when the batch
+            is executed
+        :rtype: Future
+        """
+        future = Future()
+        self._pending.append(((contract, function_name, args), future))
+        return future
+
+    def execute(self) -> list:
+        """
+        Make the reads added since the last call in one ``aggregate3Value``
+        call, and resolve their futures. If the call fails, every future is
+        resolved with the error, which is also raised.
+
+        :return: The decoded result of each read, in the order they were added
+        :rtype: list
+        """
+        pending, self._pending = self._pending, []
+        try:
+            results = batch_erc7412(
+                self.snx,
+                [contract_call for contract_call, _ in pending],
+                calls=self.calls,
+                block=self.block,
+            )
         except Exception as e:
-            # check if the error is related to oracle data
-            snx.logger.debug(f"Simulation failed, decoding the error {e}")
+            for _, future in pending:
+                future.set_exception(e)
+            raise
 
-            # handle the error by appending calls
-            calls = handle_erc7412_error(snx, e) + calls
+        for (_, future), result in zip(pending, results):
+            future.set_result(result)
+        return results
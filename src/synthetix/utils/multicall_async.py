@@ -0,0 +1,427 @@
+"""
+Async versions of the ERC-7412 functions in ``synthetix.utils.multicall``.
+
+The functions use ``snx.async_web3`` and fetch Pyth price data with
+``snx.pyth.get_price_from_ids_async``, so many reads can run concurrently on
+one event loop without threads::
+
+    >>> import asyncio
+    >>> from synthetix.utils.multicall_async import call_erc7412_async
+    >>> prices = await asyncio.gather(*[
+    ...     call_erc7412_async(snx, market_proxy, "indexPrice", (market_id,))
+    ...     for market_id in market_ids
+    ... ])
+
+Oracle requirements learned by the sync and async functions are shared.
+"""
+
+import copy
+import asyncio
+from web3._utils.async_transactions import async_fill_transaction_defaults
+from ..constants import DEFAULT_MULTICALL_MAX_WORKERS
+from .multicall import (
+    ERC7412_MAX_ATTEMPTS,
+    ERC7412Requests,
+    aggregate_erc7412_price_requests,
+    decode_call_results,
+    decode_result,
+    forget_erc7412_requests,
+    get_call_cache_key,
+    get_erc7412_requirement_key,
+    get_erc7412_requirements,
+    get_learned_erc7412_requests,
+    get_multicall_chunks,
+    get_pyth_fetches,
+    get_snapshot_block,
+    get_uncached_calls,
+    is_oracle_update_error,
+    learn_erc7412_requests,
+    make_fulfillment_call,
+)
+
+
+async def make_fulfillment_calls_async(snx, requests):
+    "Fetches the price data for aggregated ERC7412 requests concurrently and returns the calls that fulfill them"
+    fork_publish_time = None
+    if snx.is_fork and len(requests.pyth_latest) > 0:
+        # if it's a fork, get the price for the latest block
+        # this avoids providing "future" prices to the contract on a fork
+        block = await snx.async_web3.eth.get_block("latest")
+
+        # set a manual 60 second staleness
+        fork_publish_time = block.timestamp - 60
+
+    fetches = get_pyth_fetches(requests, fork_publish_time)
+    pyth_data = await asyncio.gather(
+        *[
+            snx.pyth.get_price_from_ids_async(
+                fetch["feed_ids"], publish_time=fetch["publish_time"]
+            )
+            for fetch in fetches
+        ]
+    )
+    calls = []
+    for fetch, data in zip(fetches, pyth_data):
+        if data is None:
+            snx.logger.warning(f"No Pyth price data for feeds {fetch['feed_ids']}")
+            continue
+        calls.append(make_fulfillment_call(snx, requests, fetch, data))
+    return calls
+
+
+async def handle_erc7412_error_async(snx, error, requests=None):
+    "When receiving a ERC7412 error, will return an updated list of calls with the required price updates"
+    requests = aggregate_erc7412_price_requests(snx, error, requests)
+    return await make_fulfillment_calls_async(snx, requests)
+
+
+async def get_learned_erc7412_calls_async(snx, key):
+    "Async version of ``get_learned_erc7412_calls``"
+    requests = get_learned_erc7412_requests(snx, key)
+    if requests is None:
+        return []
+
+    try:
+        return await make_fulfillment_calls_async(snx, requests)
+    except Exception as e:
+        snx.logger.debug(f"Failed to prepare learned oracle updates: {e}")
+        return []
+
+
+async def execute_erc7412_async(
+    snx, key, calls, execute, learned_calls=None, on_unfulfilled=None
+):
+    """
+    Async version of ``execute_erc7412``. Runs a multicall, prepending the
+    oracle updates learned for ``key`` and handling new ERC-7412 errors, for
+    at most ``ERC7412_MAX_ATTEMPTS`` attempts.
+
+    :param Synthetix snx: Synthetix class instance
+    :param frozenset key: The key from ``get_erc7412_requirement_key``
+    :param list calls: The ``aggregate3Value`` calls to make
+    :param function execute: Coroutine function that makes the multicall,
+        called with the full list of calls
+    :param list | None learned_calls: The learned updates to prepend, if they
+        were already fetched
+    :param function | None on_unfulfilled: Coroutine function that makes the
+        multicall when the oracle requirements can not be met
+    :return: The result of ``execute``
+    """
+    if learned_calls is None:
+        learned_calls = await get_learned_erc7412_calls_async(snx, key)
+
+    # start from the learned requests, so each attempt has one merged update
+    requests = ERC7412Requests()
+    learned_requests = get_learned_erc7412_requests(snx, key)
+    if learned_requests is not None and len(learned_calls) > 0:
+        requests.merge(learned_requests)
+    fulfillment_calls = learned_calls
+    last_error = None
+    unfulfilled = None
+    for _ in range(ERC7412_MAX_ATTEMPTS):
+        try:
+            return await execute(fulfillment_calls + calls)
+        except Exception as e:
+            # check if the error is related to oracle data
+            snx.logger.debug(f"Simulation failed, decoding the error {e}")
+            try:
+                error_requests = aggregate_erc7412_price_requests(snx, e)
+            except Exception:
+                if len(learned_calls) == 0 or not is_oracle_update_error(e):
+                    raise
+
+                # the learned updates are no longer valid, retry without them
+                snx.logger.debug("Retrying without the learned oracle updates")
+                get_erc7412_requirements(snx).pop(key, None)
+                learned_calls = []
+                requests = ERC7412Requests()
+                fulfillment_calls = []
+                continue
+
+            # handle the error by merging the requests and rebuilding the calls
+            num_new = requests.merge(error_requests)
+            if len(error_requests.pyth_latest) + len(error_requests.pyth_vaa) > 0:
+                unfulfilled = error_requests
+                if num_new == 0 and on_unfulfilled is not None:
+                    # the updates were already sent and did not fulfill it
+                    break
+            learn_erc7412_requests(snx, key, error_requests)
+            fulfillment_calls = await make_fulfillment_calls_async(snx, requests)
+            last_error = e
+
+    if on_unfulfilled is not None and unfulfilled is not None:
+        snx.logger.warning("Oracle data can not be fulfilled, marking calls failed")
+        forget_erc7412_requests(snx, key, unfulfilled)
+        return await on_unfulfilled(fulfillment_calls + calls)
+
+    raise Exception(
+        f"Oracle data still required after {ERC7412_MAX_ATTEMPTS} attempts"
+    ) from last_error
+
+
+async def call_multicall_async(snx, calls, tx_params, block="latest"):
+    """
+    Make an ``aggregate3Value`` call with ``snx.async_web3``.
+
+    :param Synthetix snx: Synthetix class instance
+    :param list calls: The ``aggregate3Value`` calls
+    :param dict tx_params: The transaction parameters, without ``to`` and
+        ``data``
+    :param str | int block: The block to read at
+    :return: A ``(success, return_data)`` result for each call
+    :rtype: list
+    """
+    tx_params = {
+        **tx_params,
+        "to": snx.multicall.address,
+        "data": snx.multicall.encodeABI(fn_name="aggregate3Value", args=[calls]),
+    }
+    result = await snx.async_web3.eth.call(tx_params, block_identifier=block)
+    return decode_result(snx.multicall, "aggregate3Value", bytes(result))[0]
+
+
+async def write_erc7412_async(
+    snx, contract, function_name, args, tx_params={}, calls=[], simulate=False
+):
+    """
+    Async version of ``write_erc7412``. Prepares a transaction calling a
+    contract function through the multicall, with the required oracle updates.
+
+    :param Synthetix snx: Synthetix class instance
+    :param Contract contract: The contract to call
+    :param str function_name: The function to call
+    :param tuple args: The function arguments
+    :param dict tx_params: Transaction parameters, such as ``value``
+    :param list calls: Calls to prepend, such as oracle updates
+    :param bool simulate: Simulate the call before sending it, even when the
+        gas limit has been learned
+    :return: The prepared transaction
+    :rtype: dict
+    """
+    # prepare the initial call
+    this_call = [
+        (
+            contract.address,
+            True,
+            0 if "value" not in tx_params else tx_params["value"],
+            contract.encodeABI(fn_name=function_name, args=args),
+        )
+    ]
+    calls = calls + this_call
+
+    async def execute(calls):
+        # use the learned gas limit for this call and number of oracle updates
+        gas_model = getattr(snx, "gas_model", None)
+        gas_key = (contract.address, function_name, len(calls) - 1)
+        gas = gas_model.estimate(gas_key) if gas_model is not None else None
+
+        # create the transaction and estimate the gas
+        tx_params = snx._get_tx_params(value=sum([i[2] for i in calls]))
+        tx_params["to"] = snx.multicall.address
+        tx_params["data"] = snx.multicall.encodeABI(
+            fn_name="aggregate3Value", args=[calls]
+        )
+        if gas is not None:
+            # the gas limit is known, so skip the estimate. a reverted
+            # transaction evicts the learned limit
+            if simulate:
+                await snx.async_web3.eth.call(tx_params)
+            tx_params["gas"] = gas
+        tx_params = await async_fill_transaction_defaults(snx.async_web3, tx_params)
+
+        # buffer the gas limit
+        if gas is None:
+            tx_params["gas"] = int(tx_params["gas"] * 1.15)
+        if gas_model is not None:
+            gas_model.track(tx_params, gas_key)
+
+        snx.logger.debug(f"Prepared tx successfully: {tx_params}")
+        return tx_params
+
+    key = get_erc7412_requirement_key([(contract, function_name, args)])
+    return await execute_erc7412_async(snx, key, calls, execute)
+
+
+async def call_erc7412_async(
+    snx, contract, function_name, args, calls=[], block="latest"
+):
+    """
+    Async version of ``call_erc7412``. Reads a contract function through the
+    multicall, with the required oracle updates.
+
+    :param Synthetix snx: Synthetix class instance
+    :param Contract contract: The contract to call
+    :param str function_name: The function to call
+    :param tuple args: The function arguments
+    :param list calls: Calls to prepend, such as oracle updates
+    :param str | int block: The block to read at
+    :return: The decoded result
+    """
+    # fix args
+    args = args if isinstance(args, (list, tuple)) else (args,)
+
+    # reads at "latest" in a snapshot use its block and result cache
+    block, cache = get_snapshot_block(snx, block)
+    cache_key = None
+    if cache is not None and len(calls) == 0:
+        cache_key = get_call_cache_key(contract, function_name, args)
+        if cache_key in cache:
+            return copy.deepcopy(cache[cache_key])
+
+    # prepare the initial calls
+    this_call = (
+        contract.address,
+        True,
+        0,
+        contract.encodeABI(fn_name=function_name, args=args),
+    )
+    calls = calls + [this_call]
+
+    async def execute(calls):
+        tx_params = snx._get_tx_params(value=sum(i[2] for i in calls))
+        results = await call_multicall_async(snx, calls, tx_params, block)
+
+        # call was successful, decode the result
+        return decode_call_results([(contract, function_name, args)], results[-1:])[0]
+
+    key = get_erc7412_requirement_key([(contract, function_name, args)])
+    result = await execute_erc7412_async(snx, key, calls, execute)
+    if cache_key is not None:
+        cache[cache_key] = copy.deepcopy(result)
+    return result
+
+
+async def multicall_erc7412_async(
+    snx,
+    contract,
+    function_name,
+    args_list,
+    calls=[],
+    block="latest",
+    allow_failure=False,
+):
+    "Async version of ``multicall_erc7412``"
+    return await batch_erc7412_async(
+        snx,
+        [(contract, function_name, args) for args in args_list],
+        calls=calls,
+        block=block,
+        allow_failure=allow_failure,
+    )
+
+
+async def batch_erc7412_async(
+    snx, contract_calls, calls=[], block="latest", allow_failure=False
+):
+    """
+    Async version of ``batch_erc7412``. Large batches are split into chunks of
+    at most ``snx.multicall_max_calls`` calls, and the chunks are sent
+    concurrently, ``snx.multicall_max_workers`` at a time. The gas of each
+    call is not estimated here, but chunks are limited by
+    ``snx.multicall_max_gas`` if the sync function estimated it.
+
+    :param Synthetix snx: Synthetix class instance
+    :param list contract_calls: A list of ``(contract, function_name, args)``
+    :param list calls: Calls to prepend, such as oracle updates
+    :param str | int block: The block to read at
+    :param bool allow_failure: If ``True``, return a result dictionary for
+        each call instead of raising an error for failed calls
+    :return: The decoded result of each call, in order
+    :rtype: list
+    """
+    if len(contract_calls) == 0:
+        return []
+
+    # check if args is a list of lists or tuples
+    # correct the format if it is not
+    contract_calls = [
+        (contract, function_name, args if isinstance(args, (list, tuple)) else (args,))
+        for contract, function_name, args in contract_calls
+    ]
+
+    # reads at "latest" in a snapshot use its block, and only uncached reads
+    # are made
+    block, cache = get_snapshot_block(snx, block)
+    if cache is not None and len(calls) == 0:
+        cached = get_uncached_calls(cache, contract_calls, allow_failure)
+        if cached is not None:
+            keys, uncached = cached
+            results = await batch_erc7412_async(
+                snx, list(uncached.values()), block=block, allow_failure=allow_failure
+            )
+            cache.update(zip(uncached.keys(), results))
+            return [copy.deepcopy(cache[key]) for key in keys]
+
+    key = get_erc7412_requirement_key(contract_calls)
+
+    call_gas = snx.__dict__.setdefault("_multicall_call_gas", {})
+    chunks = get_multicall_chunks(snx, contract_calls, call_gas.get(key))
+    if len(chunks) == 1:
+        return await execute_batch_erc7412_async(
+            snx, key, contract_calls, calls, block, allow_failure=allow_failure
+        )
+
+    results = []
+    if key not in call_gas:
+        # send the first chunk alone to learn the oracle updates
+        results = await execute_batch_erc7412_async(
+            snx, key, chunks[0], calls, block, allow_failure=allow_failure
+        )
+        call_gas[key] = None
+        chunks = chunks[1:]
+
+    # send the chunks concurrently, each with the same oracle updates
+    learned_calls = await get_learned_erc7412_calls_async(snx, key)
+    semaphore = asyncio.Semaphore(
+        getattr(snx, "multicall_max_workers", DEFAULT_MULTICALL_MAX_WORKERS)
+    )
+
+    async def execute_chunk(chunk):
+        async with semaphore:
+            return await execute_batch_erc7412_async(
+                snx, key, chunk, calls, block, learned_calls, allow_failure
+            )
+
+    for chunk_result in await asyncio.gather(*[execute_chunk(c) for c in chunks]):
+        results.extend(chunk_result)
+    return results
+
+
+async def execute_batch_erc7412_async(
+    snx,
+    key,
+    contract_calls,
+    calls=[],
+    block="latest",
+    learned_calls=None,
+    allow_failure=False,
+):
+    "Async version of ``execute_batch_erc7412``"
+    num_calls = len(contract_calls)
+
+    # prepare the initial calls
+    these_calls = [
+        (
+            contract.address,
+            True,
+            0,
+            contract.encodeABI(fn_name=function_name, args=args),
+        )
+        for contract, function_name, args in contract_calls
+    ]
+    calls = calls + these_calls
+
+    async def execute(calls, raise_erc7412_errors=True):
+        tx_params = {"value": sum(i[2] for i in calls)}
+        results = await call_multicall_async(snx, calls, tx_params, block)
+
+        # call was successful, decode the result
+        return decode_call_results(
+            contract_calls, results[-num_calls:], allow_failure, raise_erc7412_errors
+        )
+
+    # with allow_failure, calls whose oracle data can not be fetched fail alone
+    on_unfulfilled = (lambda calls: execute(calls, False)) if allow_failure else None
+    return await execute_erc7412_async(
+        snx, key, calls, execute, learned_calls, on_unfulfilled
+    )
@@ -0,0 +1,125 @@
+from eth_utils import decode_hex
+from .multicall import decode_result
+from .rpc import batch_request
+
+
+def get_startup_reads(snx, modules=("core", "spot", "perps")) -> list:
+    """
+    List the contract reads made while initializing the ``Synthetix`` class and
+    its modules, which can be fetched together before the modules are built.
+
+    :param Synthetix snx: Synthetix class instance
+    :param list modules: The modules loaded at startup
+    :return: A list of ``(contract, function_name, args)``
+    :rtype: list
+    """
+    contracts = snx.contracts
+    reads = []
+    if "PerpsV2MarketData" in contracts:
+        reads.append(
+            (
+                contracts["PerpsV2MarketData"]["contract"],
+                "allProxiedMarketSummaries",
+                (),
+            )
+        )
+    if (
+        "core" in modules
+        and "system" in contracts
+        and "AccountProxy" in contracts["system"]
+    ):
+        reads.append(
+            (
+                contracts["system"]["AccountProxy"]["contract"],
+                "balanceOf",
+                (snx.address,),
+            )
+        )
+    if "perps" in modules and "bfp_market_factory" in contracts:
+        reads.extend(
+            [
+                (
+                    contracts["bfp_market_factory"]["PerpAccountProxy"]["contract"],
+                    "balanceOf",
+                    (snx.address,),
+                ),
+                (
+                    contracts["bfp_market_factory"]["BfpMarketProxy"]["contract"],
+                    "getActiveMarketIds",
+                    (),
+                ),
+            ]
+        )
+    elif "perps" in modules and "perpsFactory" in contracts:
+        reads.extend(
+            [
+                (
+                    contracts["perpsFactory"]["PerpsAccountProxy"]["contract"],
+                    "balanceOf",
+                    (snx.address,),
+                ),
+                (
+                    contracts["perpsFactory"]["PerpsMarketProxy"]["contract"],
+                    "getMarkets",
+                    (),
+                ),
+            ]
+        )
+    return reads
+
+
+def prefetch_startup(snx, modules=("core", "spot", "perps")) -> int:
+    """
+    Fetch the nonce of ``snx.address`` and the startup reads listed by
+    ``get_startup_reads`` in a single JSON-RPC batch. The read results are
+    stored on ``snx`` and used once by ``call_prefetched``. Reads that fail are
+    not stored, so they are made again, and raise, when the module calls them.
+
+    :param Synthetix snx: Synthetix class instance
+    :param list modules: The modules loaded at startup
+    :return: The nonce of ``snx.address``
+    :rtype: int
+    """
+    reads = [
+        (contract.address, contract.encodeABI(fn_name=function_name, args=args))
+        for contract, function_name, args in get_startup_reads(snx, modules)
+    ]
+    results = batch_request(
+        snx.web3,
+        [("eth_getTransactionCount", [snx.address, "latest"])]
+        + [("eth_call", [{"to": to, "data": data}, "latest"]) for to, data in reads],
+    )
+
+    nonce = results[0]
+    if isinstance(nonce, Exception):
+        raise nonce
+
+    snx._prefetched_reads = {
+        read: result
+        for read, result in zip(reads, results[1:])
+        if not isinstance(result, Exception)
+    }
+    return int(nonce, 16)
+
+
+def call_prefetched(snx, contract, function_name, args=()):
+    """
+    Call a contract function, using the result prefetched by
+    ``prefetch_startup`` if there is one. A prefetched result is only used
+    once, later calls always read from the chain.
+
+    :param Synthetix snx: Synthetix class instance
+    :param Contract contract: The contract to call
+    :param str function_name: The function to call
+    :param tuple args: The function arguments
+    :return: The decoded result
+    """
+    prefetched_reads = getattr(snx, "_prefetched_reads", {})
+    data = contract.encodeABI(fn_name=function_name, args=args)
+    result = prefetched_reads.pop((contract.address, data), None)
+    if result is None:
+        return contract.functions[function_name](*args).call()
+
+    snx.logger.debug(f"Using prefetched result for {function_name}")
+    decoded_result = decode_result(contract, function_name, decode_hex(result))
+    return decoded_result if len(decoded_result) > 1 else decoded_result[0]
@@ -0,0 +1,80 @@
+import threading
+import aiohttp
+from web3 import AsyncWeb3, Web3
+
+_shared_web3 = {}
+_shared_web3_lock = threading.Lock()
+
+
+def create_web3(provider_rpc: str, request_kwargs: dict = {}) -> Web3:
+    """
+    Create a web3 connection for an RPC endpoint. HTTP, websocket and IPC
+    endpoints are supported.
+
+    :param str provider_rpc: The RPC endpoint
+    :param dict request_kwargs: Keyword arguments for HTTP requests
+    :return: A web3 connection
+    :rtype: Web3
+    """
+    if provider_rpc.startswith("http"):
+        return Web3(Web3.HTTPProvider(provider_rpc, request_kwargs=request_kwargs))
+    elif provider_rpc.startswith("wss"):
+        return Web3(Web3.WebsocketProvider(provider_rpc))
+    elif provider_rpc.endswith("ipc"):
+        return Web3(Web3.IPCProvider(provider_rpc))
+    else:
+        raise Exception("Provider RPC endpoint is invalid")
+
+
+def create_async_web3(provider_rpc: str, request_kwargs: dict = {}) -> AsyncWeb3:
+    """
+    Create an async web3 connection for an RPC endpoint. Only HTTP endpoints
+    are supported. The validation middleware is removed, since the async
+    version requests the chain id before every call.
+
+    The ``request_kwargs`` are the same as for ``create_web3``, and are
+    converted for ``aiohttp``: a ``timeout`` in seconds or a ``(connect,
+    read)`` tuple becomes a ``ClientTimeout``, and ``verify`` becomes ``ssl``.
+
+    :param str provider_rpc: The RPC endpoint
+    :param dict request_kwargs: Keyword arguments for HTTP requests
+    :return: An async web3 connection
+    :rtype: AsyncWeb3
+    """
+    if provider_rpc.startswith("http"):
+        request_kwargs = dict(request_kwargs)
+        timeout = request_kwargs.get("timeout")
+        if isinstance(timeout, (tuple, list)):
+            request_kwargs["timeout"] = aiohttp.ClientTimeout(
+                sock_connect=timeout[0], sock_read=timeout[1]
+            )
+        elif isinstance(timeout, (int, float)):
+            request_kwargs["timeout"] = aiohttp.ClientTimeout(total=timeout)
+        if "verify" in request_kwargs:
+            request_kwargs["ssl"] = None if request_kwargs.pop("verify") else False
+
+        async_web3 = AsyncWeb3(
+            AsyncWeb3.AsyncHTTPProvider(provider_rpc, request_kwargs=request_kwargs)
+        )
+        async_web3.middleware_onion.remove("validation")
+        return async_web3
+    else:
+        raise Exception("Async provider RPC endpoint must be an HTTP endpoint")
+
+
+def get_shared_web3(provider_rpc: str, request_kwargs: dict = {}) -> Web3:
+    """
+    Get a web3 connection shared by every caller in the process using the same
+    RPC endpoint and request arguments. Contracts built on a shared connection
+    are also shared, see ``synthetix.contracts.interning``.
+
+    :param str provider_rpc: The RPC endpoint
+    :param dict request_kwargs: Keyword arguments for HTTP requests
+    :return: A shared web3 connection
+    :rtype: Web3
+    """
+    key = (provider_rpc, repr(sorted(request_kwargs.items())))
+    with _shared_web3_lock:
+        if key not in _shared_web3:
+            _shared_web3[key] = create_web3(provider_rpc, request_kwargs)
+        return _shared_web3[key]
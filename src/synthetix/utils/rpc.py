@@ -0,0 +1,73 @@
+import json
+import itertools
+import requests as http_requests
+from web3 import HTTPProvider
+from web3._utils.request import make_post_request
+
+_request_ids = itertools.count()
+
+
+def batch_request(web3, requests: list) -> list:
+    """
+    Send a list of JSON-RPC requests to the provider of a web3 connection.
+    HTTP providers send every request in one JSON-RPC batch. Other providers,
+    and HTTP providers that do not support batches, including ones that reject
+    the batch with an HTTP error or a response that is not JSON, send the
+    requests one at a time. Results are returned in the order of the
+    ``requests`` without any web3 formatting::
+
+        >>> batch_request(snx.web3, [("eth_chainId", []), ("eth_blockNumber", [])])
+        ['0x2105', '0x10a8f1c']
+
+    A request that fails returns a ``ValueError`` with the RPC error in place of
+    its result, so one failing request does not fail the others.
+
+    :param Web3 web3: The web3 connection
+    :param list requests: A list of ``(method, params)`` tuples
+    :return: The result of each request
+    :rtype: list
+    """
+    if len(requests) == 0:
+        return []
+
+    provider = web3.provider
+    responses = None
+    if isinstance(provider, HTTPProvider):
+        payload = [
+            {
+                "jsonrpc": "2.0",
+                "method": method,
+                "params": params,
+                "id": next(_request_ids),
+            }
+            for method, params in requests
+        ]
+        try:
+            raw_response = make_post_request(
+                provider.endpoint_uri,
+                json.dumps(payload).encode(),
+                **provider.get_request_kwargs(),
+            )
+            response = json.loads(raw_response)
+        except (http_requests.HTTPError, ValueError):
+            # providers without batch support may reject the request
+            response = None
+
+        # providers without batch support respond with a single error
+        if isinstance(response, list):
+            responses_by_id = {item.get("id"): item for item in response}
+            responses = [responses_by_id.get(item["id"], {}) for item in payload]
+
+    if responses is None:
+        responses = [
+            provider.make_request(method, params) for method, params in requests
+        ]
+
+    return [
+        (
+            response["result"]
+            if "result" in response
+            else ValueError(response.get("error", "Missing response"))
+        )
+        for response in responses
+    ]
@@ -0,0 +1,141 @@
+"""
+Warm-start state for the ``Synthetix`` class.
+
+The markets, settlement strategies, price feed ids and account ids discovered
+while initializing the modules are saved to a state file in the cache
+directory. On the next start the modules load them from the file and only
+re-validate them against the chain, using reads that are already made in the
+startup batch, instead of discovering everything again.
+"""
+
+import os
+import json
+from .cache import read_json_cache, write_json_cache
+from .prefetch import call_prefetched
+
+STATE_FORMAT_VERSION = 1
+
+# contracts that identify a deployment, the state is discarded if any change
+STATE_CONTRACTS = [
+    ("system", "CoreProxy"),
+    ("system", "AccountProxy"),
+    ("perpsFactory", "PerpsMarketProxy"),
+    ("perpsFactory", "PerpsAccountProxy"),
+    ("spotFactory", "SpotMarketProxy"),
+    ("bfp_market_factory", "BfpMarketProxy"),
+    ("bfp_market_factory", "PerpAccountProxy"),
+]
+
+
+def get_state_path(snx) -> str:
+    """get the path of the state file for a network and address"""
+    return os.path.join(
+        snx.cache_dir, "state", f"{snx.network_id}-{snx.address.lower()}.json"
+    )
+
+
+def get_state_key(snx) -> dict:
+    """
+    Get the values a state file must match to be used: the format, network,
+    address and the addresses of the deployed proxies.
+
+    :param Synthetix snx: Synthetix class instance
+    :return: The state key
+    :rtype: dict
+    """
+    contracts = {}
+    for package, name in STATE_CONTRACTS:
+        if package in snx.contracts and name in snx.contracts[package]:
+            contracts[f"{package}.{name}"] = snx.contracts[package][name]["address"]
+
+    return {
+        "format": STATE_FORMAT_VERSION,
+        "network_id": snx.network_id,
+        "address": snx.address,
+        "contracts": contracts,
+    }
+
+
+def read_state(snx) -> dict | None:
+    """
+    Load the module state saved by a previous run. Returns ``None`` if there is
+    no cache directory, no state file, or the state was saved for a different
+    network, address or deployment.
+
+    :param Synthetix snx: Synthetix class instance
+    :return: The state of each module, keyed by module name
+    :rtype: dict | None
+    """
+    if snx.cache_dir is None:
+        return None
+
+    state = read_json_cache(get_state_path(snx))
+    if state is None or state.get("key") != get_state_key(snx):
+        return None
+
+    snx.logger.debug(f"Loaded state from block {state['block_number']}")
+    return state["modules"]
+
+
+def write_state(snx, modules: dict, previous_modules: dict = None) -> dict:
+    """
+    Save the module state to the cache directory. The file is only written if
+    the state changed since it was loaded.
+
+    :param Synthetix snx: Synthetix class instance
+    :param dict modules: The state of each module, keyed by module name
+    :param dict | None previous_modules: The state loaded at startup
+    :return: The state of each module, as it is loaded from the file
+    :rtype: dict
+    """
+    # compare the JSON encoded state, since JSON converts keys to strings
+    modules = json.loads(json.dumps(modules))
+    if snx.cache_dir is None or modules == previous_modules:
+        return modules
+
+    state = {
+        "key": get_state_key(snx),
+        "block_number": snx.web3.eth.block_number,
+        "modules": modules,
+    }
+    try:
+        write_json_cache(get_state_path(snx), state)
+    except OSError as e:
+        snx.logger.debug(f"Unable to save state: {e}")
+    return modules
+
+
+def restore_account_ids(module, state: dict, default_account_id: int = None) -> bool:
+    """
+    Restore the account ids of a core or perps module. The account ids are
+    only used if the number of account NFTs held by the address is unchanged.
+
+    :param Core | PerpsV3 | BfPerps module: The module to restore
+    :param dict state: The saved state of the module
+    :param int default_account_id: The default account id set by the user
+    :return: ``True`` if the account ids were restored
+    :rtype: bool
+    """
+    try:
+        balance = call_prefetched(
+            module.snx, module.account_proxy, "balanceOf", (module.snx.address,)
+        )
+    except Exception as e:
+        module.snx.logger.debug(f"Failed to validate saved account ids: {e}")
+        return False
+    if "account_ids" not in state or balance != len(state["account_ids"]):
+        return False
+
+    module.account_ids = state["account_ids"]
+    if default_account_id:
+        module.default_account_id = default_account_id
+    elif len(module.account_ids) > 0:
+        module.default_account_id = module.account_ids[0]
+    else:
+        module.default_account_id = None
+    return True
+
+
+def int_keys(dictionary: dict) -> dict:
+    """convert the keys of a JSON decoded dictionary back to integers"""
+    return {int(key): value for key, value in dictionary.items()}
@@ -1,11 +1,23 @@
 import os
+import json
 import logging
+import threading
 import pytest
+from types import SimpleNamespace
+from urllib.parse import parse_qs, urlparse
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from web3 import Web3
+from eth_utils import decode_hex
 from synthetix import Synthetix
+from synthetix.contracts import load_contracts
 from dotenv import load_dotenv
 
 load_dotenv()
 
+# constants
+TEST_NETWORK_ID = 8453
+TEST_ADDRESS = "0x0000000000000000000000000000000000000001"
+
 
 # Add a command-line option to pytest to accept network_id
 def pytest_addoption(parser):
@@ -44,3 +56,153 @@ def logger(pytestconfig):
         )
         logg.addHandler(handler)
     return logg
+
+
+@pytest.fixture
+def http_server():
+    """
+    Start local HTTP servers for tests that need a stand-in for a remote service.
+    Call the fixture with a function ``respond(method, path, body)`` that returns
+    a tuple of ``(status, headers, body)``. The returned server records each
+    request as ``(method, path, body)`` in ``server.requests`` and exposes its
+    base url as ``server.url``.
+    """
+    servers = []
+
+    def start(respond):
+        class Handler(BaseHTTPRequestHandler):
+            def _handle(self):
+                length = int(self.headers.get("Content-Length", 0))
+                body = self.rfile.read(length) if length else b""
+                self.server.requests.append((self.command, self.path, body))
+
+                status, headers, response = respond(self.command, self.path, body)
+                self.send_response(status)
+                for key, value in headers.items():
+                    self.send_header(key, value)
+                self.send_header("Content-Length", str(len(response)))
+                self.end_headers()
+                self.wfile.write(response)
+
+            do_GET = _handle
+            do_POST = _handle
+
+            def log_message(self, format, *args):
+                pass
+
+        server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        server.daemon_threads = True
+        server.requests = []
+        server.url = f"http://127.0.0.1:{server.server_address[1]}"
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        servers.append(server)
+        return server
+
+    yield start
+
+    for server in servers:
+        server.shutdown()
+        server.server_close()
+
+
+@pytest.fixture
+def make_snx():
+    """
+    Build minimal Synthetix objects for tests that do not need a chain. Call the
+    fixture with attributes to set on the object, such as ``cache_dir``. A
+    ``provider_rpc`` connects ``web3`` to a stub RPC, and the contracts are
+    loaded unless ``with_contracts`` is ``False``.
+    """
+
+    def make(provider_rpc=None, with_contracts=True, **attributes):
+        snx = SimpleNamespace(
+            web3=Web3(Web3.HTTPProvider(provider_rpc)) if provider_rpc else Web3(),
+            network_id=TEST_NETWORK_ID,
+            cannon_config=None,
+            cache_dir=None,
+            address=TEST_ADDRESS,
+            is_fork=False,
+            logger=logging.getLogger(__name__),
+            _get_tx_params=lambda value=0: {"from": snx.address, "value": value},
+        )
+        for key, value in attributes.items():
+            setattr(snx, key, value)
+        if with_contracts:
+            snx.contracts = load_contracts(snx)
+        return snx
+
+    return make
+
+
+def _make_update(feed_id):
+    "Encode a price feed message with a one hash merkle proof"
+    message = b"\x00" + decode_hex(feed_id) + b"\x05" * 50
+    return len(message).to_bytes(2, "big") + message + b"\x01" + b"\x09" * 20
+
+
+def _make_accumulator_update(feed_ids, vaa=b"\x01" * 100):
+    "Encode an accumulator update for a list of feed ids"
+    header = b"PNAU\x01\x00\x00\x00" + len(vaa).to_bytes(2, "big") + vaa
+    updates = b"".join(_make_update(feed_id) for feed_id in feed_ids)
+    return header + bytes([len(feed_ids)]) + updates
+
+
+@pytest.fixture
+def make_accumulator_update():
+    """
+    Encode Pyth accumulator updates like the stub price service. Call the
+    fixture with a list of feed ids, and optionally the ``vaa`` of the update.
+    """
+    return _make_accumulator_update
+
+
+@pytest.fixture
+def make_price_service(http_server):
+    """
+    Start stub Pyth price services, which return an accumulator update and a
+    ``price`` for the requested feeds, and a ``404`` for ``missing_feed_ids``.
+    The VAA of each response is different, like the VAAs of different updates.
+    Stream requests get one event for each feed, then the stream ends.
+    """
+
+    def start(price=100, missing_feed_ids=()):
+        num_responses = []
+
+        def respond(method, path, body):
+            num_responses.append(1)
+            vaa = bytes([len(num_responses)]) * 100
+            feed_ids = parse_qs(urlparse(path).query)["ids[]"]
+            missing = [
+                feed_id[2:] for feed_id in missing_feed_ids if feed_id in feed_ids
+            ]
+            if len(missing) > 0:
+                return 404, {}, f"Price ids not found: {', '.join(missing)}".encode()
+
+            response = {
+                "binary": {"data": [_make_accumulator_update(feed_ids, vaa).hex()]},
+                "parsed": [
+                    {
+                        "id": feed_id[2:],
+                        "price": {"price": str(price), "expo": 0, "publish_time": 1},
+                    }
+                    for feed_id in feed_ids
+                ],
+            }
+            if urlparse(path).path.endswith("/stream"):
+                events = [
+                    {**response, "parsed": [parsed]} for parsed in response["parsed"]
+                ]
+                for event, feed_id in zip(events, feed_ids):
+                    update = _make_accumulator_update([feed_id], vaa)
+                    event["binary"] = {"data": [update.hex()]}
+                body = "".join(f"data: {json.dumps(event)}\n\n" for event in events)
+                return 200, {"Content-Type": "text/event-stream"}, body.encode()
+            return (
+                200,
+                {"Content-Type": "application/json"},
+                json.dumps(response).encode(),
+            )
+
+        return http_server(respond)
+
+    return start
@@ -90,13 +90,12 @@ def test_pyth_cache_exists(snx):
     # fetch some prices
     snx.pyth.get_price_from_symbols(TEST_SYMBOLS)
     feed_ids = [snx.pyth.price_feed_ids[symbol] for symbol in TEST_SYMBOLS]
-    key = ",".join(sorted(feed_ids))
 
     # check that they are all in the cache
-    assert key in snx.pyth._cache
-    assert snx.pyth._cache[key] is not None
-    assert snx.pyth._cache[key]["price_update_data"] is not None
-    assert snx.pyth._cache[key]["timestamp"] > 0
+    for feed_id in feed_ids:
+        assert feed_id in snx.pyth._cache
+        assert snx.pyth._cache[feed_id]["update"] is not None
+        assert snx.pyth._cache[feed_id]["timestamp"] > 0
 
 
 def test_pyth_cache_usage(snx):
@@ -0,0 +1,234 @@
+import os
+import json
+import zlib
+from web3 import Web3
+from eth_abi import encode
+from eth_utils import encode_hex
+from synthetix.contracts import load_contracts
+from synthetix.contracts.contracts import ContractDefinition, parse_json_stream
+from synthetix.contracts.index import (
+    build_deployment_index,
+    get_index_path,
+    read_deployment_index,
+    write_deployment_index,
+)
+
+# constants
+TEST_NETWORK_ID = 8453
+ADDRESS_ONE = "0x0000000000000000000000000000000000000001"
+ADDRESS_TWO = "0x0000000000000000000000000000000000000002"
+TEST_IPFS_HASH = "QmTestDeploymentHash"
+
+
+# tests
+
+
+def test_load_contracts_is_lazy(make_snx):
+    """Contracts are not read or built when they are loaded"""
+    contracts = make_snx().contracts
+
+    definition = contracts["perpsFactory"]["PerpsMarketProxy"]
+    assert isinstance(definition, ContractDefinition)
+    assert definition._abi is None
+    assert definition._contract is None
+
+
+def test_contract_definition_interface(make_snx):
+    """Contract definitions behave like the dictionaries they replace"""
+    contracts = make_snx().contracts
+    definition = contracts["system"]["CoreProxy"]
+
+    assert "contract" in definition
+    assert "bytecode" not in definition
+    assert list(definition.keys()) == ["address", "abi", "contract"]
+    assert Web3.is_checksum_address(definition["address"])
+    assert isinstance(definition["abi"], list)
+    assert definition._contract is None
+
+
+def test_contract_definition_builds_once(make_snx):
+    """The web3 contract is built on first access and reused"""
+    contracts = make_snx().contracts
+    definition = contracts["system"]["CoreProxy"]
+
+    contract = definition["contract"]
+    assert contract.address == definition["address"]
+    assert definition["contract"] is contract
+    assert len(contract.find_functions_by_name("createAccount")) > 0
+
+
+def test_deployment_index_matches_json(make_snx, tmp_path):
+    """Contracts loaded from the index match the JSON files"""
+    from_json = make_snx().contracts
+    from_index = make_snx(cache_dir=str(tmp_path)).contracts
+
+    assert os.path.exists(get_index_path(str(tmp_path), f"{TEST_NETWORK_ID}"))
+    json_proxy = from_json["perpsFactory"]["PerpsMarketProxy"]
+    index_proxy = from_index["perpsFactory"]["PerpsMarketProxy"]
+    assert index_proxy["address"] == json_proxy["address"]
+    assert index_proxy["abi"] == json_proxy["abi"]
+    assert from_index["common"]["ERC20"]["abi"] == from_json["common"]["ERC20"]["abi"]
+
+
+def test_deployment_index_selectors(make_snx, tmp_path):
+    """The index stores precomputed function selectors"""
+    contracts = make_snx(cache_dir=str(tmp_path)).contracts
+    multicall = contracts["system"]["trusted_multicall_forwarder"][
+        "TrustedMulticallForwarder"
+    ]
+
+    assert multicall._abi is None
+    assert (
+        multicall.selectors["aggregate3Value((address,bool,uint256,bytes)[])"]
+        == "0x174dea71"
+    )
+
+
+def test_deployment_index_stale(tmp_path):
+    """A stale index is not used"""
+    directory = tmp_path / "deployment"
+    directory.mkdir()
+    contract_file = directory / "Token.json"
+    contract_file.write_text(f'{{"address": "{ADDRESS_ONE}", "abi": []}}')
+
+    index_path = get_index_path(str(tmp_path), "test")
+    index = build_deployment_index(str(directory))
+    assert read_deployment_index(index_path, str(directory)) is None
+
+    write_deployment_index(index, index_path)
+    assert read_deployment_index(index_path, str(directory)) == index
+
+    # modify the file and check the index is stale
+    contract_file.write_text(f'{{"address": "{ADDRESS_TWO}", "abi": []}}')
+    os.utime(contract_file, ns=(0, 0))
+    assert read_deployment_index(index_path, str(directory)) is None
+
+
+def test_abis_shared_between_instances(make_snx, tmp_path):
+    """ABIs and selectors are shared between instances on the same network"""
+    first = make_snx().contracts["system"]["CoreProxy"]
+    second = make_snx(cache_dir=str(tmp_path)).contracts["system"]["CoreProxy"]
+
+    assert first.abi_hash == second.abi_hash
+    assert first["abi"] is second["abi"]
+    assert first.selectors is second.selectors
+
+
+def test_contracts_shared_per_web3(make_snx):
+    """Web3 contracts are shared between instances using the same web3 connection"""
+    first_snx = make_snx(with_contracts=False)
+    second_snx = make_snx(with_contracts=False)
+    second_snx.web3 = first_snx.web3
+    first = load_contracts(first_snx)
+    second = load_contracts(second_snx)
+
+    assert first["system"]["CoreProxy"]["contract"] is (
+        second["system"]["CoreProxy"]["contract"]
+    )
+    assert first["common"]["ERC20"].at(ADDRESS_ONE.lower()) is (
+        second["common"]["ERC20"].at(ADDRESS_ONE)
+    )
+    assert first["common"]["ERC20"].at(ADDRESS_TWO).address == ADDRESS_TWO
+
+    # a different connection builds its own contracts
+    third = make_snx().contracts
+    assert third["system"]["CoreProxy"]["contract"] is not (
+        first["system"]["CoreProxy"]["contract"]
+    )
+
+
+def make_cannon_deployment(make_snx):
+    "Utility to build a compressed cannon deployment with one imported package"
+    abi = make_snx().contracts["system"]["CoreProxy"]["abi"]
+    deployment = {
+        "state": {
+            "provision.system": {
+                "artifacts": {
+                    "imports": {
+                        "system": {
+                            "contracts": {
+                                "CoreProxy": {
+                                    "address": ADDRESS_ONE.lower(),
+                                    "abi": abi,
+                                    "deployTxnHash": "0x1234",
+                                }
+                            }
+                        }
+                    }
+                }
+            }
+        }
+    }
+    return zlib.compress(json.dumps(deployment).encode())
+
+
+def test_cannon_deployment_cache(http_server, make_snx, tmp_path):
+    """Cannon deployments and package urls are cached between loads"""
+    deployment = make_cannon_deployment(make_snx)
+    gateway = http_server(lambda method, path, body: (200, {}, deployment))
+
+    # respond to eth_call with an abi encoded ipfs url
+    def respond_rpc(method, path, body):
+        request = json.loads(body)
+        if request["method"] == "eth_call":
+            result = encode_hex(encode(["string"], [f"ipfs://{TEST_IPFS_HASH}"]))
+        else:
+            result = hex(10)
+        response = {"jsonrpc": "2.0", "id": request["id"], "result": result}
+        return 200, {"Content-Type": "application/json"}, json.dumps(response).encode()
+
+    registry = http_server(respond_rpc)
+
+    def load(cache_ttl=3600):
+        snx = make_snx(with_contracts=False, cache_dir=str(tmp_path))
+        snx.ipfs_gateway = gateway.url
+        snx.op_mainnet_rpc = registry.url
+        snx.cannon_config = {
+            "package": "synthetix-omnibus",
+            "version": "1",
+            "preset": "main",
+            "cache_ttl": cache_ttl,
+        }
+        return load_contracts(snx)
+
+    def count_eth_calls():
+        return len([r for r in registry.requests if b"eth_call" in r[2]])
+
+    # cold start resolves the package and fetches from ipfs
+    contracts = load()
+    assert isinstance(contracts["system"]["CoreProxy"], ContractDefinition)
+    assert contracts["system"]["CoreProxy"]._contract is None
+    assert contracts["system"]["CoreProxy"]["address"] == ADDRESS_ONE
+    assert count_eth_calls() == 1
+    assert len(gateway.requests) == 1
+
+    # warm start uses the cache
+    contracts = load()
+    assert contracts["system"]["CoreProxy"]["address"] == ADDRESS_ONE
+    assert contracts["system"]["CoreProxy"]["contract"].address == ADDRESS_ONE
+    assert count_eth_calls() == 1
+    assert len(gateway.requests) == 1
+
+    # an expired package url is resolved again, the deployment is still cached
+    load(cache_ttl=0)
+    assert count_eth_calls() == 2
+    assert len(gateway.requests) == 1
+
+
+def test_parse_json_stream():
+    """Documents split across chunks are parsed like json.loads, with the hook"""
+    document = {
+        "name": "caf\u00e9",
+        "values": [1, -2.5, True, None, {"nested": []}],
+        "artifact": {"address": ADDRESS_ONE, "abi": [], "bytecode": "0x00"},
+    }
+    data = json.dumps(document).encode()
+    chunks = [data[i : i + 7] for i in range(0, len(data), 7)]
+
+    def hook(obj):
+        return {"address": obj["address"]} if "abi" in obj else obj
+
+    assert parse_json_stream(iter(chunks)) == document
+    assert parse_json_stream(iter(chunks), object_hook=hook) == json.loads(
+        data, object_hook=hook
+    )
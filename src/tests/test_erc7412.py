@@ -0,0 +1,494 @@
+import gc
+import json
+import threading
+import pytest
+from types import SimpleNamespace
+from web3 import Web3
+from web3.exceptions import ContractCustomError, ContractLogicError
+from eth_abi import decode, encode
+from eth_utils import decode_hex, function_signature_to_4byte_selector
+from synthetix.utils.multicall import (
+    ERC7412_MAX_ATTEMPTS,
+    SELECTOR_ORACLE_DATA_REQUIRED_WITH_FEE,
+    ERC7412Requests,
+    decode_call_results,
+    decode_result,
+    execute_erc7412,
+    get_erc7412_requirement_key,
+    call_erc7412,
+    get_result_decoder,
+    multicall_erc7412,
+    MulticallBatch,
+    snapshot,
+    _result_decoders,
+)
+
+# constants
+TEST_ADDRESS = "0x0000000000000000000000000000000000000001"
+ETH_FEED_ID = "0x" + "11" * 32
+BTC_FEED_ID = "0x" + "22" * 32
+SELECTOR_STALE_PRICE = "0x19abf40e"
+
+
+def make_pyth():
+    "Utility to make a stub Pyth client, which records the feeds it is asked for"
+    pyth = SimpleNamespace(requests=[])
+    pyth.get_price_from_ids = lambda feed_ids, publish_time=None: (
+        pyth.requests.append(feed_ids) or {"price_update_data": [b"\x01"]}
+    )
+    return pyth
+
+
+def make_oracle(snx, required_feed_ids):
+    """
+    Utility to make a fake multicall, which reverts with ``OracleDataRequired``
+    until the calls include an update for each required feed
+    """
+    wrapper = snx.contracts["pyth_erc7412_wrapper"]["PythERC7412Wrapper"]["address"]
+    oracle = SimpleNamespace(attempts=0)
+
+    def execute(calls):
+        oracle.attempts += 1
+        updated = "".join(data for to, _, _, data in calls if to == wrapper)
+        for feed_id in required_feed_ids:
+            if feed_id[2:] not in updated:
+                data = encode(
+                    ["uint8", "uint64", "bytes32[]"], [1, 60, [decode_hex(feed_id)]]
+                )
+                error = encode(["address", "bytes", "uint256"], [wrapper, data, 1])
+                raise ContractCustomError(
+                    data=SELECTOR_ORACLE_DATA_REQUIRED_WITH_FEE + error.hex()
+                )
+        return calls[-1]
+
+    return oracle, execute
+
+
+# tests
+
+
+def test_learned_requirements_skip_revert(make_snx):
+    """Oracle updates required by a call are prepended to the next call"""
+    snx = make_snx(pyth=make_pyth())
+    market_proxy = snx.contracts["perpsFactory"]["PerpsMarketProxy"]["contract"]
+    call = (market_proxy.address, True, 0, "0x1234")
+    key = get_erc7412_requirement_key([(market_proxy, "indexPrice", (100,))])
+
+    oracle, execute = make_oracle(snx, [ETH_FEED_ID])
+    assert execute_erc7412(snx, key, [call], execute) == call
+    assert oracle.attempts == 2
+
+    # the same function with different args of the same shape succeeds first time
+    oracle, execute = make_oracle(snx, [ETH_FEED_ID])
+    assert execute_erc7412(snx, key, [call], execute) == call
+    assert oracle.attempts == 1
+
+    # a new requirement is caught, and remembered with the previous one
+    oracle, execute = make_oracle(snx, [ETH_FEED_ID, BTC_FEED_ID])
+    attempts = []
+
+    def record(calls):
+        attempts.append(calls)
+        return execute(calls)
+
+    assert execute_erc7412(snx, key, [call], record) == call
+    assert oracle.attempts == 2
+    assert snx._erc7412_requirements[key]["feed_ids"] == [ETH_FEED_ID, BTC_FEED_ID]
+
+    # the retry has one update merged with the learned feeds
+    assert [len(calls) for calls in attempts] == [2, 2]
+    assert snx.pyth.requests[-1] == [ETH_FEED_ID, BTC_FEED_ID]
+
+    # other functions do not use the learned updates
+    other_key = get_erc7412_requirement_key([(market_proxy, "getMarkets", ())])
+    num_requests = len(snx.pyth.requests)
+    oracle, execute = make_oracle(snx, [])
+    execute_erc7412(snx, other_key, [call], execute)
+    assert oracle.attempts == 1
+    assert len(snx.pyth.requests) == num_requests
+
+
+def test_learned_requirements_dropped_on_failure(make_snx):
+    """A call failing in the learned updates is retried without them"""
+    snx = make_snx(pyth=make_pyth())
+    market_proxy = snx.contracts["perpsFactory"]["PerpsMarketProxy"]["contract"]
+    call = (market_proxy.address, True, 0, "0x1234")
+    key = get_erc7412_requirement_key([(market_proxy, "indexPrice", (100,))])
+    _, execute = make_oracle(snx, [ETH_FEED_ID])
+    execute_erc7412(snx, key, [call], execute)
+
+    # other reverts are raised, and the learned updates are kept
+    attempts = []
+
+    def execute_reverted(calls):
+        attempts.append(len(calls))
+        raise ContractLogicError("execution reverted: InvalidMarket", data="0x1234")
+
+    with pytest.raises(ContractLogicError, match="InvalidMarket"):
+        execute_erc7412(snx, key, [call], execute_reverted)
+    assert attempts == [2]
+    assert key in snx._erc7412_requirements
+
+    # a stale price is raised by the oracle update
+    attempts = []
+
+    def execute_stale_price(calls):
+        attempts.append(len(calls))
+        if len(calls) > 1:
+            raise ContractCustomError("execution reverted", data=SELECTOR_STALE_PRICE)
+        return calls[-1]
+
+    assert execute_erc7412(snx, key, [call], execute_stale_price) == call
+    assert attempts == [2, 1]
+    assert key not in snx._erc7412_requirements
+
+
+def test_fulfillment_calls_merged(make_snx):
+    """Retries send one fulfillment call with the feeds of every error"""
+    snx = make_snx(pyth=make_pyth())
+    wrapper = snx.contracts["pyth_erc7412_wrapper"]["PythERC7412Wrapper"]["address"]
+    market_proxy = snx.contracts["perpsFactory"]["PerpsMarketProxy"]["contract"]
+    call = (market_proxy.address, True, 0, "0x1234")
+    key = get_erc7412_requirement_key([(market_proxy, "indexPrice", (100,))])
+
+    oracle, execute = make_oracle(snx, [ETH_FEED_ID, BTC_FEED_ID])
+    attempts = []
+
+    def record(calls):
+        attempts.append(calls)
+        return execute(calls)
+
+    assert execute_erc7412(snx, key, [call], record) == call
+    assert oracle.attempts == 3
+    assert [len(calls) for calls in attempts] == [1, 2, 2]
+    assert [to for to, _, _, _ in attempts[-1]] == [wrapper, market_proxy.address]
+    assert snx.pyth.requests[-1] == [ETH_FEED_ID, BTC_FEED_ID]
+
+    # repeated feeds are only requested once
+    requests = ERC7412Requests()
+    assert requests.add_pyth_latest([ETH_FEED_ID, ETH_FEED_ID], 1) == 1
+    assert requests.add_pyth_latest([ETH_FEED_ID], 1) == 0
+    requests.add_pyth_vaa([ETH_FEED_ID], 10, 1)
+    requests.add_pyth_vaa([BTC_FEED_ID], 10, 1)
+    assert requests.pyth_latest == [ETH_FEED_ID] and requests.pyth_latest_fee == 1
+    assert len(requests.pyth_vaa) == 1 and requests.pyth_vaa[0].fee == 2
+    assert ERC7412Requests().pyth_latest == []
+
+
+def test_fulfillment_attempts_bounded(make_snx):
+    """A call that keeps requiring oracle data fails after a bounded number of attempts"""
+    snx = make_snx(pyth=make_pyth())
+    market_proxy = snx.contracts["perpsFactory"]["PerpsMarketProxy"]["contract"]
+    call = (market_proxy.address, True, 0, "0x1234")
+    key = get_erc7412_requirement_key([(market_proxy, "indexPrice", (100,))])
+
+    # the price data never satisfies the oracle
+    oracle, execute = make_oracle(snx, [ETH_FEED_ID])
+    attempts = []
+
+    def execute_without_updates(calls):
+        attempts.append(len(calls))
+        return execute(calls[-1:])
+
+    with pytest.raises(Exception, match="Oracle data still required"):
+        execute_erc7412(snx, key, [call], execute_without_updates)
+    assert len(attempts) == ERC7412_MAX_ATTEMPTS
+    assert max(attempts) == 2
+
+
+def test_result_decoder_shared(make_snx):
+    """One result decoder is built per contract ABI and function"""
+    snx = make_snx(pyth=make_pyth())
+    market_proxy = snx.contracts["perpsFactory"]["PerpsMarketProxy"]["contract"]
+    other_market_proxy = snx.contracts["perpsFactory"]["PerpsMarketProxy"].at(
+        "0x0000000000000000000000000000000000000001"
+    )
+    types = ["int256", "int256", "int256", "int256"]
+    result = encode(types, [1, -2, 3, 4])
+
+    assert get_result_decoder(market_proxy, "getOpenPosition") is get_result_decoder(
+        other_market_proxy, "getOpenPosition"
+    )
+    assert decode_result(market_proxy, "getOpenPosition", result) == decode(
+        types, result
+    )
+
+    # decoders are released with their contract class
+    contract = Web3().eth.contract(abi=market_proxy.abi)
+    get_result_decoder(contract, "getOpenPosition")
+    num_decoders = len(_result_decoders)
+    del contract
+    gc.collect()
+    assert len(_result_decoders) == num_decoders - 1
+
+
+def make_multicall(snx, respond=None):
+    """
+    Utility to make a fake multicall, which echoes the market id of each
+    ``indexPrice`` call and records the calls of each multicall. The result of
+    each call can be replaced with ``respond(calls, call)``
+    """
+    contract = snx.contracts["system"]["trusted_multicall_forwarder"][
+        "TrustedMulticallForwarder"
+    ]["contract"]
+    multicall = SimpleNamespace(
+        address=contract.address,
+        encodeABI=contract.encodeABI,
+        requests=[],
+        blocks=[],
+    )
+
+    def aggregate3Value(calls):
+        def call(tx_params, block_identifier):
+            multicall.requests.append(calls)
+            multicall.blocks.append(block_identifier)
+            if respond is not None:
+                return [respond(calls, call) for call in calls]
+            return [(True, decode_hex(data)[-32:]) for _, _, _, data in calls]
+
+        return SimpleNamespace(call=call)
+
+    multicall.functions = SimpleNamespace(aggregate3Value=aggregate3Value)
+    return multicall
+
+
+def test_batch_chunked_by_calls(make_snx):
+    """Large batches are split into chunks and the results keep their order"""
+    snx = make_snx(pyth=make_pyth())
+    snx.multicall = make_multicall(snx)
+    snx.multicall_max_calls = 7
+    market_proxy = snx.contracts["perpsFactory"]["PerpsMarketProxy"]["contract"]
+
+    results = multicall_erc7412(snx, market_proxy, "indexPrice", list(range(50)))
+    assert results == list(range(50))
+    # the first chunk is sent alone, then the others in parallel
+    assert len(snx.multicall.requests[0]) == 7
+    assert sorted(len(calls) for calls in snx.multicall.requests) == [1] + [7] * 7
+
+    # a batch that fits in one chunk is sent in one multicall
+    snx.multicall.requests = []
+    assert multicall_erc7412(snx, market_proxy, "indexPrice", [1, 2]) == [1, 2]
+    assert len(snx.multicall.requests) == 1
+
+
+def test_batch_chunked_by_gas(http_server, make_snx):
+    """Batches are split by the estimated gas of each call"""
+
+    def respond(method, path, body):
+        request = json.loads(body)
+        responses = []
+        for item in request:
+            calls = decode(
+                ["(address,bool,uint256,bytes)[]"],
+                decode_hex(item["params"][0]["data"])[4:],
+            )[0]
+            gas = 50_000 + 30_000 * len(calls)
+            responses.append({"jsonrpc": "2.0", "id": item["id"], "result": hex(gas)})
+        return 200, {"Content-Type": "application/json"}, json.dumps(responses).encode()
+
+    server = http_server(respond)
+    snx = make_snx(provider_rpc=server.url, pyth=make_pyth())
+    snx.multicall = make_multicall(snx)
+    snx.multicall_max_gas = 100_000
+    market_proxy = snx.contracts["perpsFactory"]["PerpsMarketProxy"]["contract"]
+
+    results = multicall_erc7412(snx, market_proxy, "indexPrice", list(range(20)))
+    assert results == list(range(20))
+    assert len(server.requests) == 1
+    assert len(snx.multicall.requests[0]) == 10
+    assert sorted(len(calls) for calls in snx.multicall.requests) == [1, 3, 3, 3, 10]
+
+
+def test_multicall_batch(make_snx):
+    """Reads added to a batch are made in one multicall and resolve futures"""
+    snx = make_snx(pyth=make_pyth())
+    snx.multicall = make_multicall(snx)
+    market_proxy = snx.contracts["perpsFactory"]["PerpsMarketProxy"]["contract"]
+    account_proxy = snx.contracts["perpsFactory"]["PerpsAccountProxy"]["contract"]
+
+    batch = MulticallBatch(snx)
+    price = batch.add(market_proxy, "indexPrice", (100,))
+    balance = batch.add(account_proxy, "balanceOf", (TEST_ADDRESS,))
+    assert len(batch) == 2 and not price.done()
+
+    assert batch.execute() == [100, 1]
+    assert price.result() == 100
+    assert balance.result() == 1
+    assert len(snx.multicall.requests) == 1
+    assert len(batch) == 0
+
+
+def test_snapshot_cache(make_snx):
+    """Reads in a snapshot are made at its block and identical reads are cached"""
+    snx = make_snx(pyth=make_pyth())
+    snx.multicall = make_multicall(snx)
+    snx._get_tx_params = lambda value=0: {"value": value}
+    market_proxy = snx.contracts["perpsFactory"]["PerpsMarketProxy"]["contract"]
+
+    with snapshot(snx, 100):
+        assert multicall_erc7412(snx, market_proxy, "indexPrice", [1, 2]) == [1, 2]
+        assert multicall_erc7412(snx, market_proxy, "indexPrice", [2, 3]) == [2, 3]
+        assert call_erc7412(snx, market_proxy, "indexPrice", 3) == 3
+
+        # reads at another block are not pinned or cached
+        assert call_erc7412(snx, market_proxy, "indexPrice", 3, block=99) == 3
+    assert [len(calls) for calls in snx.multicall.requests] == [2, 1, 1]
+    assert snx.multicall.blocks == [100, 100, 99]
+
+    # the cache is kept for the same block, and evicted for a new one
+    with snapshot(snx, 100):
+        assert call_erc7412(snx, market_proxy, "indexPrice", 1) == 1
+    with snapshot(snx, 101):
+        assert call_erc7412(snx, market_proxy, "indexPrice", 1) == 1
+    assert snx.multicall.blocks == [100, 100, 99, 101]
+
+    # reads outside a snapshot use the latest block
+    call_erc7412(snx, market_proxy, "indexPrice", 1)
+    assert snx.multicall.blocks[-1] == "latest"
+
+    # cached results are copies, so changing them does not change the cache
+    with snapshot(snx, 102):
+        results = multicall_erc7412(
+            snx, market_proxy, "indexPrice", [1], allow_failure=True
+        )
+        results[0]["value"] = 2
+        results = multicall_erc7412(
+            snx, market_proxy, "indexPrice", [1], allow_failure=True
+        )
+        assert results[0]["value"] == 1
+
+
+def test_snapshot_scoped_to_thread(make_snx):
+    """A snapshot in one thread does not pin the reads of other threads"""
+    snx = make_snx(pyth=make_pyth())
+    snx.multicall = make_multicall(snx)
+    snx._get_tx_params = lambda value=0: {"value": value}
+    market_proxy = snx.contracts["perpsFactory"]["PerpsMarketProxy"]["contract"]
+
+    entered, done = threading.Event(), threading.Event()
+
+    def read_in_snapshot():
+        with snapshot(snx, 100):
+            call_erc7412(snx, market_proxy, "indexPrice", 1)
+            entered.set()
+            done.wait(5)
+            call_erc7412(snx, market_proxy, "indexPrice", 1)
+
+    thread = threading.Thread(target=read_in_snapshot)
+    thread.start()
+    try:
+        assert entered.wait(5)
+        call_erc7412(snx, market_proxy, "indexPrice", 1)
+        call_erc7412(snx, market_proxy, "indexPrice", 1)
+    finally:
+        done.set()
+        thread.join(5)
+
+    # the snapshot read is cached, the other thread reads the latest block
+    assert snx.multicall.blocks == [100, "latest", "latest"]
+
+
+def test_batch_allow_failure(make_snx):
+    """Failed calls are returned with their revert reason, or raise an error"""
+    snx = make_snx(pyth=make_pyth())
+    wrapper = snx.contracts["pyth_erc7412_wrapper"]["PythERC7412Wrapper"]["address"]
+    market_proxy = snx.contracts["perpsFactory"]["PerpsMarketProxy"]["contract"]
+
+    def respond(calls, call):
+        to, _, _, data = call
+        if to == wrapper:
+            return True, b""
+
+        market_id = decode_hex(data)[-32:]
+        if decode(["uint128"], market_id)[0] == 2:
+            selector = function_signature_to_4byte_selector("InvalidMarket(uint128)")
+            return False, selector + market_id
+        if decode(["uint128"], market_id)[0] == 3:
+            # the oracle update is required until it is included
+            if not any(to == wrapper for to, _, _, _ in calls):
+                oracle_data = encode(
+                    ["uint8", "uint64", "bytes32[]"], [1, 60, [decode_hex(ETH_FEED_ID)]]
+                )
+                error = encode(
+                    ["address", "bytes", "uint256"], [wrapper, oracle_data, 1]
+                )
+                return False, decode_hex(SELECTOR_ORACLE_DATA_REQUIRED_WITH_FEE) + error
+        return True, market_id
+
+    snx.multicall = make_multicall(snx, respond)
+    results = multicall_erc7412(
+        snx, market_proxy, "indexPrice", [1, 2, 3], allow_failure=True
+    )
+    assert results == [
+        {"success": True, "value": 1, "error": None},
+        {"success": False, "value": None, "error": "InvalidMarket(2)"},
+        {"success": True, "value": 3, "error": None},
+    ]
+    assert snx.pyth.requests == [[ETH_FEED_ID]]
+
+    with pytest.raises(Exception, match="indexPrice reverted: InvalidMarket"):
+        multicall_erc7412(snx, market_proxy, "indexPrice", [1, 2])
+
+
+def test_batch_allow_failure_unfulfilled(make_snx):
+    """Calls whose oracle data can not be fulfilled fail alone with allow_failure"""
+    snx = make_snx(pyth=make_pyth())
+    wrapper = snx.contracts["pyth_erc7412_wrapper"]["PythERC7412Wrapper"]["address"]
+    market_proxy = snx.contracts["perpsFactory"]["PerpsMarketProxy"]["contract"]
+    feed_ids = {2: BTC_FEED_ID, 3: ETH_FEED_ID}
+
+    def respond(calls, call):
+        to, _, _, data = call
+        if to == wrapper:
+            return True, b""
+
+        # the BTC update never fulfills the requirement
+        market_id = decode_hex(data)[-32:]
+        feed_id = feed_ids.get(decode(["uint128"], market_id)[0])
+        updated = "".join(data for to, _, _, data in calls if to == wrapper)
+        if feed_id is not None and (
+            feed_id == BTC_FEED_ID or feed_id[2:] not in updated
+        ):
+            oracle_data = encode(
+                ["uint8", "uint64", "bytes32[]"], [1, 60, [decode_hex(feed_id)]]
+            )
+            error = encode(["address", "bytes", "uint256"], [wrapper, oracle_data, 1])
+            return False, decode_hex(SELECTOR_ORACLE_DATA_REQUIRED_WITH_FEE) + error
+        return True, market_id
+
+    snx.multicall = make_multicall(snx, respond)
+    results = multicall_erc7412(
+        snx, market_proxy, "indexPrice", [1, 2, 3], allow_failure=True
+    )
+    assert [result["success"] for result in results] == [True, False, True]
+    assert [result["value"] for result in results] == [1, None, 3]
+    assert len(snx.multicall.requests) == 3
+
+    # the unfulfilled feed is not learned
+    key = get_erc7412_requirement_key([(market_proxy, "indexPrice", (1,))] * 3)
+    assert snx._erc7412_requirements[key]["feed_ids"] == [ETH_FEED_ID]
+
+    # price data that can not be fetched fails the calls that require it
+    snx.pyth.get_price_from_ids = lambda feed_ids, publish_time=None: None
+    results = multicall_erc7412(
+        snx, market_proxy, "indexPrice", [4, 3], allow_failure=True
+    )
+    assert [result["success"] for result in results] == [True, False]
+    with pytest.raises(Exception, match="Oracle data still required"):
+        multicall_erc7412(snx, market_proxy, "indexPrice", [4, 3])
+
+
+def test_allow_failure_undecodable_result(make_snx):
+    """Results that can not be decoded are failed entries with allow_failure"""
+    snx = make_snx()
+    market_proxy = snx.contracts["perpsFactory"]["PerpsMarketProxy"]["contract"]
+    contract_calls = [(market_proxy, "indexPrice", (i,)) for i in [1, 2]]
+    results = [(True, encode(["uint256"], [1])), (True, b"\x01")]
+
+    decoded = decode_call_results(contract_calls, results, allow_failure=True)
+    assert decoded[0] == {"success": True, "value": 1, "error": None}
+    assert decoded[1]["success"] is False
+    assert decoded[1]["error"].startswith("Failed to decode indexPrice")
+
+    with pytest.raises(Exception):
+        decode_call_results(contract_calls, results)
@@ -0,0 +1,120 @@
+from types import SimpleNamespace
+from synthetix.utils.gas_model import GasModel, MAX_PENDING_TRANSACTIONS
+from synthetix.utils.multicall import write_erc7412
+
+# constants
+TEST_ADDRESS = "0x0000000000000000000000000000000000000001"
+ESTIMATED_GAS = 100_000
+
+
+def make_multicall(snx):
+    """
+    Utility to make a fake multicall, which records the transactions it
+    estimates and simulates
+    """
+    snx.estimates = []
+    snx.simulations = []
+
+    contract = snx.contracts["system"]["trusted_multicall_forwarder"][
+        "TrustedMulticallForwarder"
+    ]["contract"]
+
+    def aggregate3Value(calls):
+        def build_transaction(tx_params):
+            if "gas" not in tx_params:
+                snx.estimates.append(calls)
+            return {
+                "gas": ESTIMATED_GAS,
+                **tx_params,
+                "data": contract.encodeABI(fn_name="aggregate3Value", args=[calls]),
+            }
+
+        def call(tx_params):
+            snx.simulations.append(calls)
+            return [(True, b"")] * len(calls)
+
+        return SimpleNamespace(build_transaction=build_transaction, call=call)
+
+    return SimpleNamespace(functions=SimpleNamespace(aggregate3Value=aggregate3Value))
+
+
+def send(snx, tx_data, tx_hash, gas_used):
+    "Utility to mark a transaction as sent and confirmed"
+    snx.gas_model.sent(tx_data, tx_hash)
+    snx.gas_model.confirmed(tx_hash, {"status": 1, "gasUsed": gas_used})
+
+
+# tests
+
+
+def test_gas_model_percentile():
+    """The gas limit is a high percentile of the recorded samples"""
+    gas_model = GasModel(percentile=90, min_samples=5, buffer=1.0)
+    key = (TEST_ADDRESS, "commitOrder", 1)
+    for gas_used in range(1, 10):
+        gas_model.record(key, gas_used * 1000)
+        assert (gas_model.estimate(key) is None) == (gas_used < 5)
+
+    assert gas_model.estimate(key) == 9000
+    assert gas_model.estimate((TEST_ADDRESS, "commitOrder", 2)) is None
+
+
+def test_write_skips_estimate(make_snx):
+    """Transactions with enough recorded receipts are not estimated"""
+    snx = make_snx(gas_model=GasModel(min_samples=2))
+    snx.multicall = make_multicall(snx)
+    market_proxy = snx.contracts["perpsFactory"]["PerpsMarketProxy"]["contract"]
+
+    for i, gas_used in enumerate([50_000, 60_000]):
+        tx_data = write_erc7412(snx, market_proxy, "modifyCollateral", (1, 0, 100))
+        assert tx_data["gas"] == int(ESTIMATED_GAS * 1.15)
+        send(snx, tx_data, f"0x{i}", gas_used)
+    assert len(snx.estimates) == 2
+
+    tx_data = write_erc7412(snx, market_proxy, "modifyCollateral", (1, 0, 100))
+    assert tx_data["gas"] == int(60_000 * snx.gas_model.buffer)
+    assert len(snx.estimates) == 2
+
+    # the learned gas limit is sent without a simulation, unless requested
+    assert len(snx.simulations) == 0
+    write_erc7412(snx, market_proxy, "modifyCollateral", (1, 0, 100), simulate=True)
+    assert len(snx.simulations) == 1
+
+    # a different number of oracle updates is estimated
+    oracle_update = (TEST_ADDRESS, True, 1, "0x")
+    write_erc7412(
+        snx, market_proxy, "modifyCollateral", (1, 0, 100), calls=[oracle_update]
+    )
+    assert len(snx.estimates) == 3
+
+
+def test_reverted_receipt_evicts(make_snx):
+    """A reverted transaction clears the samples of its key"""
+    snx = make_snx(gas_model=GasModel(min_samples=2))
+    snx.multicall = make_multicall(snx)
+    market_proxy = snx.contracts["perpsFactory"]["PerpsMarketProxy"]["contract"]
+    for i in range(2):
+        tx_data = write_erc7412(snx, market_proxy, "modifyCollateral", (1, 0, 100))
+        send(snx, tx_data, f"0x{i}", 50_000)
+
+    tx_data = write_erc7412(snx, market_proxy, "modifyCollateral", (1, 0, 100))
+    snx.gas_model.sent(tx_data, "0x2")
+    snx.gas_model.confirmed("0x2", {"status": 0, "gasUsed": 50_000})
+
+    write_erc7412(snx, market_proxy, "modifyCollateral", (1, 0, 100))
+    assert len(snx.estimates) == 3
+
+
+def test_pending_transactions_bounded():
+    """Transactions that are never confirmed are not remembered forever"""
+    gas_model = GasModel()
+    for i in range(MAX_PENDING_TRANSACTIONS + 10):
+        tx_data = {"data": f"0x{i:x}"}
+        gas_model.track(tx_data, (TEST_ADDRESS, "commitOrder", 1))
+        gas_model.sent(tx_data, f"0x{i}")
+    assert len(gas_model._pending_data) == 0
+    assert len(gas_model._pending_hashes) == MAX_PENDING_TRANSACTIONS
+
+    for i in range(MAX_PENDING_TRANSACTIONS + 10):
+        gas_model.track({"data": f"0x{i:x}"}, (TEST_ADDRESS, "commitOrder", 1))
+    assert len(gas_model._pending_data) == MAX_PENDING_TRANSACTIONS
@@ -0,0 +1,82 @@
+import json
+import asyncio
+from types import SimpleNamespace
+from urllib.parse import urlparse
+from synthetix.utils.http import HttpTransport, get_http
+
+
+def make_flaky_server(http_server, num_failures):
+    "Utility to start a server that responds with a 503 to the first requests"
+
+    def respond(method, path, body):
+        if len(server.requests) <= num_failures:
+            return 503, {}, b"unavailable"
+        return 200, {"Content-Type": "application/json"}, json.dumps(path).encode()
+
+    server = http_server(respond)
+    return server
+
+
+# tests
+
+
+def test_http_retries(http_server):
+    """Unavailable responses are retried, and requests are recorded per host"""
+    server = make_flaky_server(http_server, num_failures=2)
+    http = HttpTransport(max_retries=2, backoff_factor=0)
+
+    response = http.get(f"{server.url}/data", params={"id": 1})
+    assert response.json() == "/data?id=1"
+    assert len(server.requests) == 3
+
+    metrics = http.get_metrics()[urlparse(server.url).netloc]
+    assert metrics["requests"] == 1
+    assert metrics["errors"] == 0
+    assert metrics["max_time"] >= metrics["average_time"] > 0
+
+
+def test_http_retries_exhausted(http_server):
+    """The last response is returned once the retries are used up"""
+    server = make_flaky_server(http_server, num_failures=5)
+    http = HttpTransport(max_retries=1, backoff_factor=0)
+
+    response = http.post(f"{server.url}/query", json={"query": "{}"})
+    assert response.status_code == 503
+    assert len(server.requests) == 2
+    assert http.get_metrics()[urlparse(server.url).netloc]["errors"] == 1
+
+
+def test_get_http():
+    """Objects without a transport share a default transport"""
+    http = HttpTransport()
+    assert get_http(SimpleNamespace(http=http)) is http
+    assert get_http(SimpleNamespace()) is get_http(SimpleNamespace())
+    assert get_http(SimpleNamespace()) is not http
+
+
+def test_async_session_reused(http_server):
+    """Async requests on an event loop share one session until it is closed"""
+    server = make_flaky_server(http_server, num_failures=0)
+    http = HttpTransport()
+
+    async def fetch():
+        session = http.get_async_session()
+        async with session.get(f"{server.url}/data") as response:
+            await response.json()
+        return session
+
+    async def run():
+        first, second = await asyncio.gather(fetch(), fetch())
+        assert first is second
+        assert first.connector.limit_per_host == http.max_connections
+
+        await http.aclose()
+        assert first.closed
+        third = await fetch()
+        assert third is not first
+        await http.aclose()
+        return third
+
+    session = asyncio.run(run())
+    assert session.closed
+    assert len(server.requests) == 3
@@ -0,0 +1,49 @@
+import sys
+import subprocess
+from synthetix.queries.gql import QUERIES, get_query, queries
+
+# modules that should only be imported when ``snx.queries`` is used
+DEFERRED_MODULES = ["pandas", "gql", "synthetix.queries"]
+
+
+def get_import_times(statement):
+    "Utility to run a statement in a new interpreter and parse ``-X importtime``"
+    output = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", statement],
+        check=True,
+        capture_output=True,
+        text=True,
+    )
+    import_times = {}
+    for line in output.stderr.splitlines():
+        if not line.startswith("import time:") or "[us]" in line:
+            continue
+        _, cumulative, module = line[len("import time:") :].split("|")
+        import_times[module.strip()] = int(cumulative)
+    return import_times
+
+
+# tests
+
+
+def test_import_defers_queries():
+    """Importing synthetix does not import the queries module or its dependencies"""
+    import_times = get_import_times("import synthetix")
+
+    assert "synthetix" in import_times
+    import_ms = import_times["synthetix"] / 1000
+    for module in DEFERRED_MODULES:
+        assert (
+            module not in import_times
+        ), f"{module} is imported by synthetix ({import_ms:.0f} ms)"
+
+
+def test_queries_documents_parse():
+    """The GraphQL documents are parsed on first use"""
+    for name in QUERIES:
+        assert get_query(name) is get_query(name)
+
+    # the previous name still maps to the parsed documents
+    assert list(queries) == list(QUERIES)
+    assert queries["candles"] is get_query("candles")
+    assert "unknown" not in queries
@@ -0,0 +1,131 @@
+import json
+import asyncio
+from eth_abi import decode, encode
+from eth_utils import decode_hex, encode_hex
+from synthetix.pyth import Pyth
+from synthetix.utils.multicall import SELECTOR_ORACLE_DATA_REQUIRED_WITH_FEE
+from synthetix.utils.provider import create_async_web3
+from synthetix.utils.multicall_async import (
+    call_erc7412_async,
+    multicall_erc7412_async,
+)
+
+# constants
+ETH_FEED_ID = "0x" + "11" * 32
+
+
+def make_rpc(http_server, wrapper):
+    """
+    Utility to start a stub RPC. Multicalls revert with ``OracleDataRequired``
+    unless they include a call to the oracle wrapper, and otherwise return the
+    last 32 bytes of each call as its result.
+    """
+
+    def respond(method, path, body):
+        request = json.loads(body)
+        response = {"jsonrpc": "2.0", "id": request["id"], "result": "0x2105"}
+        if request["method"] == "eth_call":
+            data = decode_hex(request["params"][0]["data"])
+            calls = decode(["(address,bool,uint256,bytes)[]"], data[4:])[0]
+            if not any(call[0].lower() == wrapper.lower() for call in calls):
+                oracle_data = encode(
+                    ["uint8", "uint64", "bytes32[]"], [1, 60, [decode_hex(ETH_FEED_ID)]]
+                )
+                error = encode(
+                    ["address", "bytes", "uint256"], [wrapper, oracle_data, 1]
+                )
+                response = {
+                    "jsonrpc": "2.0",
+                    "id": request["id"],
+                    "error": {
+                        "code": 3,
+                        "message": "execution reverted",
+                        "data": SELECTOR_ORACLE_DATA_REQUIRED_WITH_FEE + error.hex(),
+                    },
+                }
+            else:
+                results = [(True, call[3][-32:]) for call in calls]
+                response["result"] = encode_hex(encode(["(bool,bytes)[]"], [results]))
+        return 200, {"Content-Type": "application/json"}, json.dumps(response).encode()
+
+    return http_server(respond)
+
+
+def make_async_snx(http_server, make_snx, make_price_service):
+    "Utility to build a minimal Synthetix object with stub RPC and Pyth services"
+    snx = make_snx()
+    snx.multicall = snx.contracts["system"]["trusted_multicall_forwarder"][
+        "TrustedMulticallForwarder"
+    ]["contract"]
+
+    wrapper = snx.contracts["pyth_erc7412_wrapper"]["PythERC7412Wrapper"]["address"]
+    snx.rpc = make_rpc(http_server, wrapper)
+    snx.async_web3 = create_async_web3(snx.rpc.url)
+
+    snx.price_service = make_price_service(price=2000)
+    snx.pyth = Pyth(snx, cache_ttl=0, price_service_endpoint=snx.price_service.url)
+    return snx
+
+
+# tests
+
+
+def test_call_erc7412_async(http_server, make_snx, make_price_service):
+    """Async reads handle oracle errors and run concurrently"""
+    snx = make_async_snx(http_server, make_snx, make_price_service)
+    market_proxy = snx.contracts["perpsFactory"]["PerpsMarketProxy"]["contract"]
+
+    async def read_prices():
+        return await asyncio.gather(
+            *[
+                call_erc7412_async(snx, market_proxy, "indexPrice", (market_id,))
+                for market_id in range(5)
+            ]
+        )
+
+    assert asyncio.run(read_prices()) == list(range(5))
+    assert len(snx.price_service.requests) > 0
+
+    # the learned oracle updates are prepended, so each read is one call
+    num_calls = len(snx.rpc.requests)
+    assert asyncio.run(read_prices()) == list(range(5))
+    assert len(snx.rpc.requests) == num_calls + 5
+
+
+def test_multicall_erc7412_async_chunks(http_server, make_snx, make_price_service):
+    """Async multicalls are split into chunks and keep their order"""
+    snx = make_async_snx(http_server, make_snx, make_price_service)
+    snx.multicall_max_calls = 4
+    market_proxy = snx.contracts["perpsFactory"]["PerpsMarketProxy"]["contract"]
+
+    results = asyncio.run(
+        multicall_erc7412_async(snx, market_proxy, "indexPrice", list(range(10)))
+    )
+    assert results == list(range(10))
+
+
+def test_fetch_prices_async(
+    http_server, make_snx, make_price_service, make_accumulator_update
+):
+    """Pyth price data is fetched without blocking the event loop"""
+    snx = make_async_snx(http_server, make_snx, make_price_service)
+    pyth_data = asyncio.run(snx.pyth.get_price_from_ids_async([ETH_FEED_ID]))
+
+    assert pyth_data["price_update_data"] == [make_accumulator_update([ETH_FEED_ID])]
+    assert pyth_data["meta"][ETH_FEED_ID]["price"] == 2000
+    assert (
+        b"ids%5B%5D=" + ETH_FEED_ID.encode()
+        in snx.price_service.requests[0][1].encode()
+    )
+
+
+def test_create_async_web3_request_kwargs():
+    """Request kwargs for requests are converted for aiohttp"""
+    async_web3 = create_async_web3(
+        "http://localhost:8545", {"timeout": (1, 2), "verify": False}
+    )
+    request_kwargs = async_web3.provider.get_request_kwargs()
+    assert request_kwargs["timeout"].sock_connect == 1
+    assert request_kwargs["timeout"].sock_read == 2
+    assert request_kwargs["ssl"] is False
+    assert "verify" not in request_kwargs
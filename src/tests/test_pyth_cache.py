@@ -0,0 +1,324 @@
+import time
+import asyncio
+import logging
+from types import SimpleNamespace
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import parse_qs, urlparse
+from synthetix.pyth import Pyth, PythPrefetcher
+from synthetix.pyth.endpoints import (
+    CIRCUIT_FAILURE_THRESHOLD,
+    CIRCUIT_RESET_TIMEOUT,
+    PythEndpoint,
+    sort_endpoints,
+)
+from synthetix.pyth.pyth import split_accumulator_update
+from synthetix.utils.http import HttpTransport
+
+# constants
+ETH_FEED_ID = "0x" + "11" * 32
+BTC_FEED_ID = "0x" + "22" * 32
+SNX_FEED_ID = "0x" + "33" * 32
+MISSING_FEED_ID = "0x" + "44" * 32
+
+
+def make_pyth(make_price_service, cache_dir=None, service=None):
+    """
+    Utility to build a Pyth client connected to a stub price service, which
+    does not have ``MISSING_FEED_ID``
+    """
+    service = service or make_price_service(missing_feed_ids=[MISSING_FEED_ID])
+    snx = SimpleNamespace(logger=logging.getLogger(__name__), cache_dir=cache_dir)
+    return service, Pyth(snx, cache_ttl=60, price_service_endpoint=service.url)
+
+
+def wait_for(condition, timeout=5):
+    "Utility to wait for a condition set by a background thread"
+    end = time.time() + timeout
+    while not condition() and time.time() < end:
+        time.sleep(0.05)
+    return condition()
+
+
+def get_feed_ids(path):
+    "Utility to get the feed ids of a request"
+    return parse_qs(urlparse(path).query)["ids[]"]
+
+
+# tests
+
+
+def test_split_accumulator_update(make_accumulator_update):
+    """Accumulator updates are split by feed and can be joined again"""
+    data = make_accumulator_update([ETH_FEED_ID, BTC_FEED_ID])
+    header, updates = split_accumulator_update(data)
+
+    assert list(updates) == [ETH_FEED_ID, BTC_FEED_ID]
+    assert header + b"\x02" + b"".join(updates.values()) == data
+    assert split_accumulator_update(b"\x01") is None
+
+
+def test_pyth_cache_per_feed(make_price_service, make_accumulator_update):
+    """Cached feeds are reused by any request, and only other feeds are fetched"""
+    service, pyth = make_pyth(make_price_service)
+    pyth.get_price_from_ids([ETH_FEED_ID, BTC_FEED_ID, SNX_FEED_ID])
+
+    # a subset is built from the cache, with only its feed updates
+    pyth_data = pyth.get_price_from_ids([ETH_FEED_ID])
+    assert len(service.requests) == 1
+    assert pyth_data["price_update_data"] == [make_accumulator_update([ETH_FEED_ID])]
+    assert list(pyth_data["meta"]) == [ETH_FEED_ID]
+
+    # only the uncached feed is fetched
+    new_feed_id = "0x" + "55" * 32
+    pyth_data = pyth.get_price_from_ids([BTC_FEED_ID, new_feed_id])
+    assert get_feed_ids(service.requests[-1][1]) == [new_feed_id]
+    assert len(pyth_data["price_update_data"]) == 2
+    assert list(pyth_data["meta"]) == [BTC_FEED_ID, new_feed_id]
+
+
+def test_pyth_feed_id_formats(make_price_service):
+    """Feed ids in uppercase or without a prefix share the cache entries"""
+    service, pyth = make_pyth(make_price_service)
+    feed_id = "0x" + "ab" * 32
+
+    pyth_data = pyth.get_price_from_ids(["0x" + "AB" * 32])
+    assert get_feed_ids(service.requests[-1][1]) == [feed_id]
+    assert list(pyth_data["meta"]) == [feed_id]
+
+    pyth_data = pyth.get_price_from_ids(["ab" * 32])
+    assert len(service.requests) == 1
+    assert list(pyth_data["meta"]) == [feed_id]
+
+
+def test_pyth_missing_feeds(make_price_service):
+    """Feeds the price service does not have are remembered and skipped"""
+    service, pyth = make_pyth(make_price_service)
+
+    pyth_data = pyth.get_price_from_ids([ETH_FEED_ID, MISSING_FEED_ID])
+    assert list(pyth_data["meta"]) == [ETH_FEED_ID]
+    assert len(service.requests) == 2
+
+    pyth.cache_ttl = 0
+    pyth_data = pyth.get_price_from_ids([BTC_FEED_ID, MISSING_FEED_ID])
+    assert list(pyth_data["meta"]) == [BTC_FEED_ID]
+    assert get_feed_ids(service.requests[-1][1]) == [BTC_FEED_ID]
+    assert len(service.requests) == 3
+
+
+def test_pyth_history_cache(make_price_service, make_accumulator_update, tmp_path):
+    """Updates for a publish time are cached on disk and shared between clients"""
+    service, pyth = make_pyth(make_price_service, cache_dir=str(tmp_path))
+    pyth.get_price_from_ids([ETH_FEED_ID, BTC_FEED_ID], publish_time=100)
+    assert service.requests[-1][1].startswith("/v2/updates/price/100?")
+
+    # another client reads the cached feeds, and only fetches the others
+    _, other_pyth = make_pyth(
+        make_price_service, cache_dir=str(tmp_path), service=service
+    )
+    pyth_data = other_pyth.get_price_from_ids([ETH_FEED_ID], publish_time=100)
+    assert len(service.requests) == 1
+    assert pyth_data["price_update_data"] == [make_accumulator_update([ETH_FEED_ID])]
+    assert pyth_data["meta"][ETH_FEED_ID]["price"] == 100
+    assert (ETH_FEED_ID, 100) in other_pyth._history
+
+    other_pyth.get_price_from_ids([ETH_FEED_ID, SNX_FEED_ID], publish_time=100)
+    assert get_feed_ids(service.requests[-1][1]) == [SNX_FEED_ID]
+
+    # other publish times are fetched
+    other_pyth.get_price_from_ids([ETH_FEED_ID], publish_time=101)
+    assert len(service.requests) == 3
+
+    # feed ids that are not 32 byte hex strings are not used as paths
+    assert other_pyth._get_history_path(ETH_FEED_ID[2:], 100) is not None
+    assert other_pyth._get_history_path("../" + ETH_FEED_ID[5:], 100) is None
+
+
+def test_pyth_stream(make_price_service):
+    """Streamed prices are used without a request, and requests are made once they are stale"""
+    service, pyth = make_pyth(make_price_service)
+    pyth.cache_ttl = 0
+    stream = pyth.start_stream([ETH_FEED_ID, BTC_FEED_ID], stale_after=5)
+    try:
+        assert wait_for(lambda: stream.num_updates >= 2)
+        pyth_data = pyth.get_price_from_ids([ETH_FEED_ID])
+        assert pyth_data["meta"][ETH_FEED_ID]["price"] == 100
+        assert all(
+            urlparse(path).path.endswith("/stream") for _, path, _ in service.requests
+        )
+
+        # the stream is reconnected when it ends
+        assert wait_for(lambda: stream.num_connections >= 2)
+    finally:
+        pyth.stop_stream()
+
+    # stale prices are fetched
+    for entry in pyth._cache.values():
+        entry["timestamp"] -= 10
+    pyth.get_price_from_ids([ETH_FEED_ID])
+    assert urlparse(service.requests[-1][1]).path.endswith("/latest")
+
+
+def make_endpoints(make_price_service, delays):
+    """
+    Utility to start stub price services that respond after a delay, or with a
+    ``503`` if the delay is ``None``, and a Pyth client hedging across them
+    """
+    services = []
+    for delay in delays:
+        service = make_price_service()
+        handler = service.RequestHandlerClass
+
+        def handle(self, handler=handler, delay=delay):
+            if delay is None:
+                self.server.requests.append((self.command, self.path, b""))
+                self.send_response(503)
+                self.send_header("Content-Length", "0")
+                self.end_headers()
+                return
+            time.sleep(delay)
+            handler.do_GET(self)
+
+        service.RequestHandlerClass = type("Handler", (handler,), {"do_GET": handle})
+        services.append(service)
+
+    snx = SimpleNamespace(
+        logger=logging.getLogger(__name__),
+        cache_dir=None,
+        http=HttpTransport(max_retries=0),
+    )
+    pyth = Pyth(
+        snx,
+        cache_ttl=0,
+        price_service_endpoint=[service.url for service in services],
+        hedge_after=0.1,
+    )
+    return services, pyth
+
+
+def test_pyth_hedged_requests(make_price_service):
+    """A slow endpoint is hedged, and the first valid response is used"""
+    (slow, fast), pyth = make_endpoints(make_price_service, [2, 0])
+
+    start = time.time()
+    pyth_data = pyth.get_price_from_ids([ETH_FEED_ID])
+    assert time.time() - start < 1
+    assert list(pyth_data["meta"]) == [ETH_FEED_ID]
+    assert len(fast.requests) == 1
+
+    # the async requests are hedged the same way
+    start = time.time()
+    pyth_data = asyncio.run(pyth.get_price_from_ids_async([BTC_FEED_ID]))
+    assert time.time() - start < 1
+    assert list(pyth_data["meta"]) == [BTC_FEED_ID]
+    assert len(fast.requests) == 2
+
+
+def test_pyth_failover(make_price_service):
+    """A failing endpoint is failed over immediately, and then demoted"""
+    (failing, healthy), pyth = make_endpoints(make_price_service, [None, 0])
+
+    assert pyth.get_price_from_ids([ETH_FEED_ID]) is not None
+    assert pyth.get_price_from_ids([ETH_FEED_ID]) is not None
+    assert len(failing.requests) == 1
+    assert len(healthy.requests) == 2
+
+    health = pyth.get_endpoint_health()
+    assert health[failing.url]["score"] < health[healthy.url]["score"]
+
+
+def test_circuit_breaker():
+    """An endpoint is skipped while its circuit is open, then tried again"""
+    primary, secondary = PythEndpoint("http://primary"), PythEndpoint(
+        "http://secondary"
+    )
+    for _ in range(CIRCUIT_FAILURE_THRESHOLD):
+        primary.record(0.1, False)
+    assert primary.is_open
+    assert sort_endpoints([primary, secondary]) == [secondary]
+
+    # once the timeout passes one more failure opens it again
+    primary.opened_at -= CIRCUIT_RESET_TIMEOUT
+    assert sort_endpoints([primary, secondary]) == [secondary, primary]
+    primary.record(0.1, False)
+    assert primary.is_open
+
+    # a success closes it, and every circuit open still tries all endpoints
+    primary.opened_at -= CIRCUIT_RESET_TIMEOUT
+    primary.record(0.1, True)
+    assert not primary.is_open
+    for _ in range(CIRCUIT_FAILURE_THRESHOLD):
+        secondary.record(0.1, False)
+    assert sort_endpoints([secondary]) == [secondary]
+
+
+def test_pyth_coalesced_fetches(make_price_service, make_accumulator_update):
+    """Concurrent fetches are merged into one request, and each caller gets its feeds"""
+    service, pyth = make_pyth(make_price_service)
+    pyth.cache_ttl = 0
+    pyth.coalesce_window = 0.2
+
+    requested = [[ETH_FEED_ID], [ETH_FEED_ID, BTC_FEED_ID], [SNX_FEED_ID]]
+    with ThreadPoolExecutor(len(requested)) as executor:
+        results = list(executor.map(pyth.get_price_from_ids, requested))
+
+    assert len(service.requests) == 1
+    assert set(get_feed_ids(service.requests[0][1])) == {
+        ETH_FEED_ID,
+        BTC_FEED_ID,
+        SNX_FEED_ID,
+    }
+    for feed_ids, pyth_data in zip(requested, results):
+        assert list(pyth_data["meta"]) == feed_ids
+        assert pyth_data["price_update_data"] == [make_accumulator_update(feed_ids)]
+    assert pyth._inflight == {}
+
+
+def test_pyth_prefetch(make_price_service, make_accumulator_update):
+    """Updates at a publish time are fetched once available, and used without a request"""
+    service, pyth = make_pyth(make_price_service)
+    pyth.prefetcher = PythPrefetcher(pyth, delay=0)
+    publish_time = int(time.time()) + 2
+    try:
+        eth_future = pyth.prefetch([ETH_FEED_ID], publish_time)
+        btc_future = pyth.prefetch([BTC_FEED_ID], publish_time)
+        assert len(service.requests) == 0
+
+        pyth_data = pyth.wait_for_update([ETH_FEED_ID, BTC_FEED_ID], publish_time)
+        assert time.time() >= publish_time
+        assert list(pyth_data["meta"]) == [ETH_FEED_ID, BTC_FEED_ID]
+        assert list(eth_future.result()["meta"]) == [ETH_FEED_ID]
+        assert list(btc_future.result()["meta"]) == [BTC_FEED_ID]
+    finally:
+        pyth.stop_prefetch()
+
+    # the targets are fetched with one request, and kept in memory
+    assert len(service.requests) == 1
+    assert service.requests[0][1].startswith(f"/v2/updates/price/{publish_time}?")
+    pyth_data = pyth.get_price_from_ids([ETH_FEED_ID], publish_time=publish_time)
+    assert pyth_data["price_update_data"] == [make_accumulator_update([ETH_FEED_ID])]
+    assert len(service.requests) == 1
+
+
+def test_pyth_prefetch_retries(make_price_service):
+    """Updates that are not available yet are fetched again"""
+    service = make_price_service()
+    respond = service.RequestHandlerClass
+
+    def handle(self):
+        if len(service.requests) < 2:
+            self.server.requests.append((self.command, self.path, b""))
+            self.send_response(404)
+            self.send_header("Content-Length", "0")
+            self.end_headers()
+            return
+        respond.do_GET(self)
+
+    service.RequestHandlerClass = type("Handler", (respond,), {"do_GET": handle})
+    _, pyth = make_pyth(make_price_service, service=service)
+    pyth.prefetcher = PythPrefetcher(pyth, delay=0)
+    try:
+        future = pyth.prefetch([ETH_FEED_ID], int(time.time()))
+        assert list(future.result(timeout=5)["meta"]) == [ETH_FEED_ID]
+        assert pyth.prefetcher.num_fetches == 3
+    finally:
+        pyth.stop_prefetch()
@@ -0,0 +1,154 @@
+import json
+import logging
+from types import SimpleNamespace
+from web3 import Web3
+from eth_abi import encode
+from eth_utils import encode_hex
+from synthetix.contracts import load_contracts
+from synthetix.utils.rpc import batch_request
+from synthetix.utils.prefetch import (
+    call_prefetched,
+    get_startup_reads,
+    prefetch_startup,
+)
+
+# constants
+TEST_NETWORK_ID = 8453
+TEST_ADDRESS = "0x0000000000000000000000000000000000000001"
+
+
+def make_rpc_server(http_server, results, batch=True, batch_status=200):
+    "Utility to start a JSON-RPC server returning a fixed result for each method"
+
+    def respond_item(request):
+        result = results[request["method"]]
+        if isinstance(result, dict):
+            return {"jsonrpc": "2.0", "id": request["id"], "error": result}
+        return {"jsonrpc": "2.0", "id": request["id"], "result": result}
+
+    def respond(method, path, body):
+        request = json.loads(body)
+        if isinstance(request, list):
+            if batch_status != 200:
+                return batch_status, {"Content-Type": "text/plain"}, b"Not Allowed"
+            if not batch:
+                response = {"jsonrpc": "2.0", "id": None, "error": {"code": -32600}}
+            else:
+                # respond out of order, like some providers do
+                response = [respond_item(item) for item in reversed(request)]
+        else:
+            response = respond_item(request)
+        return 200, {"Content-Type": "application/json"}, json.dumps(response).encode()
+
+    return http_server(respond)
+
+
+# tests
+
+
+def test_batch_request(http_server):
+    """Requests are sent in one batch and results are returned in order"""
+    server = make_rpc_server(
+        http_server,
+        {
+            "eth_chainId": "0x2105",
+            "eth_blockNumber": "0x10",
+            "eth_accounts": {"code": -32601, "message": "Method not found"},
+        },
+    )
+    web3 = Web3(Web3.HTTPProvider(server.url))
+
+    chain_id, accounts, block_number = batch_request(
+        web3, [("eth_chainId", []), ("eth_accounts", []), ("eth_blockNumber", [])]
+    )
+
+    assert len(server.requests) == 1
+    assert chain_id == "0x2105"
+    assert block_number == "0x10"
+    assert isinstance(accounts, ValueError)
+
+
+def test_batch_request_unsupported(http_server):
+    """Requests are sent one at a time if the provider does not support batches"""
+    server = make_rpc_server(
+        http_server, {"eth_chainId": "0x2105", "eth_blockNumber": "0x10"}, batch=False
+    )
+    web3 = Web3(Web3.HTTPProvider(server.url))
+
+    results = batch_request(web3, [("eth_chainId", []), ("eth_blockNumber", [])])
+
+    assert results == ["0x2105", "0x10"]
+    assert len(server.requests) == 3
+
+
+def test_batch_request_rejected(http_server):
+    """Requests are sent one at a time if the provider rejects batches"""
+    server = make_rpc_server(
+        http_server,
+        {"eth_chainId": "0x2105", "eth_blockNumber": "0x10"},
+        batch_status=405,
+    )
+    web3 = Web3(Web3.HTTPProvider(server.url))
+
+    results = batch_request(web3, [("eth_chainId", []), ("eth_blockNumber", [])])
+
+    assert results == ["0x2105", "0x10"]
+    assert len(server.requests) == 3
+
+
+def test_prefetch_startup(http_server):
+    """Startup reads are fetched with the nonce and each result is used once"""
+    server = make_rpc_server(
+        http_server,
+        {
+            "eth_chainId": hex(TEST_NETWORK_ID),
+            "eth_getTransactionCount": "0x7",
+            "eth_call": encode_hex(encode(["uint256"], [3])),
+        },
+    )
+    snx = SimpleNamespace(
+        web3=Web3(Web3.HTTPProvider(server.url)),
+        network_id=TEST_NETWORK_ID,
+        cannon_config=None,
+        cache_dir=None,
+        address=TEST_ADDRESS,
+        logger=logging.getLogger(__name__),
+    )
+    snx.contracts = load_contracts(snx)
+    account_proxy = snx.contracts["system"]["AccountProxy"]["contract"]
+
+    assert prefetch_startup(snx) == 7
+    assert len(server.requests) == 1
+    batch = json.loads(server.requests[0][2])
+    assert [item["method"] for item in batch].count("eth_call") == 3
+
+    # the first call uses the prefetched result, the second reads from the chain
+    assert call_prefetched(snx, account_proxy, "balanceOf", (TEST_ADDRESS,)) == 3
+    assert len(server.requests) == 1
+    assert call_prefetched(snx, account_proxy, "balanceOf", (TEST_ADDRESS,)) == 3
+    assert b'"eth_call"' in server.requests[-1][2]
+    assert len(server.requests) > 1
+
+
+def test_startup_reads_modules():
+    """Only the reads of the modules loaded at startup are prefetched"""
+    snx = SimpleNamespace(
+        web3=Web3(),
+        network_id=TEST_NETWORK_ID,
+        cannon_config=None,
+        cache_dir=None,
+        address=TEST_ADDRESS,
+        logger=logging.getLogger(__name__),
+    )
+    snx.contracts = load_contracts(snx)
+
+    reads = get_startup_reads(snx, ["perps"])
+    assert [function_name for _, function_name, _ in reads] == [
+        "balanceOf",
+        "getMarkets",
+    ]
+    assert (
+        reads[0][0].address
+        == snx.contracts["perpsFactory"]["PerpsAccountProxy"]["address"]
+    )
+    assert get_startup_reads(snx, []) == []
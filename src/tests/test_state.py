@@ -0,0 +1,100 @@
+import os
+import json
+from types import SimpleNamespace
+from eth_abi import encode
+from eth_utils import encode_hex
+from synthetix.utils.state import (
+    get_state_path,
+    int_keys,
+    read_state,
+    restore_account_ids,
+    write_state,
+)
+
+# constants
+TEST_ADDRESS = "0x0000000000000000000000000000000000000001"
+OTHER_ADDRESS = "0x0000000000000000000000000000000000000002"
+TEST_MODULES = {
+    "core": {"account_ids": [1, 2]},
+    "perps": {"account_ids": [], "markets_by_id": {100: {"market_name": "ETH"}}},
+}
+
+
+def start_rpc(http_server):
+    "Utility to start a stub RPC that returns the same result for any request"
+
+    def respond(method, path, body):
+        request = json.loads(body)
+        response = {"jsonrpc": "2.0", "id": request["id"], "result": "0x10"}
+        return 200, {"Content-Type": "application/json"}, json.dumps(response).encode()
+
+    return http_server(respond)
+
+
+# tests
+
+
+def test_state_round_trip(http_server, make_snx, tmp_path):
+    """Saved state is loaded for the same network, address and deployment"""
+    server = start_rpc(http_server)
+    snx = make_snx(provider_rpc=server.url, cache_dir=str(tmp_path), server=server)
+    assert read_state(snx) is None
+
+    write_state(snx, TEST_MODULES)
+    modules = read_state(snx)
+    assert modules["core"] == {"account_ids": [1, 2]}
+    assert int_keys(modules["perps"]["markets_by_id"]) == {100: {"market_name": "ETH"}}
+
+    # state is not shared between addresses
+    other_snx = make_snx(
+        provider_rpc=server.url, cache_dir=str(tmp_path), address=OTHER_ADDRESS
+    )
+    assert read_state(other_snx) is None
+
+
+def test_state_invalidated_by_deployment(http_server, make_snx, tmp_path):
+    """Saved state is discarded if a proxy address changes"""
+    server = start_rpc(http_server)
+    snx = make_snx(provider_rpc=server.url, cache_dir=str(tmp_path), server=server)
+    write_state(snx, TEST_MODULES)
+
+    snx.contracts["system"]["CoreProxy"] = {"address": OTHER_ADDRESS}
+    assert read_state(snx) is None
+
+
+def test_state_unchanged_not_written(http_server, make_snx, tmp_path):
+    """The state file is not rewritten if the state did not change"""
+    server = start_rpc(http_server)
+    snx = make_snx(provider_rpc=server.url, cache_dir=str(tmp_path), server=server)
+    write_state(snx, TEST_MODULES)
+    os.utime(get_state_path(snx), ns=(0, 0))
+    num_requests = len(snx.server.requests)
+
+    write_state(snx, TEST_MODULES, read_state(snx))
+    assert os.stat(get_state_path(snx)).st_mtime_ns == 0
+    assert len(snx.server.requests) == num_requests
+
+
+def test_restore_account_ids(http_server, make_snx, tmp_path):
+    """Account ids are restored if the account balance is unchanged"""
+    server = start_rpc(http_server)
+    snx = make_snx(provider_rpc=server.url, cache_dir=str(tmp_path), server=server)
+    module = SimpleNamespace(
+        snx=snx, account_proxy=snx.contracts["system"]["AccountProxy"]["contract"]
+    )
+    data = module.account_proxy.encodeABI(fn_name="balanceOf", args=(TEST_ADDRESS,))
+
+    def prefetch_balance(balance):
+        snx._prefetched_reads = {
+            (module.account_proxy.address, data): encode_hex(
+                encode(["uint256"], [balance])
+            )
+        }
+
+    prefetch_balance(2)
+    assert restore_account_ids(module, {"account_ids": [5, 6]})
+    assert module.account_ids == [5, 6]
+    assert module.default_account_id == 5
+
+    prefetch_balance(3)
+    assert not restore_account_ids(module, {"account_ids": [5, 6]})
@@ -1,5 +1,13 @@
 import os
+import json
+from eth_abi import encode
+from eth_utils import encode_hex
 from synthetix import Synthetix
+from synthetix.contracts.index import get_index_path
+from synthetix.utils.state import get_state_path
+
+# constants
+TEST_ADDRESS = "0x0000000000000000000000000000000000000001"
 
 # tests
 
@@ -14,3 +22,61 @@ def test_synthetix_web3(snx, logger):
     block = snx.web3.eth.get_block(block_identifier="latest")
     logger.info(f"Block: {block}")
     assert block is not None
+
+
+def test_synthetix_startup(http_server, tmp_path):
+    """Startup reads are prefetched, and the saved state is used on a warm start"""
+    balance = encode_hex(encode(["uint256"], [0]))
+    results = {
+        "eth_accounts": [],
+        "eth_chainId": "0x2105",
+        "eth_getTransactionCount": "0x7",
+        "eth_blockNumber": "0x10",
+        "eth_call": balance,
+    }
+
+    def respond(method, path, body):
+        request = json.loads(body)
+        items = request if isinstance(request, list) else [request]
+        response = [
+            {"jsonrpc": "2.0", "id": item["id"], "result": results[item["method"]]}
+            for item in items
+        ]
+        if not isinstance(request, list):
+            response = response[0]
+        return 200, {"Content-Type": "application/json"}, json.dumps(response).encode()
+
+    server = http_server(respond)
+    snx = Synthetix(
+        provider_rpc=server.url,
+        address=TEST_ADDRESS,
+        cache_dir=str(tmp_path),
+        modules=["core"],
+        warm_start=True,
+    )
+    assert snx.network_id == 8453
+    assert snx.nonce == 7
+    assert snx.core.account_ids == []
+    assert list(snx._modules) == ["core"]
+
+    # the nonce and the core account balance are fetched in one batch
+    methods = [item["method"] for item in json.loads(server.requests[1][2])]
+    assert methods == ["eth_getTransactionCount", "eth_call"]
+    assert b'"eth_call"' not in b"".join(body for _, _, body in server.requests[2:])
+    num_requests = len(server.requests)
+
+    # the deployment index and the state are saved to the cache directory
+    assert os.path.exists(get_index_path(str(tmp_path), "8453"))
+    assert os.path.exists(get_state_path(snx))
+
+    # a warm start restores the accounts without reading them again
+    warm_snx = Synthetix(
+        provider_rpc=server.url,
+        address=TEST_ADDRESS,
+        cache_dir=str(tmp_path),
+        modules=["core"],
+        warm_start=True,
+    )
+    assert warm_snx._module_state["core"] == {"account_ids": []}
+    assert warm_snx.core.account_ids == []
+    assert len(server.requests) - num_requests == 2